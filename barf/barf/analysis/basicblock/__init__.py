@@ -4,3 +4,13 @@ from basicblock import BARF_DISASM_RECURSIVE
 from basicblock import BasicBlock
 from basicblock import BasicBlockBuilder
 from basicblock import BasicBlockGraph
+from basicblock import CompactBasicBlockGraph
+from dominance import Loop
+from pathenumerator import PATH_ORDER_DFS
+from pathenumerator import PATH_ORDER_RANDOM
+from pathenumerator import PATH_ORDER_SHORTEST
+from pathenumerator import PathEnumerator
+from exporter import DotExporter
+from exporter import GraphExporter
+from exporter import GraphMLExporter
+from exporter import JsonLinesExporter
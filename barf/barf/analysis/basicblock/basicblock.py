@@ -1,13 +1,13 @@
+import array
 import bisect
 import itertools
 import networkx
+import subprocess
 
 from Queue import Queue
 
-from pydot import Dot
-from pydot import Edge
-from pydot import Node
-
+from barf.analysis.basicblock import dominance
+from barf.analysis.basicblock.exporter import DotExporter
 from barf.core.reil import DualInstruction
 from barf.core.reil import ReilMnemonic
 from barf.core.reil import ReilImmediateOperand
@@ -17,6 +17,15 @@ BARF_DISASM_LINEAR = 0       # linear sweep
 BARF_DISASM_RECURSIVE = 1    # recursive descent
 BARF_DISASM_MIXED = 2        # linear sweep + recursive descent
 
+# Branch type codes (compact basic block graph)
+EDGE_TYPES = {
+    'taken' : 0,
+    'not-taken' : 1,
+    'direct' : 2,
+}
+
+EDGE_TYPE_NAMES = ['taken', 'not-taken', 'direct']
+
 verbose = False
 
 class BasicBlock(object):
@@ -185,68 +194,261 @@ class BasicBlockGraph(object):
         # Basic block accessed by address
         self._bb_by_addr = dict([(bb.address, bb) for bb in basic_blocks])
 
+        # Basic block addresses (sorted)
+        self._bb_addrs = sorted(self._bb_by_addr.keys())
+
         # Basic block graph
         self._graph = self._build_graph(basic_blocks)
 
+        # Results of dominance and loop analyses (computed on demand
+        # and discarded when the graph changes.)
+        self._analyses = {}
+
     def all_simple_bb_paths(self, start_address, end_address):
         """Return a list of path between start and end address.
         """
-        bb_start = self._find_basic_block(start_address)
-        bb_end = self._find_basic_block(end_address)
+        bb_start = self.find_basic_block(start_address)
+        bb_end = self.find_basic_block(end_address)
 
         paths = networkx.all_simple_paths(self._graph, \
             source=bb_start.address, target=bb_end.address)
 
         return (map(lambda addr : self._bb_by_addr[addr], path) for path in paths)
 
+    def find_basic_block(self, address):
+        """Return the basic block that contains an address (None if
+        there is no such basic block.)
+
+        """
+        idx = bisect.bisect_right(self._bb_addrs, address)
+
+        if idx > 0 and self._bb_by_addr[self._bb_addrs[idx - 1]].contains(address):
+            return self._bb_by_addr[self._bb_addrs[idx - 1]]
+
+        return None
+
+    def get_basic_block(self, address):
+        """Return the basic block that starts at an address (None if
+        there is no such basic block.)
+
+        """
+        return self._bb_by_addr.get(address, None)
+
+    def get_successors(self, address):
+        """Return the successors of a basic block as a list of
+        (address, branch type) tuples.
+
+        """
+        return [(bb_dst_addr, branch_type) for bb_dst_addr, branch_type in self._bb_by_addr[address].branches
+            if bb_dst_addr in self._bb_by_addr]
+
+    def get_predecessors(self, address):
+        """Return the predecessors of a basic block as a list of
+        (address, branch type) tuples.
+
+        """
+        return [(bb_src_addr, self._graph[bb_src_addr][address]['branch_type'])
+            for bb_src_addr in sorted(self._graph.predecessors(address))]
+
+    def to_networkx(self):
+        """Return the basic block graph as a networkx graph.
+        """
+        return self._graph
+
+    def get_reverse_postorder(self, start_address):
+        """Return the addresses of the basic blocks reachable from a
+        start address, in reverse postorder.
+
+        """
+        key = ('rpo', start_address)
+
+        if key not in self._analyses:
+            self._analyses[key] = dominance.reverse_postorder(start_address, self._get_successor_addrs)
+
+        return self._analyses[key]
+
+    def get_immediate_dominators(self, start_address):
+        """Return the immediate dominator of each basic block reachable
+        from a start address (address -> address; the start address
+        maps to itself.)
+
+        """
+        key = ('idoms', start_address)
+
+        if key not in self._analyses:
+            rpo = self.get_reverse_postorder(start_address)
+
+            self._analyses[key] = dominance.immediate_dominators(rpo, self._get_predecessor_addrs)
+
+        return self._analyses[key]
+
+    def get_immediate_post_dominators(self, start_address):
+        """Return the immediate post-dominator of each basic block
+        reachable from a start address (address -> address). Basic
+        blocks with no successors map to None (a virtual exit that
+        follows all of them). Basic blocks that cannot reach an exit
+        are left out.
+
+        """
+        key = ('ipdoms', start_address)
+
+        if key not in self._analyses:
+            rpo = self.get_reverse_postorder(start_address)
+
+            reachable = set(rpo)
+            exits = [addr for addr in rpo if not self._get_successor_addrs(addr)]
+            exits_set = set(exits)
+
+            def successors(addr):
+                if addr is None:
+                    return exits
+
+                return [pred for pred in self._get_predecessor_addrs(addr) if pred in reachable]
+
+            def predecessors(addr):
+                if addr is None:
+                    return []
+
+                if addr in exits_set:
+                    return [None]
+
+                return self._get_successor_addrs(addr)
+
+            rpo_reversed = dominance.reverse_postorder(None, successors)
+
+            ipdoms = dominance.immediate_dominators(rpo_reversed, predecessors)
+
+            del ipdoms[None]
+
+            self._analyses[key] = ipdoms
+
+        return self._analyses[key]
+
+    def get_loops(self, start_address):
+        """Return the natural loops (see **dominance.Loop**) of the
+        basic blocks reachable from a start address, sorted by header
+        in reverse postorder. Outer loops come before the loops nested
+        in them.
+
+        """
+        key = ('loops', start_address)
+
+        if key not in self._analyses:
+            rpo = self.get_reverse_postorder(start_address)
+            idoms = self.get_immediate_dominators(start_address)
+
+            self._analyses[key] = dominance.natural_loops(rpo, self._get_successor_addrs,
+                self._get_predecessor_addrs, idoms)
+
+        return self._analyses[key]
+
+    def add_entry_point(self, address, bb_builder, end_address):
+        """Add an entry point to the graph. Only the code that becomes
+        reachable from it gets disassembled (using a basic block builder,
+        up to end_address, inclusive). Basic blocks that contain a new
+        basic block start are split in place. Return the list of new
+        basic blocks.
+
+        """
+        self._analyses = {}
+
+        bbs_new = []
+
+        addrs_to_process = [address]
+
+        while addrs_to_process:
+            addr = addrs_to_process.pop()
+
+            if addr in self._bb_by_addr or addr > end_address:
+                continue
+
+            bb = self.find_basic_block(addr)
+
+            if bb and self._split_basic_block(bb, addr):
+                bbs_new += [self._bb_by_addr[addr]]
+                continue
+
+            bb = bb_builder.disassemble_bb(addr, end_address)
+
+            if bb.empty():
+                continue
+
+            self._truncate_basic_block(bb)
+
+            self._add_basic_block(bb)
+
+            bbs_new += [bb]
+
+            addrs_to_process += [branch_addr for branch_addr, _ in bb.branches]
+
+        # Add the edges of the new basic blocks (branches to addresses
+        # where no basic block could be recovered are dropped, as the
+        # builder does.)
+        for bb in bbs_new:
+            if not bb.taken_branch in self._bb_by_addr:
+                bb.taken_branch = None
+            if not bb.not_taken_branch in self._bb_by_addr:
+                bb.not_taken_branch = None
+            if not bb.direct_branch in self._bb_by_addr:
+                bb.direct_branch = None
+
+            for bb_dst_addr, branch_type in bb.branches:
+                self._graph.add_edge(bb.address, bb_dst_addr, branch_type=branch_type)
+
+        return bbs_new
+
+    def add_edge(self, src_address, dst_address, bb_builder, end_address, branch_type='direct'):
+        """Add a branch (e.g., a resolved indirect jump) from the basic
+        block that contains src_address to dst_address, which is added
+        as an entry point (see **add_entry_point**). Return the list of
+        new basic blocks.
+
+        """
+        bbs_new = self.add_entry_point(dst_address, bb_builder, end_address)
+
+        # The entry point may have split the source basic block.
+        bb_src = self.find_basic_block(src_address)
+
+        if not bb_src or not dst_address in self._bb_by_addr:
+            raise Exception("Invalid edge : 0x%08x -> 0x%08x" % (src_address, dst_address))
+
+        if branch_type == 'taken':
+            bb_src.taken_branch = dst_address
+        elif branch_type == 'not-taken':
+            bb_src.not_taken_branch = dst_address
+        elif branch_type == 'direct':
+            bb_src.direct_branch = dst_address
+        else:
+            raise Exception("Invalid branch type : %s" % branch_type)
+
+        self._graph.add_edge(bb_src.address, dst_address, branch_type=branch_type)
+
+        return bbs_new
+
     def save(self, filename, print_ir=False, format='dot'):
-        """Save basic block graph into a file.
-        """
-        node_format = {
-            'shape' : 'Mrecord',
-            'rankdir' : 'LR',
-            'fontname' : 'monospace',
-            'fontsize' : '9.0'
-        }
-
-        edge_format = {
-            'fontname' : 'monospace',
-            'fontsize' : '8.0'
-        }
-
-        edge_colors = {
-            'taken' : 'green',
-            'not-taken' : 'red',
-            'direct' : 'blue'
-        }
+        """Save basic block graph into files, one for each connected
+        component. Formats other than 'dot' are rendered by Graphviz.
+
+        """
+        exporter = DotExporter(print_ir)
 
         try:
             # for each conneted component
-            for idx, gr in enumerate(networkx.connected_component_subgraphs(self._graph.to_undirected())):
-                graph = Dot(graph_type="digraph", rankdir="TB")
+            for idx, bbs in enumerate(self._get_components()):
+                output = "%s_%03d.%s" % (filename, idx, format)
 
-                # add nodes
-                nodes = {}
-                for bb_addr in gr.node.keys():
-                    dump = self._dump_bb(self._bb_by_addr[bb_addr], print_ir)
+                if format == 'dot':
+                    exporter.save(self, output, bbs)
+                    continue
 
-                    label = "{<f0> 0x%08x | %s}" % (bb_addr, dump)
+                dot = subprocess.Popen(["dot", "-T" + format, "-o", output], stdin=subprocess.PIPE)
 
-                    # html-encode colon character
-                    label = label.replace(":", "&#58;")
+                exporter.export(self, dot.stdin, bbs)
 
-                    nodes[bb_addr] = Node(bb_addr, label=label, **node_format)
+                dot.stdin.close()
 
-                    graph.add_node(nodes[bb_addr])
-
-                # add edges
-                for bb_src_addr in gr.node.keys():
-                    for bb_dst_addr, branch_type in self._bb_by_addr[bb_src_addr].branches:
-                        graph.add_edge(Edge(nodes[bb_src_addr],
-                            nodes[bb_dst_addr], label=branch_type, \
-                            color=edge_colors[branch_type], **edge_format))
-
-                graph.write("%s_%03d.%s" % (filename, idx, format), format=format)
+                if dot.wait() != 0:
+                    raise Exception("dot could not render %s" % output)
         except Exception as err:
             import traceback
             import sys
@@ -257,6 +459,113 @@ class BasicBlockGraph(object):
 
     # Auxiliary functions
     # ======================================================================== #
+    def _get_successor_addrs(self, address):
+        return [addr for addr, _ in self.get_successors(address)]
+
+    def _get_components(self):
+        """Return the (weakly) connected components of the graph, as
+        lists of basic blocks sorted by address.
+
+        """
+        parents = {}
+
+        def find(addr):
+            root = addr
+
+            while parents.get(root, root) != root:
+                root = parents[root]
+
+            # path compression
+            while addr != root:
+                parents[addr], addr = root, parents[addr]
+
+            return root
+
+        bbs = sorted(self.basic_blocks, key=lambda bb : bb.address)
+
+        for bb in bbs:
+            for bb_dst_addr in self._get_successor_addrs(bb.address):
+                root_src, root_dst = find(bb.address), find(bb_dst_addr)
+
+                if root_src != root_dst:
+                    parents[max(root_src, root_dst)] = min(root_src, root_dst)
+
+        components = {}
+
+        for bb in bbs:
+            components.setdefault(find(bb.address), []).append(bb)
+
+        return [components[root] for root in sorted(components)]
+
+    def _get_predecessor_addrs(self, address):
+        return [addr for addr, _ in self.get_predecessors(address)]
+
+    def _add_basic_block(self, bb):
+        self._basic_blocks.append(bb)
+        self._bb_by_addr[bb.address] = bb
+
+        bisect.insort(self._bb_addrs, bb.address)
+
+        self._graph.add_node(bb.address, address=bb.address)
+
+    def _split_basic_block(self, bb, address):
+        """Split a basic block in place at an address (the start of one
+        of its instructions). The second half becomes a new basic block.
+        Return whether the basic block was split.
+
+        """
+        addrs = [dinstr.address for dinstr in bb.instrs]
+
+        if address == bb.address or not address in addrs:
+            return False
+
+        idx = addrs.index(address)
+
+        bb_new = BasicBlock()
+
+        bb_new.instrs.extend(bb.instrs[idx:])
+        bb_new.taken_branch = bb.taken_branch
+        bb_new.not_taken_branch = bb.not_taken_branch
+        bb_new.direct_branch = bb.direct_branch
+
+        del bb.instrs[idx:]
+
+        bb.taken_branch = None
+        bb.not_taken_branch = None
+        bb.direct_branch = address
+
+        self._add_basic_block(bb_new)
+
+        # Move the outgoing edges to the second half.
+        for bb_dst_addr, branch_type in bb_new.branches:
+            if self._graph.has_edge(bb.address, bb_dst_addr):
+                self._graph.remove_edge(bb.address, bb_dst_addr)
+                self._graph.add_edge(bb_new.address, bb_dst_addr, branch_type=branch_type)
+
+        self._graph.add_edge(bb.address, address, branch_type='direct')
+
+        return True
+
+    def _truncate_basic_block(self, bb):
+        """Truncate a new basic block where an existing one starts.
+        """
+        idx = bisect.bisect_right(self._bb_addrs, bb.address)
+
+        if idx == len(self._bb_addrs) or not bb.contains(self._bb_addrs[idx]):
+            return
+
+        address = self._bb_addrs[idx]
+
+        for dinstr_idx, dinstr in enumerate(bb.instrs):
+            if dinstr.address == address:
+                del bb.instrs[dinstr_idx:]
+
+                bb.taken_branch = None
+                bb.not_taken_branch = None
+                bb.direct_branch = address
+
+                break
+
     def _build_graph(self, basic_blocks):
         graph = networkx.DiGraph()
 
@@ -271,43 +580,193 @@ class BasicBlockGraph(object):
 
         return graph
 
-    def _find_basic_block(self, address):
-        bb_rv = None
+    @property
+    def basic_blocks(self):
+        return self._basic_blocks
 
-        for bb in self._basic_blocks:
-            if address >= bb.address and address <= bb.end_address:
-                bb_rv = bb
-                break
+class CompactBasicBlockGraph(BasicBlockGraph):
 
-        return bb_rv
+    """Compact basic block graph representation. Basic blocks are
+    numbered densely (by address) and the edges are stored in CSR
+    arrays. The networkx graph (and the address dictionary) are only
+    built when they are needed (e.g., by **all_simple_bb_paths** or
+    **to_networkx**). It does not support incremental
+    updates.
 
-    def _dump_bb(self, basic_block, print_ir=False):
-        lines = []
+    """
+
+    def __init__(self, basic_blocks):
 
-        base_addr = basic_block.instrs[0].address
+        # List of basic blocks (sorted by address). The index of a
+        # basic block in this list is its number.
+        self._basic_blocks = sorted(basic_blocks, key=lambda bb : bb.address)
 
-        for instr in basic_block.instrs:
-            lines += ["0x%08x (%2d) " % (instr.address, instr.asm_instr.size) + str(instr.asm_instr) + "\\l"]
-            # lines += ["+%02x " % (instr.address - base_addr) + str(instr.asm_instr) + "\\l"]
-            # lines += [str(instr.asm_instr) + "\\l"]
+        # Basic block addresses (sorted). It is a plain list, since
+        # addresses may not fit in a C long (e.g., PE64 images on 64-bit
+        # Windows.)
+        self._bb_addrs = [bb.address for bb in self._basic_blocks]
 
-            if print_ir:
-                for ir_instr in instr.ir_instrs:
-                    lines += ["              " + str(ir_instr) + "\\l"]
+        # Successors of basic block i are _succ_targets[j] (with branch
+        # type _succ_types[j]), for _succ_offsets[i] <= j < _succ_offsets[i + 1].
+        self._succ_offsets, self._succ_targets, self._succ_types = self._build_csr()
 
-        return "".join(lines)
+        # Predecessors, in the same format (built on demand)
+        self._preds = None
 
+        # Basic block accessed by address (built on demand)
+        self._bb_by_addr_lazy = None
+
+        # Basic block graph (built on demand)
+        self._graph_lazy = None
+
+        # Results of dominance and loop analyses (computed on demand.)
+        self._analyses = {}
+
+    def find_basic_block(self, address):
+        """Return the basic block that contains an address (None if
+        there is no such basic block.)
+
+        """
+        idx = bisect.bisect_right(self._bb_addrs, address)
+
+        if idx > 0 and self._basic_blocks[idx - 1].contains(address):
+            return self._basic_blocks[idx - 1]
+
+        return None
+
+    def get_basic_block(self, address):
+        """Return the basic block that starts at an address (None if
+        there is no such basic block.)
+
+        """
+        idx = self.get_index(address)
+
+        return self._basic_blocks[idx] if idx is not None else None
+
+    def get_successors(self, address):
+        """Return the successors of a basic block as a list of
+        (address, branch type) tuples.
+
+        """
+        idx = self.get_index(address)
+
+        start, end = self._succ_offsets[idx], self._succ_offsets[idx + 1]
+
+        return [(self._bb_addrs[self._succ_targets[j]], EDGE_TYPE_NAMES[self._succ_types[j]])
+            for j in xrange(start, end)]
+
+    def get_predecessors(self, address):
+        """Return the predecessors of a basic block as a list of
+        (address, branch type) tuples.
+
+        """
+        if self._preds is None:
+            self._preds = self._build_reverse_csr()
+
+        offsets, sources, types = self._preds
+
+        idx = self.get_index(address)
+
+        return [(self._bb_addrs[sources[j]], EDGE_TYPE_NAMES[types[j]])
+            for j in xrange(offsets[idx], offsets[idx + 1])]
+
+    def get_index(self, address):
+        """Return the number of the basic block that starts at an
+        address (None if there is no such basic block.)
+
+        """
+        idx = bisect.bisect_left(self._bb_addrs, address)
+
+        if idx < len(self._bb_addrs) and self._bb_addrs[idx] == address:
+            return idx
+
+        return None
+
+    def get_successor_indexes(self, index):
+        """Return the numbers of the successors of a basic block (given
+        by number.)
+
+        """
+        return self._succ_targets[self._succ_offsets[index]:self._succ_offsets[index + 1]]
+
+    def to_networkx(self):
+        """Return the basic block graph as a networkx graph.
+        """
+        return self._graph
+
+    def add_entry_point(self, address, bb_builder, end_address):
+        raise NotImplementedError("Compact basic block graphs do not support incremental updates.")
+
+    def add_edge(self, src_address, dst_address, bb_builder, end_address, branch_type='direct'):
+        raise NotImplementedError("Compact basic block graphs do not support incremental updates.")
 
     @property
-    def basic_blocks(self):
-        return self._basic_blocks
+    def _bb_by_addr(self):
+        if self._bb_by_addr_lazy is None:
+            self._bb_by_addr_lazy = dict([(bb.address, bb) for bb in self._basic_blocks])
+
+        return self._bb_by_addr_lazy
+
+    @property
+    def _graph(self):
+        if self._graph_lazy is None:
+            self._graph_lazy = self._build_graph(self._basic_blocks)
+
+        return self._graph_lazy
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _build_csr(self):
+        offsets = array.array('L', [0])
+        targets = array.array('L')
+        types = array.array('B')
+
+        for bb in self._basic_blocks:
+            for bb_dst_addr, branch_type in bb.branches:
+                idx = self.get_index(bb_dst_addr)
+
+                if idx is not None:
+                    targets.append(idx)
+                    types.append(EDGE_TYPES[branch_type])
+
+            offsets.append(len(targets))
+
+        return offsets, targets, types
+
+    def _build_reverse_csr(self):
+        counts = [0] * len(self._basic_blocks)
+
+        for idx in self._succ_targets:
+            counts[idx] += 1
+
+        offsets = array.array('L', [0])
+
+        for count in counts:
+            offsets.append(offsets[-1] + count)
+
+        sources = array.array('L', [0] * len(self._succ_targets))
+        types = array.array('B', [0] * len(self._succ_targets))
+
+        position = array.array('L', offsets)
+
+        for src in xrange(len(self._basic_blocks)):
+            for j in xrange(self._succ_offsets[src], self._succ_offsets[src + 1]):
+                dst = self._succ_targets[j]
+
+                sources[position[dst]] = src
+                types[position[dst]] = self._succ_types[j]
+
+                position[dst] += 1
+
+        return offsets, sources, types
+
 
 class BasicBlockBuilder(object):
 
     """Basic block builder.
     """
 
-    def __init__(self, disassembler, memory, translator):
+    def __init__(self, disassembler, memory, translator, lazy=False):
 
         # An instance of a disassembler.
         self._disasm = disassembler
@@ -315,13 +774,30 @@ class BasicBlockBuilder(object):
         # And instance of a REIL translator.
         self._ir_trans = translator
 
+        # Find basic block boundaries and branches from the assembler
+        # instructions alone (as classified by the disassembler) and
+        # translate them to REIL on first access to their 'ir_instrs'.
+        self._lazy = lazy
+
         # Maximun number of bytes that gets from memory to disassemble.
         self._lookahead_max = 16
 
         # Memory of the program being analyze.
         self._mem = memory
 
-    def build(self, start_address, end_address):
+    @property
+    def disassembler(self):
+        """Get disassembler.
+        """
+        return self._disasm
+
+    @property
+    def translator(self):
+        """Get REIL translator.
+        """
+        return self._ir_trans
+
+    def build(self, start_address, end_address, mode=BARF_DISASM_MIXED):
         """Return the list of basic blocks.
 
         Linear Sweep Disassembly.
@@ -330,6 +806,8 @@ class BasicBlockBuilder(object):
         basic blocks.
         @param end_address: Address of the last byte (inclusive) to finish
         disassembling basic blocks.
+        @param mode: CFG recovery mode (BARF_DISASM_LINEAR,
+        BARF_DISASM_RECURSIVE or BARF_DISASM_MIXED).
 
         """
         if verbose:
@@ -337,7 +815,7 @@ class BasicBlockBuilder(object):
 
         if verbose:
             print("      Finding candidate BBs...")
-        bbs = self._find_candidate_bbs(start_address, end_address)
+        bbs = self._find_candidate_bbs(start_address, end_address, mode)
         if verbose:
             print("        %d" % len(bbs))
 
@@ -376,6 +854,18 @@ class BasicBlockBuilder(object):
 
         return bbs
 
+    def disassemble_bb(self, start_address, end_address):
+        """Return the basic block that starts at an address (it is empty
+        if no instruction could be disassembled).
+
+        @param start_address: Address of the first byte of the basic
+        block.
+        @param end_address: Address of the last byte (inclusive) that can
+        be disassembled.
+
+        """
+        return self._disassemble_bb(start_address, end_address + 0x1)
+
     def _find_candidate_bbs(self, start_address, end_address, mode=BARF_DISASM_MIXED):
         bbs = []
 
@@ -430,31 +920,31 @@ class BasicBlockBuilder(object):
 
         bbs_new = []
 
+        # Basic blocks already added, keyed by address range (as
+        # compared by BasicBlock.__eq__.)
+        bbs_new_keys = set()
+
         for idx, bb1 in enumerate(bbs):
             # sys.stdout.write("\r      Processing : %d/%d" % (idx, len(bbs)))
             # sys.stdout.flush()
 
-            bb_divided = False
-
-            lower = bisect.bisect_left(bbs_addrs, bb1.start_address)
-            upper = bisect.bisect_right(bbs_addrs, bb1.end_address)
-
-            for bb2 in bbs[lower:upper]:
-                if bb1.contains(bb2.address) and bb1 != bb2:
-                    # print "split!!", hex(bb2.address)
+            # The first basic block that starts within bb1 (besides
+            # bb1), if any, splits it.
+            split = bisect.bisect_right(bbs_addrs, bb1.start_address)
 
-                    bba = self._divide_bb(bb1, bb2.address)
+            if split < len(bbs) and bb1.contains(bbs_addrs[split]):
+                # print "split!!", hex(bbs_addrs[split])
 
-                    if len(bba.instrs) > 0 and bba not in bbs_new:
-                        bbs_new += [bba]
+                bb_new = self._divide_bb(bb1, bbs_addrs[split])
 
-                    bb_divided = True
-
-                    break
+                if len(bb_new.instrs) == 0:
+                    continue
+            else:
+                bb_new = bb1
 
-            if not bb_divided:
-                if bb1 not in bbs_new:
-                    bbs_new += [bb1]
+            if (bb_new.address, bb_new.end_address) not in bbs_new_keys:
+                bbs_new += [bb_new]
+                bbs_new_keys.add((bb_new.address, bb_new.end_address))
 
         return bbs_new
 
@@ -462,7 +952,7 @@ class BasicBlockBuilder(object):
         return [bb for bb in map(self._strip_bb, bbs) if len(bb.instrs) > 0]
 
     def _update_branches(self, bbs):
-        bb_addrs = [bb.address for bb in bbs]
+        bb_addrs = set([bb.address for bb in bbs])
 
         for bb in bbs:
             if not bb.taken_branch in bb_addrs:
@@ -475,20 +965,26 @@ class BasicBlockBuilder(object):
     def _strip_bb(self, bb):
         # top
         while len(bb.instrs) > 0:
-            if bb.instrs[0].ir_instrs[0].mnemonic == ReilMnemonic.NOP:
+            if self._is_nop(bb.instrs[0]):
                 del bb.instrs[0]
             else:
                 break
 
         # bottom
         while len(bb.instrs) > 0:
-            if bb.instrs[-1].ir_instrs[0].mnemonic == ReilMnemonic.NOP:
+            if self._is_nop(bb.instrs[-1]):
                 del bb.instrs[-1]
             else:
                 break
 
         return bb
 
+    def _is_nop(self, dinstr):
+        if self._lazy:
+            return self._disasm.is_nop(dinstr.asm_instr)
+
+        return dinstr.ir_instrs[0].mnemonic == ReilMnemonic.NOP
+
     def _divide_bb(self, bb, address):
         bb_new = BasicBlock()
 
@@ -522,6 +1018,22 @@ class BasicBlockBuilder(object):
             if not asm:
                 break
 
+            if self._lazy:
+                bb_current.instrs.append(DualInstruction(addr, asm, None, self._ir_trans))
+
+                if self._disasm.is_return(asm):
+                    break
+
+                branches = self._disasm.extract_branches(asm)
+
+                if branches:
+                    taken, not_taken, direct = branches
+                    break
+
+                addr += size
+
+                continue
+
             ir = self._ir_trans.translate(asm)
 
             bb_current.instrs.append(DualInstruction(addr, asm, ir))
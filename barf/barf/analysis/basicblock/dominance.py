@@ -0,0 +1,215 @@
+"""
+This module implements dominance and loop analyses over control flow
+graphs. The graphs are given as an entry node and a function that
+returns the successors (or predecessors) of a node, so they work with
+any basic block graph backend.
+
+* **reverse_postorder**: reverse postorder numbering (iterative DFS).
+* **immediate_dominators**: dominator tree, as a map from each node to
+  its immediate dominator (Cooper, Harvey and Kennedy, "A Simple, Fast
+  Dominance Algorithm"). Post-dominators are the dominators of the
+  reversed graph.
+* **natural_loops**: natural loops (one per header, merging the back
+  edges that target it) and their nesting. Irreducible cycles (whose
+  entry does not dominate the rest of the cycle) are not reported.
+
+"""
+
+class Loop(object):
+
+    """Natural loop representation.
+    """
+
+    def __init__(self, header):
+
+        # Loop header (the target of the back edges.)
+        self.header = header
+
+        # Nodes of the loop (including the header.)
+        self.body = set([header])
+
+        # Sources of the back edges.
+        self.latches = []
+
+        # Innermost loop that contains this one (None for outermost
+        # loops.)
+        self.parent = None
+
+        # Loops immediately nested in this one.
+        self.children = []
+
+    @property
+    def depth(self):
+        """Get nesting depth (1 for outermost loops.)
+        """
+        depth, loop = 1, self.parent
+
+        while loop:
+            depth, loop = depth + 1, loop.parent
+
+        return depth
+
+    def __str__(self):
+        return "Loop @ 0x%08x (%d nodes, depth %d)" % (self.header, len(self.body), self.depth)
+
+
+def reverse_postorder(entry, successors):
+    """Return the nodes reachable from entry in reverse postorder.
+    """
+    postorder = []
+    visited = set([entry])
+
+    stack = [(entry, iter(successors(entry)))]
+
+    while stack:
+        node, succs = stack[-1]
+
+        for succ in succs:
+            if succ not in visited:
+                visited.add(succ)
+
+                stack.append((succ, iter(successors(succ))))
+
+                break
+        else:
+            stack.pop()
+
+            postorder.append(node)
+
+    return postorder[::-1]
+
+def immediate_dominators(rpo, predecessors):
+    """Return the immediate dominator of each node, given the nodes in
+    reverse postorder (the entry maps to itself.)
+
+    """
+    order = dict((node, index) for index, node in enumerate(rpo))
+
+    preds = [[order[pred] for pred in predecessors(node) if pred in order] for node in rpo]
+
+    # Immediate dominators, by reverse postorder number.
+    idoms = [None] * len(rpo)
+    idoms[0] = 0
+
+    changed = True
+
+    while changed:
+        changed = False
+
+        for index in xrange(1, len(rpo)):
+            new_idom = None
+
+            for pred in preds[index]:
+                if idoms[pred] is None:
+                    continue
+
+                if new_idom is None:
+                    new_idom = pred
+                    continue
+
+                # Intersect the dominator chains of both nodes.
+                finger1, finger2 = pred, new_idom
+
+                while finger1 != finger2:
+                    while finger1 > finger2:
+                        finger1 = idoms[finger1]
+                    while finger2 > finger1:
+                        finger2 = idoms[finger2]
+
+                new_idom = finger1
+
+            if idoms[index] != new_idom:
+                idoms[index] = new_idom
+                changed = True
+
+    return dict((rpo[index], rpo[idom]) for index, idom in enumerate(idoms))
+
+def natural_loops(rpo, successors, predecessors, idoms):
+    """Return the natural loops of a graph, given its nodes in reverse
+    postorder and its immediate dominators. Loops are returned sorted
+    by header (in reverse postorder.)
+
+    """
+    dominates = _build_dominance_check(rpo, idoms)
+
+    loops = {}
+
+    for node in rpo:
+        for succ in successors(node):
+            if succ in idoms and dominates(succ, node):
+                if succ not in loops:
+                    loops[succ] = Loop(succ)
+
+                loops[succ].latches.append(node)
+
+    # Collect the body of each loop walking backwards from its
+    # latches up to the header.
+    for header, loop in loops.items():
+        pending = [latch for latch in loop.latches if latch != header]
+
+        loop.body.update(pending)
+
+        while pending:
+            node = pending.pop()
+
+            for pred in predecessors(node):
+                if pred in idoms and pred not in loop.body:
+                    loop.body.add(pred)
+                    pending.append(pred)
+
+    # Natural loops with different headers are either disjoint or
+    # nested. Going from the largest to the smallest, the innermost
+    # loop seen so far that contains a header is its parent.
+    innermost = {}
+
+    for loop in sorted(loops.values(), key=lambda loop : len(loop.body), reverse=True):
+        loop.parent = innermost.get(loop.header, None)
+
+        if loop.parent:
+            loop.parent.children.append(loop)
+
+        for node in loop.body:
+            innermost[node] = loop
+
+    order = dict((node, index) for index, node in enumerate(rpo))
+
+    for loop in loops.values():
+        loop.children.sort(key=lambda child : order[child.header])
+
+    return [loops[node] for node in rpo if node in loops]
+
+# Auxiliary functions
+# ============================================================================ #
+def _build_dominance_check(rpo, idoms):
+    """Return a function that checks whether a node dominates another,
+    using the DFS intervals of the dominator tree.
+
+    """
+    children = dict((node, []) for node in rpo)
+
+    for node in rpo[1:]:
+        children[idoms[node]].append(node)
+
+    enter, leave = {}, {}
+    counter = 0
+
+    stack = [(rpo[0], False)]
+
+    while stack:
+        node, leaving = stack.pop()
+
+        counter += 1
+
+        if leaving:
+            leave[node] = counter
+            continue
+
+        enter[node] = counter
+
+        stack.append((node, True))
+        stack += [(child, False) for child in children[node]]
+
+    def dominates(node1, node2):
+        return enter[node1] <= enter[node2] and leave[node2] <= leave[node1]
+
+    return dominates
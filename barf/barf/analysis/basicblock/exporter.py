@@ -0,0 +1,217 @@
+"""
+This module implements streaming exporters for basic block graphs.
+
+Exporters write basic blocks and edges one at a time to a file object,
+so no graph object model is held in memory. Supported formats:
+
+* **DotExporter**: Graphviz DOT.
+* **JsonLinesExporter**: one JSON object per line, for each basic block
+  ({"type": "node", ...}) and each edge ({"type": "edge", ...}).
+* **GraphMLExporter**: GraphML.
+
+Each exporter can include the REIL translation of the instructions
+(print_ir) and can split a program into one file per function
+(**save_functions**, given a call graph). For example:
+
+    exporter = JsonLinesExporter(print_ir=True)
+
+    exporter.save(bb_graph, "cfg.jsonl")
+    exporter.save_functions(call_graph, "cfg")    # cfg_08048400.jsonl, ...
+
+"""
+import json
+
+from xml.sax.saxutils import escape
+
+class GraphExporter(object):
+
+    """Base class of the basic block graph exporters.
+    """
+
+    # File name extension.
+    extension = None
+
+    def __init__(self, print_ir=False):
+
+        # Include the REIL translation of the instructions.
+        self._print_ir = print_ir
+
+    def export(self, bb_graph, out, basic_blocks=None):
+        """Write a basic block graph to a file object. If a list of
+        basic blocks is given, only those (and the edges among them)
+        are written.
+
+        """
+        if basic_blocks is None:
+            basic_blocks = bb_graph.basic_blocks
+
+        bb_addrs = set(bb.address for bb in basic_blocks)
+
+        self._write_header(out)
+
+        for bb in basic_blocks:
+            self._write_node(out, bb)
+
+        for bb in basic_blocks:
+            for bb_dst_addr, branch_type in bb_graph.get_successors(bb.address):
+                if bb_dst_addr in bb_addrs:
+                    self._write_edge(out, bb.address, bb_dst_addr, branch_type)
+
+        self._write_footer(out)
+
+    def save(self, bb_graph, filename, basic_blocks=None):
+        """Write a basic block graph to a file.
+        """
+        with open(filename, "w") as out:
+            self.export(bb_graph, out, basic_blocks)
+
+    def save_functions(self, call_graph, filename):
+        """Write the basic block graph of each function of a call graph
+        to a separate file (named after the start address of the
+        function.)
+
+        """
+        for function in call_graph.functions:
+            self.save(function.bb_graph, "%s_%08x.%s" % (filename, function.address, self.extension))
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _write_header(self, out):
+        pass
+
+    def _write_node(self, out, bb):
+        raise NotImplementedError()
+
+    def _write_edge(self, out, bb_src_addr, bb_dst_addr, branch_type):
+        raise NotImplementedError()
+
+    def _write_footer(self, out):
+        pass
+
+    def _dump_bb(self, bb):
+        lines = []
+
+        for instr in bb.instrs:
+            lines += ["0x%08x (%2d) " % (instr.address, instr.asm_instr.size) + str(instr.asm_instr)]
+
+            if self._print_ir:
+                for ir_instr in instr.ir_instrs:
+                    lines += ["              " + str(ir_instr)]
+
+        return lines
+
+
+class DotExporter(GraphExporter):
+
+    """Graphviz DOT exporter.
+    """
+
+    extension = "dot"
+
+    node_format = 'shape="Mrecord", rankdir="LR", fontname="monospace", fontsize="9.0"'
+
+    edge_format = 'fontname="monospace", fontsize="8.0"'
+
+    edge_colors = {
+        'taken' : 'green',
+        'not-taken' : 'red',
+        'direct' : 'blue'
+    }
+
+    def _write_header(self, out):
+        out.write("digraph G {\n")
+        out.write("rankdir=TB;\n")
+
+    def _write_node(self, out, bb):
+        dump = "".join(line + "\\l" for line in self._dump_bb(bb))
+
+        label = "{<f0> 0x%08x | %s}" % (bb.address, dump)
+
+        # html-encode colon character
+        label = label.replace(":", "&#58;").replace('"', '\\"')
+
+        out.write('%d [label="%s", %s];\n' % (bb.address, label, self.node_format))
+
+    def _write_edge(self, out, bb_src_addr, bb_dst_addr, branch_type):
+        out.write('%d -> %d [label="%s", color="%s", %s];\n' % (bb_src_addr, bb_dst_addr,
+            branch_type, self.edge_colors[branch_type], self.edge_format))
+
+    def _write_footer(self, out):
+        out.write("}\n")
+
+
+class JsonLinesExporter(GraphExporter):
+
+    """JSON lines exporter.
+    """
+
+    extension = "jsonl"
+
+    def _write_node(self, out, bb):
+        instrs = []
+
+        for instr in bb.instrs:
+            instr_json = {
+                "address" : instr.address,
+                "size" : instr.asm_instr.size,
+                "asm" : str(instr.asm_instr),
+            }
+
+            if self._print_ir:
+                instr_json["ir"] = [str(ir_instr) for ir_instr in instr.ir_instrs]
+
+            instrs.append(instr_json)
+
+        node = {
+            "type" : "node",
+            "address" : bb.address,
+            "end_address" : bb.end_address,
+            "instrs" : instrs,
+        }
+
+        out.write(json.dumps(node, sort_keys=True) + "\n")
+
+    def _write_edge(self, out, bb_src_addr, bb_dst_addr, branch_type):
+        edge = {
+            "type" : "edge",
+            "src" : bb_src_addr,
+            "dst" : bb_dst_addr,
+            "branch_type" : branch_type,
+        }
+
+        out.write(json.dumps(edge, sort_keys=True) + "\n")
+
+
+class GraphMLExporter(GraphExporter):
+
+    """GraphML exporter.
+    """
+
+    extension = "graphml"
+
+    def _write_header(self, out):
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        out.write('<key id="address" for="node" attr.name="address" attr.type="long"/>\n')
+        out.write('<key id="end_address" for="node" attr.name="end_address" attr.type="long"/>\n')
+        out.write('<key id="label" for="node" attr.name="label" attr.type="string"/>\n')
+        out.write('<key id="branch_type" for="edge" attr.name="branch_type" attr.type="string"/>\n')
+        out.write('<graph id="G" edgedefault="directed">\n')
+
+    def _write_node(self, out, bb):
+        label = "\n".join(self._dump_bb(bb))
+
+        out.write('<node id="%d">' % bb.address)
+        out.write('<data key="address">%d</data>' % bb.address)
+        out.write('<data key="end_address">%d</data>' % bb.end_address)
+        out.write('<data key="label">%s</data>' % escape(label))
+        out.write('</node>\n')
+
+    def _write_edge(self, out, bb_src_addr, bb_dst_addr, branch_type):
+        out.write('<edge source="%d" target="%d">' % (bb_src_addr, bb_dst_addr))
+        out.write('<data key="branch_type">%s</data>' % escape(branch_type))
+        out.write('</edge>\n')
+
+    def _write_footer(self, out):
+        out.write('</graph>\n')
+        out.write('</graphml>\n')
@@ -0,0 +1,166 @@
+"""
+This module implements a bounded basic block path enumerator.
+
+PathEnumerator
+--------------
+
+Generates the paths between two basic blocks lazily, within explicit
+bounds: path length, number of paths, loop iterations (how many times a
+basic block can be repeated in a path) and time. Paths are expanded in
+depth-first, shortest-first or random order. A prune callback is called
+on each prefix before expanding it; when it returns True the prefix
+(and every path that extends it) is discarded. For example, to stop
+expanding infeasible prefixes:
+
+    def prune(path):
+        is_sat, _ = code_analyzer.check_path(path, start_address)
+
+        return not is_sat
+
+    enumerator = PathEnumerator(bb_graph, max_paths=100, max_loop_iterations=2,
+        order=PATH_ORDER_SHORTEST, prune=prune)
+
+    for path in enumerator.enumerate(start_address, end_address):
+        ...
+
+    if not enumerator.exhausted:
+        print "some paths were not enumerated"
+
+"""
+import heapq
+import random
+import time
+
+# Path enumeration orders.
+PATH_ORDER_DFS = 0          # depth-first
+PATH_ORDER_SHORTEST = 1     # shortest prefixes first
+PATH_ORDER_RANDOM = 2       # random prefixes first
+
+class PathEnumerator(object):
+
+    """Bounded basic block path enumerator.
+    """
+
+    def __init__(self, bb_graph, max_length=None, max_paths=None, max_loop_iterations=0,
+        time_budget=None, order=PATH_ORDER_DFS, prune=None, seed=None):
+
+        # Basic block graph.
+        self._bb_graph = bb_graph
+
+        # Maximum number of basic blocks in a path (None, unbounded.)
+        self._max_length = max_length
+
+        # Maximum number of paths generated (None, unbounded.)
+        self._max_paths = max_paths
+
+        # Number of times a basic block can be repeated in a path (0,
+        # only simple paths.)
+        self._max_loop_iterations = max_loop_iterations
+
+        # Time budget, in seconds (None, unbounded.)
+        self._time_budget = time_budget
+
+        # Order in which prefixes are expanded.
+        self._order = order
+
+        # A callable that takes a path prefix (list of basic blocks)
+        # and returns True if it should be discarded.
+        self._prune = prune
+
+        # Random number generator (for PATH_ORDER_RANDOM.)
+        self._random = random.Random(seed)
+
+        # Whether the last enumeration generated every path (within the
+        # loop iterations bound) or it was cut short by a bound.
+        self._exhausted = False
+
+    @property
+    def exhausted(self):
+        """Get whether the last enumeration generated all the paths
+        (it was not cut short by the length, paths or time bounds.)
+
+        """
+        return self._exhausted
+
+    def enumerate(self, start_address, end_address):
+        """Return a generator of the paths (lists of basic blocks)
+        between the basic blocks that contain the start and end
+        addresses.
+
+        """
+        self._exhausted = False
+
+        bb_start = self._bb_graph.find_basic_block(start_address)
+        bb_end = self._bb_graph.find_basic_block(end_address)
+
+        if not bb_start or not bb_end:
+            self._exhausted = True
+            return
+
+        deadline = time.time() + self._time_budget if self._time_budget is not None else None
+
+        frontier = []
+        counter = 0
+        truncated = False
+        paths_count = 0
+
+        self._push(frontier, (bb_start.address,), counter)
+
+        while frontier:
+            if deadline is not None and time.time() > deadline:
+                return
+
+            path = self._pop(frontier)
+
+            bbs = [self._bb_graph.get_basic_block(addr) for addr in path]
+
+            if self._prune and self._prune(bbs):
+                continue
+
+            if path[-1] == bb_end.address:
+                yield bbs
+
+                paths_count += 1
+
+                if self._max_paths is not None and paths_count >= self._max_paths:
+                    return
+
+                continue
+
+            succs = [addr for addr, _ in self._bb_graph.get_successors(path[-1])
+                if path.count(addr) <= self._max_loop_iterations]
+
+            if succs and self._max_length is not None and len(path) >= self._max_length:
+                truncated = True
+                continue
+
+            # Depth-first pops the last successor pushed, so they are
+            # pushed in reverse to expand them in branch order.
+            if self._order == PATH_ORDER_DFS:
+                succs.reverse()
+
+            for addr in succs:
+                counter += 1
+
+                self._push(frontier, path + (addr,), counter)
+
+        self._exhausted = not truncated
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _push(self, frontier, path, counter):
+        if self._order == PATH_ORDER_SHORTEST:
+            heapq.heappush(frontier, (len(path), counter, path))
+        else:
+            frontier.append(path)
+
+    def _pop(self, frontier):
+        if self._order == PATH_ORDER_SHORTEST:
+            return heapq.heappop(frontier)[2]
+
+        if self._order == PATH_ORDER_RANDOM:
+            idx = self._random.randrange(len(frontier))
+
+            frontier[idx], frontier[-1] = frontier[-1], frontier[idx]
+
+        return frontier.pop()
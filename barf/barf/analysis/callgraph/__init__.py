@@ -0,0 +1,3 @@
+from callgraph import CallGraph
+from callgraph import CallGraphBuilder
+from callgraph import Function
@@ -0,0 +1,288 @@
+"""
+This module implements function discovery and call graph recovery.
+
+CallGraphBuilder
+----------------
+
+Finds the functions of a range of code and recovers the CFG of each one
+of them independently (recursive descent from its start address.) The
+start addresses of the functions are taken from:
+
+    * entry points and symbol table entries (given by the user),
+    * function prologue patterns (e.g. 'push ebp; mov ebp, esp'),
+    * targets of direct calls (found while recovering the CFGs.)
+
+The recovery is done in rounds, each one shared among a pool of
+processes, until no new call target is found. For example:
+
+    builder = CallGraphBuilder(bb_builder, memory, ARCH_X86_MODE_32)
+
+    call_graph = builder.build(start_address, end_address,
+        entry_points=[entry_point], symbols=symbols)
+
+    for function in call_graph.functions:
+        print function.name, function.bb_graph, function.calls
+
+Worker processes are forked, so the basic block builder is inherited
+(it does not need to be picklable). Only the recovered basic blocks
+travel back to the parent process. Their untranslated instructions (lazy
+basic block builders) are translated by the builder's translator, as
+if they were recovered by the parent process.
+
+CallGraph
+---------
+
+Program-level structure: the functions found and the calls among them.
+
+"""
+import multiprocessing
+import networkx
+
+from barf.analysis.basicblock import BARF_DISASM_RECURSIVE
+from barf.analysis.basicblock import BasicBlockGraph
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch import ARCH_X86_MODE_64
+
+# Function prologues (as raw bytes) by architecture mode.
+FUNCTION_PROLOGUES = {
+    ARCH_X86_MODE_32 : [
+        "\x55\x89\xe5",             # push ebp; mov ebp, esp
+        "\x55\x8b\xec",             # push ebp; mov ebp, esp
+    ],
+    ARCH_X86_MODE_64 : [
+        "\x55\x48\x89\xe5",         # push rbp; mov rbp, rsp
+        "\x55\x48\x8b\xec",         # push rbp; mov rbp, rsp
+    ],
+}
+
+# Number of functions sent to a worker process at once.
+FUNCTION_CHUNK_SIZE = 4
+
+# Per-process state (set by the pool initializer.)
+_worker_bb_builder = None
+_worker_end_address = None
+
+def _init_worker(bb_builder, end_address):
+    global _worker_bb_builder, _worker_end_address
+
+    _worker_bb_builder = bb_builder
+    _worker_end_address = end_address
+
+def _recover_function(address):
+    bbs = _worker_bb_builder.build(address, _worker_end_address, BARF_DISASM_RECURSIVE)
+
+    # Untranslated (lazy) instructions travel back without the
+    # translator; the parent process sets its own.
+    for bb in bbs:
+        for dinstr in bb.instrs:
+            dinstr.translator = None
+
+    return address, bbs
+
+
+class Function(object):
+
+    """Function representation.
+    """
+
+    def __init__(self, address, name, bb_graph, calls):
+
+        # Start address of the function.
+        self.address = address
+
+        # Name of the function (None if it is not known.)
+        self.name = name
+
+        # Basic block graph of the function.
+        self.bb_graph = bb_graph
+
+        # Targets of the direct calls of the function (sorted.)
+        self.calls = calls
+
+    def __str__(self):
+        name = self.name if self.name else "sub_%x" % self.address
+
+        return "%s @ 0x%08x (%d basic blocks)" % (name, self.address, len(self.bb_graph.basic_blocks))
+
+
+class CallGraph(object):
+
+    """Call graph representation.
+    """
+
+    def __init__(self, functions):
+
+        # Functions accessed by address.
+        self._functions = dict((function.address, function) for function in functions)
+
+        # Call graph.
+        self._graph = networkx.DiGraph()
+
+        for function in functions:
+            self._graph.add_node(function.address)
+
+        for function in functions:
+            for target in function.calls:
+                if target in self._functions:
+                    self._graph.add_edge(function.address, target)
+
+    @property
+    def functions(self):
+        """Get functions (sorted by address.)
+        """
+        return [self._functions[addr] for addr in sorted(self._functions)]
+
+    def get_function(self, address):
+        """Return the function that starts at an address (None if there
+        is no such function.)
+
+        """
+        return self._functions.get(address, None)
+
+    def get_callees(self, address):
+        """Return the functions called by a function.
+        """
+        return [self._functions[addr] for addr in sorted(self._graph.successors(address))]
+
+    def get_callers(self, address):
+        """Return the functions that call a function.
+        """
+        return [self._functions[addr] for addr in sorted(self._graph.predecessors(address))]
+
+
+class CallGraphBuilder(object):
+
+    """Call graph builder.
+    """
+
+    def __init__(self, bb_builder, memory, architecture_mode=ARCH_X86_MODE_32, processes=None, chunksize=FUNCTION_CHUNK_SIZE):
+
+        # An instance of a basic block builder.
+        self._bb_builder = bb_builder
+
+        # Memory of the program being analyze.
+        self._mem = memory
+
+        # Architecture mode (selects the function prologues.)
+        self._arch_mode = architecture_mode
+
+        # Number of worker processes (by default, the number of CPUs.
+        # If it is 1, functions are recovered in this process.)
+        self._processes = processes
+
+        # Number of functions sent to a worker process at once.
+        self._chunksize = chunksize
+
+    def build(self, start_address, end_address, entry_points=(), symbols=None, prologues=True):
+        """Return the call graph of the functions within a range of
+        addresses.
+
+        @param start_address: Address of the first byte of the range.
+        @param end_address: Address of the last byte (inclusive) of
+        the range.
+        @param entry_points: Known function start addresses.
+        @param symbols: Known function names (address -> name.)
+        @param prologues: Search for function prologues.
+
+        """
+        symbols = symbols if symbols else {}
+
+        addrs = set(entry_points) | set(symbols.keys())
+
+        if prologues:
+            addrs |= set(self.find_prologues(start_address, end_address))
+
+        addrs = set(addr for addr in addrs if start_address <= addr <= end_address)
+
+        functions = []
+
+        for address, bbs, calls in self._recover_functions(addrs, start_address, end_address):
+            if not bbs:
+                continue
+
+            functions += [Function(address, symbols.get(address, None), BasicBlockGraph(bbs), calls)]
+
+        return CallGraph(functions)
+
+    def find_prologues(self, start_address, end_address):
+        """Return the addresses (sorted) of the function prologues within
+        a range of addresses.
+
+        """
+        data = self._mem[start_address:end_address + 1]
+
+        addrs = set()
+
+        for prologue in FUNCTION_PROLOGUES[self._arch_mode]:
+            index = data.find(prologue)
+
+            while index != -1:
+                addrs.add(start_address + index)
+
+                index = data.find(prologue, index + 1)
+
+        return sorted(addrs)
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _recover_functions(self, addrs, start_address, end_address):
+        """Recover the basic blocks of a set of functions and of the
+        functions they call (directly), in rounds. Return a generator of
+        (address, basic blocks, call targets) tuples.
+
+        """
+        if self._processes == 1:
+            pool = None
+
+            _init_worker(self._bb_builder, end_address)
+        else:
+            pool = multiprocessing.Pool(self._processes, _init_worker,
+                (self._bb_builder, end_address))
+
+        processed = set()
+        pending = sorted(addrs)
+
+        try:
+            while pending:
+                processed.update(pending)
+
+                if pool:
+                    results = pool.imap_unordered(_recover_function, pending, self._chunksize)
+                else:
+                    results = (_recover_function(address) for address in pending)
+
+                targets = set()
+
+                for address, bbs in results:
+                    for bb in bbs:
+                        for dinstr in bb.instrs:
+                            dinstr.translator = self._bb_builder.translator
+
+                    calls = self._get_calls(bbs)
+
+                    yield address, bbs, calls
+
+                    targets.update(calls)
+
+                pending = sorted(addr for addr in targets
+                    if start_address <= addr <= end_address and addr not in processed)
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+    def _get_calls(self, bbs):
+        """Return the targets (sorted) of the direct calls within a list
+        of basic blocks.
+
+        """
+        targets = set()
+
+        for bb in bbs:
+            for dinstr in bb.instrs:
+                target = self._bb_builder.disassembler.get_call_target(dinstr.asm_instr)
+
+                if target is not None:
+                    targets.add(target)
+
+        return sorted(targets)
@@ -2,3 +2,4 @@ from codeanalyzer import CodeAnalyzer
 from codeanalyzer import GenericContext
 from codeanalyzer import GenericFlag
 from codeanalyzer import GenericRegister
+from pathchecker import ParallelPathChecker
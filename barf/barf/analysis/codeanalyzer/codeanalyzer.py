@@ -1,9 +1,15 @@
+import re
+
 import barf.core.smt.smtlibv2 as smtlibv2
 
 from barf.core.reil import ReilMnemonic
 from barf.core.reil import ReilRegisterOperand
 from barf.core.reil import ReilImmediateOperand
 
+# Regular expression that matches a SMTLIB token (used to collect the
+# symbols referenced by an assertion.)
+_token_re = re.compile(r"[^\s()]+")
+
 class GenericRegister(object):
 
     """Generic register representation for code analyzer.
@@ -168,9 +174,21 @@ class GenericContext(object):
 class CodeAnalyzer(object):
 
     """Implements code analyzer using a SMT solver.
+
+    When *slicing* is enabled, assertions are not sent to the SMT solver
+    as they are added. Instead, they are partitioned by the symbols they
+    share (constraint independence) and, in **check_constraints**, only
+    the partitions that reach the query are sent to the solver. The
+    remaining partitions are checked on their own and their result is
+    cached. Besides, partitions are sliced backwards: the translation of
+    an instruction (a definition of a variable) is sent only if the
+    query or the pre/postconditions depend on the variable it defines.
+    Assertions are sent to the solver as soon as they are needed as a
+    whole (for instance, on **check** or **get_context**.)
+
     """
 
-    def __init__(self, solver, translator):
+    def __init__(self, solver, translator, slicing=False):
 
         # A SMT solver instance
         self._solver = solver
@@ -184,6 +202,24 @@ class CodeAnalyzer(object):
         self.read_addrs = []
         self.write_addrs = []
 
+        # Constraint independence slicing.
+        self._slicing = slicing
+
+        # Whether assertions are being buffered (it is disabled, until
+        # the next full reset, once they are sent to the solver.)
+        self._slicing_active = slicing
+
+        # Buffered assertions, as (expr, symbols, defined symbols) tuples
+        # (only the translation of an instruction defines symbols.)
+        self._assertions = []
+
+        # Union-find over symbols (symbol -> parent symbol.)
+        self._partitions = {}
+
+        # Satisfiability of independent partitions (tuple of assertion
+        # indexes -> status.)
+        self._partitions_status = {}
+
     def set_context(self, context):
         """Set context for the SMT solver.
         """
@@ -193,7 +229,7 @@ class CodeAnalyzer(object):
         # solver as an assertion.
         for _, gen_reg in self._context.registers.items():
             smt_reg = self._solver.mkBitVec(gen_reg.size, self._translator.get_init_name(gen_reg.name))
-            self._solver.add(smt_reg == gen_reg.value)
+            self._add_assertion(smt_reg == gen_reg.value)
 
         # Add each flag and its value to the context of the SMT solver
         # as an assertion.
@@ -201,50 +237,72 @@ class CodeAnalyzer(object):
         for _, gen_flag in self._context.flags.items():
             smt_flag = self._solver.mkBitVec(32, self._translator.get_init_name(gen_flag.name))
 
-            self._solver.add(smt_flag == gen_flag.value)
+            self._add_assertion(smt_flag == gen_flag.value)
 
         # Add each memory location and its content to the SMT solver
         # as an assetion.
+        if not self._context.memory:
+            return
+
+        self._flush_memory()
+
         mem = self._translator.get_memory()
 
         for addr, value in self._context.memory.items():
-            self._solver.add(mem[addr] == value)
+            self._add_assertion(mem[addr] == value)
 
     def get_context(self):
         """Get context from the SMT solver.
         """
-        # Get final values from the SMT solver for the registers set in
-        # the initial context.
+        # Collect the names of the registers and flags, and the memory
+        # locations, set in the initial context so their final values
+        # can be retrieved from the SMT solver in a single query.
+        reg_names = self._context.registers.keys()
+        flag_names = self._context.flags.keys()
+        mem_addrs = self._context.memory.keys()
+
+        exprs = [self._translator.get_curr_name(name) for name in reg_names + flag_names]
+
+        if mem_addrs:
+            self._flush_memory()
+
+            mem = self._translator.get_memory()
+
+            exprs += [mem[addr] for addr in mem_addrs]
+
+        self._flush_assertions()
+
+        values = self._solver.getvalues(exprs)
+
+        reg_values = values[:len(reg_names)]
+        flag_values = values[len(reg_names):len(reg_names) + len(flag_names)]
+        mem_values = values[len(reg_names) + len(flag_names):]
+
+        # Get final values for the registers set in the initial context.
         registers = {}
 
-        for reg_name, gen_reg in self._context.registers.items():
-            value = self._solver.getvaluebyname(self._translator.get_curr_name(reg_name))
+        for reg_name, value in zip(reg_names, reg_values):
+            gen_reg = self._context.registers[reg_name]
             registers[reg_name] = GenericRegister(reg_name, gen_reg.size, value)
 
-        # Get final values from the SMT solver for the flags set in the
-        # initial context.
+        # Get final values for the flags set in the initial context.
         # TODO: Flag size should be 1 bit.
         flags = {}
 
-        for flag_name, _ in self._context.flags.items():
-            value = self._solver.getvaluebyname(self._translator.get_curr_name(flag_name))
+        for flag_name, value in zip(flag_names, flag_values):
             flags[flag_name] = GenericFlag(flag_name, value)
 
-        # Get final values from the SMT solver for the memory locations
-        # set in the initial context.
-        memory = {}
-
-        mem = self._translator.get_memory()
-
-        for addr, _ in self._context.memory.items():
-            value = self._solver.getvalue(mem[addr])
-            memory[addr] = value
+        # Get final values for the memory locations set in the initial
+        # context.
+        memory = dict(zip(mem_addrs, mem_values))
 
         return GenericContext(registers, flags, memory)
 
     def check_path_satisfiability(self, path, start_address, verbose=False):
         """Check satisfiability of a basic block path.
         """
+        self._flush_assertions()
+
         self._solver.reset()
 
         _memory_access = []
@@ -270,6 +328,18 @@ class CodeAnalyzer(object):
                 if verbose:
                     print("    0x%08x : %-30s" % (dinstr.address, dinstr.asm_instr))
 
+                # Instructions without branches are translated as a
+                # whole (the translation is cached.)
+                if not verbose and not any(instr.mnemonic == ReilMnemonic.JCC for instr in dinstr.ir_instrs):
+                    smt_exprs, mem_accesses = self._translator.translate_sequence(dinstr.ir_instrs)
+
+                    _memory_access += [addr for _, addr in mem_accesses]
+
+                    for smt_expr in smt_exprs:
+                        self._solver.add(smt_expr)
+
+                    continue
+
                 # For each REIL instruction...
                 for instr in dinstr.ir_instrs:
                     # Keep track of memory addresses access for STORE.
@@ -354,6 +424,139 @@ class CodeAnalyzer(object):
 
         return is_sat
 
+    def check_path(self, path, start_address):
+        """Check satisfiability of a basic block path. Return a tuple of
+        the form (is_sat, model), where model is a dictionary with the
+        initial values of the registers referenced along the path (None
+        if the path is not satisfiable.)
+
+        Unlike **check_path_satisfiability**, the state of the analyzer
+        is restored afterwards, so every path is checked against the
+        same context.
+
+        """
+        self._flush_assertions()
+
+        state = self._translator.save_state()
+
+        self._solver.push()
+
+        try:
+            for index, (bb_curr, bb_next) in enumerate(zip(path[:-1], path[1:])):
+                _, branch_cond = self._encode_basic_block(bb_curr, start_address if index == 0 else None)
+
+                self._add_branch_goal(bb_curr, bb_next, branch_cond)
+
+            is_sat = self._solver.check() == 'sat'
+
+            model = self.get_input_model() if is_sat else None
+        finally:
+            self._solver.pop()
+            self._translator.restore_state(state)
+
+        return is_sat, model
+
+    def get_input_model(self):
+        """Get the initial values of the registers referenced so far
+        from the SMT solver (register name -> value.)
+
+        """
+        self._flush_assertions()
+
+        names = [(name, init_name) for name, init_name in sorted(self._translator.get_init_names().items())
+            if init_name in self._solver._declarations]
+
+        if not names:
+            return {}
+
+        values = self._solver.getvalues([init_name for _, init_name in names])
+
+        return dict((name, value) for (name, _), value in zip(names, values))
+
+    def explore_paths(self, bb_graph, start_address, end_address):
+        """Return a generator of the satisfiable basic block paths
+        between start and end address.
+
+        The path tree is walked depth-first and the solver state is
+        saved (push) at each basic block boundary and restored (pop) on
+        backtrack, so the constraints of a common prefix are translated
+        and checked once. Paths whose prefix is unsatisfiable are pruned
+        without being enumerated. While a path is being processed by
+        the caller, the solver (and the translator) hold its state, so
+        registers and memory can be queried (e.g. **get_expr_value**.)
+
+        """
+        self._flush_assertions()
+
+        bb_start = bb_graph.find_basic_block(start_address)
+        bb_end = bb_graph.find_basic_block(end_address)
+
+        if bb_start is None or bb_end is None or bb_start == bb_end:
+            return
+
+        # Translator state for each level of the solver stack.
+        states = [self._translator.save_state()]
+
+        self._solver.push()
+
+        try:
+            _, branch_cond = self._encode_basic_block(bb_start, start_address)
+
+            path = [bb_start]
+            stack = [(branch_cond, iter(bb_start.branches))]
+
+            while stack:
+                branch_cond, branches = stack[-1]
+
+                branch = next(branches, None)
+
+                # All successors were explored, backtrack.
+                if branch is None:
+                    stack.pop()
+                    path.pop()
+
+                    if stack:
+                        self._solver.pop()
+                        self._translator.restore_state(states.pop())
+
+                    continue
+
+                bb_next = bb_graph.get_basic_block(branch[0])
+
+                if bb_next is None or bb_next in path:
+                    continue
+
+                states.append(self._translator.save_state())
+
+                self._solver.push()
+
+                self._add_branch_goal(path[-1], bb_next, branch_cond)
+
+                is_sat = self._solver.check() == 'sat'
+
+                if is_sat and bb_next == bb_end:
+                    yield path + [bb_next]
+
+                if not is_sat or bb_next == bb_end:
+                    self._solver.pop()
+                    self._translator.restore_state(states.pop())
+
+                    continue
+
+                _, branch_cond = self._encode_basic_block(bb_next)
+
+                path.append(bb_next)
+                stack.append((branch_cond, iter(bb_next.branches)))
+        finally:
+            # Restore the state previous to the exploration (also when
+            # the generator is not exhausted.)
+            while len(states) > 1:
+                self._solver.pop()
+                states.pop()
+
+            self._solver.pop()
+            self._translator.restore_state(states.pop())
+
     def reset(self, full=False):
         """Reset current state of the analyzer.
         """
@@ -365,6 +568,11 @@ class CodeAnalyzer(object):
             self.read_addrs = []
             self.write_addrs = []
 
+            self._slicing_active = self._slicing
+            self._assertions = []
+            self._partitions = {}
+            self._partitions_status = {}
+
     # ======================================================================== #
     def get_register_expr(self, register_name, mode="post"):
         """Return a smt bit vector that represents a register.
@@ -406,6 +614,8 @@ class CodeAnalyzer(object):
     def get_memory_expr(self, address, size, mode="post"):
         """Return a smt bit vector that represents a memory location.
         """
+        self._flush_memory()
+
         if mode == "pre":
             mem = self._translator.get_memory_init()
         elif mode == "post":
@@ -430,6 +640,8 @@ class CodeAnalyzer(object):
     def get_memory(self, mode):
         """Return a smt bit vector that represents a memory location.
         """
+        self._flush_memory()
+
         if mode == "pre":
             mem = self._translator.get_memory_init()
         elif mode == "post":
@@ -454,13 +666,32 @@ class CodeAnalyzer(object):
 
         #if not smt_form is None:
         for smt_expr in smt_exprs:
-            self._solver.add(smt_expr)
+            self._add_assertion(smt_expr, definition=True)
+
+    def add_instructions(self, reil_instructions):
+        """Add a sequence of instructions for analysis. The translation
+        of the sequence is cached (see SmtTranslator.translate_sequence.)
+
+        """
+        smt_exprs, mem_accesses = self._translator.translate_sequence(reil_instructions)
+
+        for mnemonic, addr in mem_accesses:
+            if mnemonic == ReilMnemonic.LDM:
+                self.read_addrs.append(addr)
+
+            if mnemonic == ReilMnemonic.STM:
+                self.write_addrs.append(addr)
+
+        for smt_expr in smt_exprs:
+            self._add_assertion(smt_expr, definition=True)
 
     def check(self):
         """Check if the instruction and restrictions added so far are
         satisfiable.
 
         """
+        self._flush_assertions()
+
         return self._solver.check()
 
     def check_constraint(self, constraint):
@@ -468,55 +699,294 @@ class CodeAnalyzer(object):
         satisfiable.
 
         """
-        self._solver.push()
-
-        self._solver.add(constraint)
-
-        is_sat = self._solver.check()
-
-        self._solver.pop()
-
-        return is_sat
+        return self.check_constraints([constraint])
 
     def check_constraints(self, constraints):
         """Check if the instruction and restrictions added so far are
         satisfiable.
 
         """
-        self._solver.push()
+        if not self._slicing_active:
+            return self._check_assertions(constraints)
+
+        # Collect the partitions reached by the constraints.
+        roots = set()
 
         for constraint in constraints:
-            self._solver.add(constraint)
+            roots.update(self._find(symbol) for symbol in self._get_symbols(constraint))
 
-        is_sat = self._solver.check()
+        slice_indexes = []
+        independent = {}
 
-        self._solver.pop()
+        for index, (_, symbols, _) in enumerate(self._assertions):
+            root = self._find(symbols[0]) if symbols else None
 
-        return is_sat
+            if root in roots:
+                slice_indexes.append(index)
+            else:
+                independent.setdefault(root, []).append(index)
+
+        # Check the relevant slice.
+        slice_exprs = self._slice_assertions(slice_indexes, constraints)
+
+        is_sat = self._check_assertions(slice_exprs + list(constraints))
+
+        if is_sat != 'sat':
+            return is_sat
+
+        # The whole formula is satisfiable only if every independent
+        # partition is satisfiable as well.
+        for indexes in independent.values():
+            is_sat = self._check_partition(tuple(indexes))
+
+            if is_sat != 'sat':
+                return is_sat
+
+        return 'sat'
 
     def set_precondition(self, condition):
         """Add a precondition to the analyzer.
         """
-        self._solver.add(condition)
+        self._add_assertion(condition)
 
     def set_preconditions(self, conditions):
         """Add preconditions to the analyzer.
         """
         for cond in conditions:
-            self._solver.add(cond)
+            self._add_assertion(cond)
 
     def set_postcondition(self, condition):
         """Add a postcondition to the analyzer.
         """
-        self._solver.add(condition)
+        self._add_assertion(condition)
 
     def set_postconditions(self, conditions):
         """Add a postcondition to the analyzer.
         """
         for cond in conditions:
-            self._solver.add(cond)
+            self._add_assertion(cond)
 
     def get_expr_value(self, expr):
         """Get a value for an expression.
         """
+        self._flush_assertions()
+
         return self._solver.getvalue(expr)
+
+    def get_expr_values(self, exprs):
+        """Get values for a list of expressions (using a single query to
+        the SMT solver).
+
+        """
+        self._flush_assertions()
+
+        return self._solver.getvalues(exprs)
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _add_assertion(self, expr, definition=False):
+        """Add an assertion, either to the solver or to the slicing
+        buffer. If definition is set, the assertion is the translation
+        of an instruction.
+
+        """
+        if not self._slicing_active or isinstance(expr, bool):
+            self._solver.add(expr)
+
+            return
+
+        symbols = self._get_symbols(expr)
+
+        # The translation of an instruction defines the symbols that
+        # were not referenced before (the new versions of the
+        # variables it writes.)
+        defined = []
+
+        if definition:
+            defined = [symbol for symbol in symbols if symbol not in self._partitions]
+
+        for symbol in symbols:
+            self._union(symbols[0], symbol)
+
+        self._assertions.append((expr, symbols, defined))
+
+    def _encode_basic_block(self, bb, start_address=None):
+        """Add the translation of a basic block (starting at
+        start_address, if given) to the solver. Return the SMT
+        expressions added and the branch condition of its final JCC
+        instruction (None if the basic block does not end in a
+        conditional branch.)
+
+        """
+        instrs = []
+        branch_cond = None
+
+        for dinstr in bb.instrs:
+            if start_address is not None and dinstr.address < start_address:
+                continue
+
+            for instr in dinstr.ir_instrs:
+                if instr.mnemonic != ReilMnemonic.JCC:
+                    instrs.append(instr)
+
+                    continue
+
+                # Check that the JCC is the last instruction of the
+                # basic block (skip CALL instructions.)
+                if dinstr.address + dinstr.asm_instr.size - 1 == bb.end_address:
+                    smt_exprs, _ = self._translator.translate_sequence(instrs)
+
+                    for smt_expr in smt_exprs:
+                        self._solver.add(smt_expr)
+
+                    branch_cond = self._translator.convert_to_bitvec(instr.operands[0])
+
+                    return smt_exprs, branch_cond
+
+        smt_exprs, _ = self._translator.translate_sequence(instrs)
+
+        for smt_expr in smt_exprs:
+            self._solver.add(smt_expr)
+
+        return smt_exprs, branch_cond
+
+    def _add_branch_goal(self, bb_curr, bb_next, branch_cond):
+        """Add the constraint on the branch condition of a basic block
+        that makes execution continue at the next one.
+
+        """
+        if branch_cond is None:
+            return
+
+        # Set jump condition accordingly.
+        if bb_curr.taken_branch == bb_next.address:
+            self._solver.add(branch_cond == 0x1)
+        elif bb_curr.not_taken_branch == bb_next.address:
+            self._solver.add(branch_cond == 0x0)
+
+    def _flush_memory(self):
+        """Add the pending memory constraints of the translator (hybrid
+        memory mode.)
+
+        """
+        for constr in self._translator.flush_memory():
+            self._add_assertion(constr)
+
+    def _flush_assertions(self):
+        """Send buffered assertions to the solver and stop slicing
+        (until the next full reset.)
+
+        """
+        if not self._slicing_active:
+            return
+
+        for expr, _, _ in self._assertions:
+            self._solver.add(expr)
+
+        self._slicing_active = False
+        self._assertions = []
+        self._partitions = {}
+        self._partitions_status = {}
+
+    def _check_assertions(self, exprs):
+        """Check satisfiability of the assertions sent to the solver so
+        far plus exprs.
+
+        """
+        self._solver.push()
+
+        for expr in exprs:
+            self._solver.add(expr)
+
+        is_sat = self._solver.check()
+
+        self._solver.pop()
+
+        return is_sat
+
+    def _check_partition(self, indexes):
+        """Check satisfiability of an independent partition of buffered
+        assertions (results are cached.)
+
+        """
+        if indexes not in self._partitions_status:
+            exprs = self._slice_assertions(indexes)
+
+            self._partitions_status[indexes] = self._check_assertions(exprs)
+
+        return self._partitions_status[indexes]
+
+    def _slice_assertions(self, indexes, constraints=()):
+        """Slice a set of buffered assertions (by index) backwards.
+        Return the assertions that are not definitions along with the
+        definitions that they, or the constraints, depend on.
+
+        """
+        definitions = {}
+        slice_indexes = set()
+        live = set()
+
+        for index in indexes:
+            _, symbols, defined = self._assertions[index]
+
+            if not defined:
+                slice_indexes.add(index)
+                live.update(symbols)
+
+            for symbol in defined:
+                definitions[symbol] = index
+
+        for constraint in constraints:
+            live.update(self._get_symbols(constraint))
+
+        pending = list(live)
+
+        while pending:
+            index = definitions.get(pending.pop(), None)
+
+            if index is None or index in slice_indexes:
+                continue
+
+            slice_indexes.add(index)
+
+            for symbol in self._assertions[index][1]:
+                if symbol not in live:
+                    live.add(symbol)
+                    pending.append(symbol)
+
+        return [self._assertions[index][0] for index in sorted(slice_indexes)]
+
+    def _get_symbols(self, expr):
+        """Return the (declared) symbols referenced by an expression.
+        """
+        declarations = self._solver._declarations
+
+        symbols = []
+
+        for token in set(_token_re.findall(str(expr))):
+            if token in declarations:
+                symbols.append(token)
+
+        return symbols
+
+    def _find(self, symbol):
+        root = self._partitions.setdefault(symbol, symbol)
+
+        while self._partitions[root] != root:
+            root = self._partitions[root]
+
+        # Path compression.
+        while symbol != root:
+            parent = self._partitions[symbol]
+
+            self._partitions[symbol] = root
+
+            symbol = parent
+
+        return root
+
+    def _union(self, symbol1, symbol2):
+        root1, root2 = self._find(symbol1), self._find(symbol2)
+
+        if root1 != root2:
+            self._partitions[root2] = root1
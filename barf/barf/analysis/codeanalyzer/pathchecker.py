@@ -0,0 +1,104 @@
+"""
+This module implements a parallel driver for path satisfiability checks.
+
+ParallelPathChecker
+-------------------
+
+Checking the satisfiability of each path of a basic block graph is
+embarrassingly parallel. This class shards the paths (as produced by
+**all_simple_bb_paths**) across a pool of processes, each one with its
+own code analyzer (and SMT solver), and streams back the results as
+they complete. For example:
+
+    def build_analyzer():
+        solver = Z3Solver()
+        translator = SmtTranslator(solver, 32)
+        ...
+        return CodeAnalyzer(solver, translator)
+
+    checker = ParallelPathChecker(build_analyzer)
+
+    paths = bb_graph.all_simple_bb_paths(start, end)
+
+    for path, is_sat, model in checker.check_paths(bb_graph, paths, start):
+        ...
+
+Worker processes are forked, so the analyzer factory and the basic
+block graph are inherited (they do not need to be picklable). Only the
+addresses of the basic blocks of each path travel between processes.
+
+"""
+import multiprocessing
+
+# Number of paths sent to a worker process at once.
+PATH_CHUNK_SIZE = 1
+
+# Per-process state (set by the pool initializer.)
+_worker_analyzer = None
+_worker_bb_graph = None
+_worker_start_address = None
+
+def _init_worker(analyzer_factory, bb_graph, start_address):
+    global _worker_analyzer, _worker_bb_graph, _worker_start_address
+
+    _worker_analyzer = analyzer_factory()
+    _worker_bb_graph = bb_graph
+    _worker_start_address = start_address
+
+def _check_path(path_addrs):
+    path = [_worker_bb_graph.get_basic_block(addr) for addr in path_addrs]
+
+    is_sat, model = _worker_analyzer.check_path(path, _worker_start_address)
+
+    return path_addrs, is_sat, model
+
+
+class ParallelPathChecker(object):
+
+    """Check satisfiability of basic block paths using a pool of
+    processes.
+
+    """
+
+    def __init__(self, analyzer_factory, processes=None, chunksize=PATH_CHUNK_SIZE):
+
+        # A callable that returns a new code analyzer (called once in
+        # each worker process.)
+        self._analyzer_factory = analyzer_factory
+
+        # Number of worker processes (by default, the number of CPUs.)
+        self._processes = processes
+
+        # Number of paths sent to a worker process at once.
+        self._chunksize = chunksize
+
+    def check_paths(self, bb_graph, paths, start_address, stop_on_sat=False):
+        """Return a generator of (path, is_sat, model) tuples, in order
+        of completion (see **CodeAnalyzer.check_path**.) If stop_on_sat
+        is set, the check ends after the first satisfiable path.
+
+        """
+        pool = multiprocessing.Pool(self._processes, _init_worker,
+            (self._analyzer_factory, bb_graph, start_address))
+
+        path_addrs = ([bb.address for bb in path] for path in paths)
+
+        finished = False
+
+        try:
+            for addrs, is_sat, model in pool.imap_unordered(_check_path, path_addrs, self._chunksize):
+                yield [bb_graph.get_basic_block(addr) for addr in addrs], is_sat, model
+
+                if is_sat and stop_on_sat:
+                    break
+            else:
+                finished = True
+        finally:
+            # Pending checks are discarded when the check ends early
+            # (or the generator is not exhausted.)
+            if finished:
+                pool.close()
+            else:
+                pool.terminate()
+
+            pool.join()
@@ -0,0 +1,6 @@
+from dataflow import DATAFLOW_BACKWARD
+from dataflow import DATAFLOW_FORWARD
+from dataflow import DataflowProblem
+from dataflow import DataflowSolver
+from dataflow import LiveVariables
+from dataflow import ReachingDefinitions
@@ -0,0 +1,382 @@
+"""
+This module implements a dataflow analysis framework over basic block
+graphs.
+
+DataflowSolver
+--------------
+
+A worklist solver for gen/kill dataflow problems. Facts are integer
+bitsets (for instance, bit i set means variable i is live). Each
+problem (a **DataflowProblem** subclass) gives the gen and kill sets of
+each REIL instruction. The solver summarizes them once per basic block
+and iterates the blocks in reverse postorder (postorder, for backward
+problems) until a fixpoint is reached. For example:
+
+    liveness = LiveVariables()
+    liveness.set_reg_access_mapper(arch_info.register_access_mapper())
+
+    solver = DataflowSolver(bb_graph)
+
+    live_in, live_out = solver.solve(liveness, start_address)
+
+    print liveness.get_variables(live_in[start_address])
+
+Built-in problems: **LiveVariables** and **ReachingDefinitions**.
+
+"""
+import heapq
+
+from barf.core.reil import ReilEmptyOperand
+from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+
+# Dataflow problems directions.
+DATAFLOW_FORWARD  = 0
+DATAFLOW_BACKWARD = 1
+
+class DataflowProblem(object):
+
+    """Base class of dataflow problems.
+    """
+
+    # Direction of the problem.
+    direction = DATAFLOW_FORWARD
+
+    def initialize(self, basic_blocks):
+        """Prepare the problem for a set of basic blocks (called by the
+        solver before iterating.)
+
+        """
+        pass
+
+    def get_boundary(self):
+        """Get the fact at the entry (or exits, for backward problems)
+        of the graph.
+
+        """
+        return 0
+
+    def get_initial(self):
+        """Get the initial fact of each basic block.
+        """
+        return 0
+
+    def meet(self, fact1, fact2):
+        """Combine the facts of two paths.
+        """
+        return fact1 | fact2
+
+    def get_gen_kill(self, bb, index, instr):
+        """Get the gen and kill sets (as bitsets) of the index-th REIL
+        instruction of a basic block.
+
+        """
+        raise NotImplementedError()
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _get_operands(self, instr):
+        """Return the register operands an instruction reads and
+        writes.
+
+        """
+        oprnd1, oprnd2, oprnd3 = instr.operands
+
+        if instr.mnemonic in [ReilMnemonic.STM, ReilMnemonic.JCC]:
+            uses, defs = [oprnd1, oprnd3], []
+        elif instr.mnemonic in [ReilMnemonic.NOP, ReilMnemonic.UNKN, ReilMnemonic.RET]:
+            uses, defs = [], []
+        else:
+            uses, defs = [oprnd1, oprnd2], [oprnd3]
+
+        uses = [oprnd for oprnd in uses if self._is_variable(oprnd)]
+        defs = [oprnd for oprnd in defs if self._is_variable(oprnd)]
+
+        return uses, defs
+
+    def _is_variable(self, oprnd):
+        return isinstance(oprnd, ReilRegisterOperand) and \
+            not isinstance(oprnd, ReilEmptyOperand)
+
+
+class LiveVariables(DataflowProblem):
+
+    """Live variables (registers and temporaries) analysis.
+    """
+
+    direction = DATAFLOW_BACKWARD
+
+    def __init__(self):
+
+        # Maps sub-registers to the registers that contain them, e.i.,
+        # 'al' -> ('eax', mask, shift)
+        self._reg_access_mapper = {}
+
+        # Dense numbering of the variables (name -> bit index.)
+        self._index = {}
+        self._names = []
+
+    def get_gen_kill(self, bb, index, instr):
+        uses, defs = self._get_operands(instr)
+
+        gen, kill = 0, 0
+
+        for oprnd in uses:
+            gen |= self._get_bit(oprnd.name)
+
+        for oprnd in defs:
+            # Writing a sub-register keeps the rest of the register.
+            if oprnd.name in self._reg_access_mapper:
+                gen |= self._get_bit(oprnd.name)
+            else:
+                kill |= self._get_bit(oprnd.name)
+
+        return gen, kill
+
+    def get_variables(self, fact):
+        """Get the names of the variables in a fact.
+        """
+        return set(name for index, name in enumerate(self._names) if fact >> index & 0x1)
+
+    def set_reg_access_mapper(self, reg_access_mapper):
+        """Set register access mapper.
+        """
+        self._reg_access_mapper = reg_access_mapper
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _get_bit(self, name):
+        if name in self._reg_access_mapper:
+            name = self._reg_access_mapper[name][0]
+
+        if name not in self._index:
+            self._index[name] = len(self._names)
+            self._names.append(name)
+
+        return 1 << self._index[name]
+
+
+class ReachingDefinitions(DataflowProblem):
+
+    """Reaching definitions analysis. A definition is a REIL instruction
+    that writes a register (or temporary.)
+
+    """
+
+    direction = DATAFLOW_FORWARD
+
+    def __init__(self):
+
+        # Maps sub-registers to the registers that contain them.
+        self._reg_access_mapper = {}
+
+        # Dense numbering of the definitions ((address, index) -> bit
+        # index.)
+        self._index = {}
+        self._definitions = []
+
+        # Definitions of each variable (name -> bitset.)
+        self._variable_defs = {}
+
+    def initialize(self, basic_blocks):
+        self._index = {}
+        self._definitions = []
+        self._variable_defs = {}
+
+        for bb in basic_blocks:
+            instrs = [instr for dinstr in bb.instrs for instr in dinstr.ir_instrs]
+
+            for index, instr in enumerate(instrs):
+                _, defs = self._get_operands(instr)
+
+                for oprnd in defs:
+                    bit = 1 << len(self._definitions)
+
+                    self._index[(bb.address, index)] = bit
+                    self._definitions.append((bb.address, index, instr))
+
+                    name = self._get_base_name(oprnd.name)
+
+                    self._variable_defs[name] = self._variable_defs.get(name, 0) | bit
+
+    def get_gen_kill(self, bb, index, instr):
+        gen = self._index.get((bb.address, index), 0)
+
+        if not gen:
+            return 0, 0
+
+        _, defs = self._get_operands(instr)
+
+        # Writing a sub-register does not kill previous definitions of
+        # the register.
+        if defs[0].name in self._reg_access_mapper:
+            return gen, 0
+
+        return gen, self._variable_defs[defs[0].name] & ~gen
+
+    def get_definitions(self, fact):
+        """Get the definitions in a fact, as (basic block address, REIL
+        instruction index, REIL instruction) tuples.
+
+        """
+        return [definition for index, definition in enumerate(self._definitions) if fact >> index & 0x1]
+
+    def set_reg_access_mapper(self, reg_access_mapper):
+        """Set register access mapper.
+        """
+        self._reg_access_mapper = reg_access_mapper
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _get_base_name(self, name):
+        if name in self._reg_access_mapper:
+            return self._reg_access_mapper[name][0]
+
+        return name
+
+
+class DataflowSolver(object):
+
+    """Worklist dataflow solver over a basic block graph.
+    """
+
+    def __init__(self, bb_graph):
+
+        # Basic block graph.
+        self._bb_graph = bb_graph
+
+        # Basic block accessed by address.
+        self._bb_by_addr = dict((bb.address, bb) for bb in bb_graph.basic_blocks)
+
+    def solve(self, problem, start_address):
+        """Solve a dataflow problem over the basic blocks reachable from
+        a start address. Return a tuple of the form (facts_in,
+        facts_out), which map the address of each basic block to the
+        fact at its start and at its end.
+
+        """
+        blocks, succs, preds = self._get_structure(start_address)
+
+        problem.initialize(blocks)
+
+        forward = problem.direction == DATAFLOW_FORWARD
+
+        summaries = [self._summarize(problem, bb, forward) for bb in blocks]
+
+        # Blocks are indexed in reverse postorder. Backward problems
+        # iterate them in postorder, along reversed edges.
+        if forward:
+            sources, targets = preds, succs
+            priority = range(len(blocks))
+            boundary = set([0])
+        else:
+            sources, targets = succs, preds
+            priority = range(len(blocks) - 1, -1, -1)
+            boundary = set(index for index in xrange(len(blocks)) if not succs[index])
+
+        node = dict((priority[index], index) for index in xrange(len(blocks)))
+
+        meet_facts = [problem.get_initial()] * len(blocks)
+        transfer_facts = [problem.get_initial()] * len(blocks)
+
+        worklist = sorted(priority)
+        queued = [True] * len(blocks)
+
+        while worklist:
+            index = node[heapq.heappop(worklist)]
+
+            queued[index] = False
+
+            fact = problem.get_boundary() if index in boundary or not sources[index] else None
+
+            for source in sources[index]:
+                fact = transfer_facts[source] if fact is None else problem.meet(fact, transfer_facts[source])
+
+            meet_facts[index] = fact
+
+            gen, kill = summaries[index]
+
+            fact = gen | (fact & ~kill)
+
+            if fact == transfer_facts[index]:
+                continue
+
+            transfer_facts[index] = fact
+
+            for target in targets[index]:
+                if not queued[target]:
+                    queued[target] = True
+
+                    heapq.heappush(worklist, priority[target])
+
+        facts_meet = dict((bb.address, meet_facts[index]) for index, bb in enumerate(blocks))
+        facts_transfer = dict((bb.address, transfer_facts[index]) for index, bb in enumerate(blocks))
+
+        if forward:
+            return facts_meet, facts_transfer
+
+        return facts_transfer, facts_meet
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _get_structure(self, start_address):
+        """Return the basic blocks reachable from a start address (in
+        reverse postorder) and the successors and predecessors (as
+        lists of indexes) of each one.
+
+        """
+        postorder = []
+        visited = set([start_address])
+
+        stack = [(start_address, self._get_successors(start_address))]
+
+        while stack:
+            addr, branches = stack[-1]
+
+            for succ_addr in branches:
+                if succ_addr not in visited:
+                    visited.add(succ_addr)
+
+                    stack.append((succ_addr, self._get_successors(succ_addr)))
+
+                    break
+            else:
+                stack.pop()
+
+                postorder.append(addr)
+
+        addrs = postorder[::-1]
+
+        index = dict((addr, position) for position, addr in enumerate(addrs))
+
+        succs = [[index[succ_addr] for succ_addr in self._get_successors(addr)] for addr in addrs]
+        preds = [[] for _ in addrs]
+
+        for position, targets in enumerate(succs):
+            for target in targets:
+                preds[target].append(position)
+
+        return [self._bb_by_addr[addr] for addr in addrs], succs, preds
+
+    def _get_successors(self, address):
+        return iter([addr for addr, _ in self._bb_by_addr[address].branches if addr in self._bb_by_addr])
+
+    def _summarize(self, problem, bb, forward):
+        """Compose the gen and kill sets of the instructions of a basic
+        block.
+
+        """
+        instrs = list(enumerate(instr for dinstr in bb.instrs for instr in dinstr.ir_instrs))
+
+        if not forward:
+            instrs.reverse()
+
+        gen, kill = 0, 0
+
+        for index, instr in instrs:
+            instr_gen, instr_kill = problem.get_gen_kill(bb, index, instr)
+
+            gen = instr_gen | (gen & ~instr_kill)
+            kill = kill | instr_kill
+
+        return gen, kill
@@ -1,4 +1,5 @@
 from gadget import GadgetType
+from gadget import LazyRawGadget
 from gadget import RawGadget
 from gadget import TypedGadget
 
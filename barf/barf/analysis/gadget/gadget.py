@@ -7,6 +7,10 @@ as its REIL representation. One given gadget can be classified in one or
 more gadget type. At this point, a TypedGadget object is created for
 each classified type and the RawGadget object is associated with them.
 
+GadgetFinder returns LazyRawGadget objects. Gadgets that end the same
+way share those instructions (as a linked list), and the list of
+instructions of each gadget is only built when it is used.
+
 """
 
 from barf.core.reil import ReilEmptyOperand
@@ -74,6 +78,48 @@ class RawGadget(object):
         return "\n".join(lines)
 
 
+class LazyRawGadget(RawGadget):
+
+    """Represent a gadget as a linked list of instructions, which is
+    shared with the gadgets it is a suffix of. The list of instructions
+    is built on first access.
+    """
+
+
+    def __init__(self, chain):
+
+        # Linked list of instructions, as (dual instruction, next) pairs
+        # (None for the last one.)
+        self._chain = chain
+
+        # List of instructions (built on first access.)
+        self._instrs_list = None
+
+        # Id of gadget.
+        self._id = None
+
+    @property
+    def address(self):
+        """Get gadget start address.
+        """
+        return self._chain[0].address
+
+    @property
+    def _instrs(self):
+        if self._instrs_list is None:
+            instrs = []
+            chain = self._chain
+
+            while chain:
+                instrs.append(chain[0])
+
+                chain = chain[1]
+
+            self._instrs_list = instrs
+
+        return self._instrs_list
+
+
 class TypedGadget(RawGadget):
 
     """Represents a gadget with its semantic classification.
@@ -6,11 +6,30 @@ Innocent Flesh on the Bone: Return-into-libc without Function Calls
 Some more work is needed to make this algorithm truly architecture
 agnostic.
 
+The search range can be split into chunks that are searched in parallel
+by a pool of worker processes. Each worker searches the gadget tails
+within its chunk, but it reads the bytes before the chunk (up to
+byte_depth * instrs_depth) to build the gadgets that end in it. Results
+are merged in chunk order, so they are the same as those of a
+single-process search. For example:
+
+    candidates = finder.find(start_address, end_address, processes=4)
+
+Gadgets are generated from the gadget trees as linked lists of
+instructions (see LazyRawGadget), so the gadgets that end the same way
+share those instructions. To avoid holding all of them in memory at
+once, use find_iter:
+
+    for gadget in finder.find_iter(start_address, end_address, instrs_depth=8):
+        ...
+
 """
 import logging
+import multiprocessing
+import re
 
 from barf.analysis.gadget import GadgetType
-from barf.analysis.gadget import RawGadget
+from barf.analysis.gadget import LazyRawGadget
 from barf.arch.x86.x86instructiontranslator import FULL_TRANSLATION
 from barf.arch.x86.x86instructiontranslator import LITE_TRANSLATION
 from barf.core.reil import DualInstruction
@@ -19,6 +38,34 @@ from barf.core.reil import ReilRegisterOperand
 
 logger = logging.getLogger("GadgetFinder")
 
+# Opcodes (first byte) of the instructions that can end a gadget.
+# TODO: Make this 'speed improvement' architecture-agnostic
+GADGET_TAIL_OPCODES = [
+    "\xc3",     # RET
+    "\xc2",     # RET imm16
+    "\xeb",     # JMP rel8
+    "\xe8",     # CALL rel{16,32}
+    "\xe9",     # JMP rel{16,32}
+    "\xff",     # JMP/CALL r/m{16,32,64}
+]
+
+# Matches any gadget tail opcode.
+GADGET_TAIL_REGEX = re.compile("[%s]" % "".join(re.escape(op) for op in GADGET_TAIL_OPCODES))
+
+# Number of bytes of the search range sent to a worker process at once.
+GADGET_CHUNK_SIZE = 0x8000
+
+# Per-process state (set by the pool initializer.)
+_worker_finder = None
+
+def _init_worker(finder):
+    global _worker_finder
+
+    _worker_finder = finder
+
+def _find_chunk(chunk):
+    return list(_worker_finder._find_candidates(*chunk))
+
 class GadgetFinder(object):
 
     """Gadget Finder.
@@ -41,91 +88,175 @@ class GadgetFinder(object):
         # Maximum disassembled instructions.
         self._instrs_depth = 2
 
-    def find(self, start_address, end_address, byte_depth=20, instrs_depth=2):
+        # Valid instructions (as gadget tree nodes) that end right
+        # before an address. They are shared among all the gadgets that
+        # go through that address.
+        self._predecessors = {}
+
+        # Depth up to which the predecessors of an address were built.
+        self._predecessors_depth = {}
+
+        # Instructions disassembled at each address (as predecessors of
+        # the addresses up to byte_depth bytes after it.)
+        self._instrs = {}
+
+    def find(self, start_address, end_address, byte_depth=20, instrs_depth=2, processes=1, chunksize=GADGET_CHUNK_SIZE):
         """Find gadgets.
-        """
-        self._max_bytes = byte_depth
-        self._instrs_depth = instrs_depth
 
-        trans_mode_old = self._ir_trans.translation_mode
+        @param processes: Number of worker processes (None, the number
+        of CPUs. If it is 1, the search is done in this process.)
+        @param chunksize: Number of bytes searched by a worker process at
+        once.
 
-        self._ir_trans.translation_mode = LITE_TRANSLATION
+        """
+        return list(self.find_iter(start_address, end_address, byte_depth,
+            instrs_depth, processes, chunksize))
+
+    def find_iter(self, start_address, end_address, byte_depth=20, instrs_depth=2, processes=1, chunksize=GADGET_CHUNK_SIZE):
+        """Return a generator of the gadgets found (in the same order as
+        find.)
 
-        candidates = self._find_candidates(start_address, end_address)
+        The gadget trees of the range (or of each chunk of it) are built
+        before their gadgets are generated. The translator is only used
+        (in lite translation mode) while the trees are built, so it can
+        be used freely while the generator is suspended.
 
-        self._ir_trans.translation_mode = trans_mode_old
+        """
+        if processes == 1:
+            candidates = self._find_candidates(start_address, end_address,
+                start_address, end_address, byte_depth, instrs_depth)
+        else:
+            candidates = self._find_candidates_parallel(start_address,
+                end_address, byte_depth, instrs_depth, processes, chunksize)
 
-        return candidates
+        for candidate in candidates:
+            yield candidate
 
     # Auxiliary functions
     # ======================================================================== #
-    def _find_candidates(self, start_address, end_address):
-        """Finds possible 'RET-ended' gadgets.
+    def _find_candidates_parallel(self, start_address, end_address, byte_depth, instrs_depth, processes, chunksize):
+        """Finds possible 'RET-ended' gadgets using a pool of worker
+        processes, one chunk of the range at a time.
+
+        """
+        chunks = [(addr, min(addr + chunksize - 1, end_address), start_address, end_address,
+            byte_depth, instrs_depth) for addr in xrange(start_address, end_address + 1, chunksize)]
+
+        # Worker processes are forked, so they inherit this finder.
+        pool = multiprocessing.Pool(processes, _init_worker, (self,))
+
+        try:
+            for chunk_candidates in pool.imap(_find_chunk, chunks):
+                for candidate in chunk_candidates:
+                    yield candidate
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _find_candidates(self, start_address, end_address, base_address, limit_address, byte_depth, instrs_depth):
+        """Finds (generates) possible 'RET-ended' gadgets whose tail is
+        within a range of addresses. Gadgets (and tail instructions) do not go
+        past the boundaries of the search range (base and limit
+        addresses.)
+
+        """
+        roots = self._build_trees(start_address, end_address, base_address,
+            limit_address, byte_depth, instrs_depth)
+
+        # build gadgets
+        for r in roots:
+            for gadget in self._build_gadgets(r, instrs_depth):
+                yield gadget
+
+    def _build_trees(self, start_address, end_address, base_address, limit_address, byte_depth, instrs_depth):
+        """Return the gadget trees (roots) of the gadget tails within a
+        range of addresses.
+
         """
+        self._max_bytes = byte_depth
+        self._instrs_depth = instrs_depth
+
+        trans_mode_old = self._ir_trans.translation_mode
+
+        self._ir_trans.translation_mode = LITE_TRANSLATION
+
         roots = []
 
-        # find gadget tail
-        for addr in xrange(start_address, end_address + 1):
-            # TODO: Make this 'speed improvement' architecture-agnostic
-            op_codes = [
-                "\xc3",     # RET
-                "\xc2",     # RET imm16
-                "\xeb",     # JMP rel8
-                "\xe8",     # CALL rel{16,32}
-                "\xe9",     # JMP rel{16,32}
-                "\xff",     # JMP/CALL r/m{16,32,64}
-            ]
-
-            if self._mem[addr] not in op_codes:
-                continue
+        try:
+            # read the chunk (and the bytes of the tail instructions that
+            # go past its end) at once
+            data = self._mem[start_address:min(end_address + 16, limit_address) + 1]
 
-            asm_instr, asm_size = self._disasm.disassemble(
-                self._mem[addr:min(addr+16, end_address + 1)],
-                addr
-            )
+            # find gadget tail
+            for match in GADGET_TAIL_REGEX.finditer(data, 0, end_address - start_address + 1):
+                offset = match.start()
+                addr = start_address + offset
 
-            if not asm_instr:
-                continue
+                asm_instr, asm_size = self._disasm.disassemble(
+                    data[offset:offset + 16],
+                    addr
+                )
 
-            # restarts ir register numbering
-            self._ir_trans.reset()
+                if not asm_instr:
+                    continue
 
-            try:
-                ins_ir = self._ir_trans.translate(asm_instr)
-            except:
-                logger.debug("[-] Error: GadgetFinder")
-                logger.debug("asm: " + str(asm_instr))
-                logger.debug("bytes: " + "".join("\\x%02x" % ord(b) for b in asm_instr.bytes))
-                continue
+                # restarts ir register numbering
+                self._ir_trans.reset()
 
-            # build gadget
-            if ins_ir[-1] and (ins_ir[-1].mnemonic == ReilMnemonic.RET \
-                or (ins_ir[-1].mnemonic == ReilMnemonic.JCC and isinstance(ins_ir[-1].operands[2], ReilRegisterOperand))):
+                try:
+                    ins_ir = self._ir_trans.translate(asm_instr)
+                except:
+                    logger.debug("[-] Error: GadgetFinder")
+                    logger.debug("asm: " + str(asm_instr))
+                    logger.debug("bytes: " + "".join("\\x%02x" % ord(b) for b in asm_instr.bytes))
+                    continue
 
-                root = GadgetTreeNode(DualInstruction(addr, asm_instr, ins_ir))
+                # build gadget
+                if ins_ir[-1] and (ins_ir[-1].mnemonic == ReilMnemonic.RET \
+                    or (ins_ir[-1].mnemonic == ReilMnemonic.JCC and isinstance(ins_ir[-1].operands[2], ReilRegisterOperand))):
 
-                roots.append(root)
+                    root = GadgetTreeNode(DualInstruction(addr, asm_instr, ins_ir))
 
-                self._build_from(addr, root, start_address, self._instrs_depth)
+                    roots.append(root)
 
-        # filter roots with no children
-        roots = [r for r in roots if len(r.get_children()) > 0]
+                    self._build_from(addr, root, base_address, limit_address, self._instrs_depth)
+        finally:
+            self._ir_trans.translation_mode = trans_mode_old
 
-        # build gadgets
-        root_gadgets = [self._build_gadgets(r) for r in roots]
+            self._predecessors = {}
+            self._predecessors_depth = {}
+            self._instrs = {}
 
-        # flatten root gadget list
-        candidates = [item for l in root_gadgets for item in l]
+        # filter roots with no children
+        roots = [r for r in roots if len(r.get_children()) > 0]
 
-        return candidates
+        return roots
 
-    def _build_from(self, address, root, base_address, depth = 2):
+    def _build_from(self, address, root, base_address, limit_address, depth = 2):
         """Build gadget recursively.
         """
         if depth == 0:
             return
 
-        end_addr = address
+        root.set_children(self._get_predecessors(address, base_address, limit_address))
+
+        if self._predecessors_depth.get(address, 0) >= depth:
+            return
+
+        self._predecessors_depth[address] = depth
+
+        for child in root.get_children():
+            self._build_from(child.get_root().address, child, base_address, limit_address, depth - 1)
+
+    def _get_predecessors(self, address, base_address, limit_address):
+        """Return the valid instructions (as gadget tree nodes) that end
+        right before an address.
+
+        """
+        if address in self._predecessors:
+            return self._predecessors[address]
+
+        predecessors = []
 
         for step in range(1, self._max_bytes + 1):
             start_addr = address - step
@@ -133,12 +264,7 @@ class GadgetFinder(object):
             if start_addr < 0 or start_addr < base_address:
                 break
 
-            raw_bytes = self._mem[start_addr:end_addr]
-
-            asm_instr, asm_size = self._disasm.disassemble(
-                raw_bytes,
-                start_addr
-            )
+            asm_instr, asm_size = self._disassemble(start_addr, limit_address)
 
             if not asm_instr or asm_size != step:
                 continue
@@ -152,40 +278,55 @@ class GadgetFinder(object):
                 continue
 
             if self._is_valid_ins(ir_instrs, asm_instr):
-                child = GadgetTreeNode(DualInstruction(start_addr, asm_instr, \
-                    ir_instrs))
+                predecessors.append(GadgetTreeNode(DualInstruction(start_addr, asm_instr, \
+                    ir_instrs)))
+
+        self._predecessors[address] = predecessors
 
-                root.add_child(child)
+        return predecessors
 
-                self._build_from(address - step, child, base_address, depth - 1)
+    def _disassemble(self, address, limit_address):
+        """Disassemble the instruction at an address. Each address is
+        disassembled only once (instead of once for every address it
+        may precede.)
 
-    def _build_gadgets(self, gadget_tree_root):
-        """Return a gadget list.
         """
-        node_list = self._build_gadgets_rec(gadget_tree_root)
+        if address not in self._instrs:
+            self._instrs[address] = self._disasm.disassemble(
+                self._mem[address:min(address + 16, limit_address + 1)],
+                address
+            )
+
+        return self._instrs[address]
 
-        return [RawGadget(n[i:]) for n in node_list for i in xrange(len(n) - 1)]
+    def _build_gadgets(self, gadget_tree_root, depth):
+        """Return a generator of the gadgets of a gadget tree (every
+        suffix, of at least two instructions, of each path from a leaf
+        to the root.)
 
-    def _build_gadgets_rec(self, gadget_tree_root):
-        """Build a gadget from a gadget tree.
         """
-        root     = gadget_tree_root.get_root()
-        children = gadget_tree_root.get_children()
+        for chain in self._build_gadgets_rec(gadget_tree_root, depth, None):
+            while chain[1]:
+                yield LazyRawGadget(chain)
+
+                chain = chain[1]
 
-        node_list = []
+    def _build_gadgets_rec(self, gadget_tree_root, depth, next_chain):
+        """Return a generator of the paths of a gadget tree (up to a
+        depth, as nodes are shared among gadget trees.) Paths are
+        linked lists of instructions that share their common tails.
+
+        """
+        chain = (gadget_tree_root.get_root(), next_chain)
 
-        root_gadget_ins = DualInstruction(root.address, root.asm_instr, \
-            root.ir_instrs)
+        children = gadget_tree_root.get_children() if depth > 0 else []
 
         if children == []:
-            node_list += [[root_gadget_ins]]
+            yield chain
         else:
             for child in children:
-                node_list_rec = self._build_gadgets_rec(child)
-
-                node_list += [n + [root_gadget_ins] for n in node_list_rec]
-
-        return node_list
+                for path in self._build_gadgets_rec(child, depth - 1, chain):
+                    yield path
 
     def _is_valid_ins(self, ins_ir, ins_asm):
         """Check for instruction validity as a gadget.
@@ -219,6 +360,11 @@ class GadgetTreeNode(object):
         """
         self._children.append(child)
 
+    def set_children(self, children):
+        """Set node's children.
+        """
+        self._children = children
+
     def get_children(self):
         """Get node's children.
         """
@@ -74,11 +74,15 @@ class GadgetVerifier(object):
         # Add instructions to the analyzer
         self.analyzer.reset(full=True)
 
+        reil_instrs = []
+
         for reil_instr in gadget.get_ir_instrs():
             if reil_instr.mnemonic == ReilMnemonic.RET:
                 break
 
-            self.analyzer.add_instruction(reil_instr)
+            reil_instrs.append(reil_instr)
+
+        self.analyzer.add_instructions(reil_instrs)
 
         # Generate constraints for the gadget type.
         constrs = self._constraints_generators[gadget.type](gadget)
@@ -0,0 +1 @@
+from slicer import ReilSlicer
@@ -0,0 +1,143 @@
+"""
+This module implements a backward slicer for REIL code.
+
+ReilSlicer
+----------
+
+Given a sequence of REIL instructions and a set of registers (and,
+optionally, the memory) whose final value is of interest, the slicer
+keeps only the instructions these values depend on. Dependencies are
+tracked through registers and temporaries. Memory is handled
+conservatively: once a load is kept, every previous store is kept as
+well. For example:
+
+    slicer = ReilSlicer()
+    slicer.set_reg_access_mapper(arch_info.register_access_mapper())
+
+    instrs = slicer.slice(reil_instrs, ["eax"])
+
+Basic block paths can be sliced with **slice_path**, which also keeps
+the branch conditions that make execution follow the path.
+
+"""
+from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+
+class ReilSlicer(object):
+
+    """REIL backward slicer.
+    """
+
+    def __init__(self):
+
+        # Maps partial registers to the registers that contain them,
+        # e.i., 'al' -> ('eax', mask, shift)
+        self._reg_access_mapper = {}
+
+    def slice(self, instrs, registers, memory=False):
+        """Return the instructions (of a sequence) that the final value
+        of the given registers (and the memory, if memory is set)
+        depends on.
+
+        """
+        return self._slice(instrs, registers, memory, set())
+
+    def slice_path(self, path, registers, memory=False):
+        """Return the instructions of a basic block path that the final
+        value of the given registers (and the memory, if memory is set)
+        and the branch conditions of the path depend on.
+
+        """
+        instrs = []
+        branches = set()
+
+        for bb_curr, bb_next in zip(path, path[1:] + [None]):
+            for dinstr in bb_curr.instrs:
+                for instr in dinstr.ir_instrs:
+                    # Keep the branch at the end of the basic block
+                    # (skip CALL instructions.)
+                    if bb_next is not None and instr.mnemonic == ReilMnemonic.JCC and \
+                        dinstr.address + dinstr.asm_instr.size - 1 == bb_curr.end_address:
+                        branches.add(len(instrs))
+
+                    instrs.append(instr)
+
+        return self._slice(instrs, registers, memory, branches)
+
+    def set_reg_access_mapper(self, reg_access_mapper):
+        """Set register access mapper.
+        """
+        self._reg_access_mapper = reg_access_mapper
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _slice(self, instrs, registers, memory, branches):
+        """Slice a sequence of instructions backwards. branches is the
+        set of indexes of the JCC instructions that have to be kept.
+
+        """
+        live = set(self._get_base_name(name) for name in registers)
+        mem_live = memory
+
+        indexes = []
+
+        for index in xrange(len(instrs) - 1, -1, -1):
+            instr = instrs[index]
+
+            if instr.mnemonic == ReilMnemonic.JCC:
+                if index not in branches:
+                    continue
+
+                uses = [instr.operands[0]]
+
+            elif instr.mnemonic == ReilMnemonic.STM:
+                # Stores are needed as long as memory is.
+                if not mem_live:
+                    continue
+
+                uses = [instr.operands[0], instr.operands[2]]
+
+            elif instr.mnemonic in [ReilMnemonic.NOP, ReilMnemonic.UNKN, ReilMnemonic.RET]:
+                continue
+
+            else:
+                if not self._kill(instr.operands[2], live):
+                    continue
+
+                if instr.mnemonic == ReilMnemonic.LDM:
+                    mem_live = True
+
+                uses = instr.operands[:2]
+
+            for oprnd in uses:
+                if isinstance(oprnd, ReilRegisterOperand):
+                    live.add(self._get_base_name(oprnd.name))
+
+            indexes.append(index)
+
+        return [instrs[index] for index in reversed(indexes)]
+
+    def _kill(self, oprnd, live):
+        """Process the definition of an operand. Return whether it is
+        live (in which case the instruction that defines it is needed.)
+
+        """
+        if not isinstance(oprnd, ReilRegisterOperand):
+            return False
+
+        name = self._get_base_name(oprnd.name)
+
+        if name not in live:
+            return False
+
+        # Partial registers writes keep the rest of the register.
+        if oprnd.name not in self._reg_access_mapper:
+            live.remove(name)
+
+        return True
+
+    def _get_base_name(self, name):
+        if name in self._reg_access_mapper:
+            return self._reg_access_mapper[name][0]
+
+        return name
@@ -0,0 +1,5 @@
+from ssa import SsaBlock
+from ssa import SsaBuilder
+from ssa import SsaForm
+from ssa import SsaInstruction
+from ssa import SsaPhi
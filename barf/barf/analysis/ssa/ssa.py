@@ -0,0 +1,382 @@
+"""
+This module implements the conversion of REIL code to SSA form.
+
+SsaBuilder
+----------
+
+Converts REIL instruction sequences (**build_sequence**) and basic block
+graphs (**build**) to static single assignment form: each definition of
+a register (or temporary) gets a new version, named as **VariableNamer**
+does ('eax' -> 'eax_1', 'eax_2', ...; 'eax_0' is the value on entry),
+and phi nodes are placed at merge points (semi-pruned SSA, using the
+dominance frontiers of the graph). For example:
+
+    builder = SsaBuilder()
+    builder.set_reg_access_mapper(arch_info.register_access_mapper())
+
+    ssa = builder.build(bb_graph, start_address)
+
+    for block in ssa.blocks:
+        for phi in block.phis:
+            ...
+        for instr in block.instrs:
+            ...
+
+Sub-registers (e.g. 'al' for 'eax') are versioned as the register that
+contains them, so a write to a sub-register defines a new version of
+the register which also uses the previous one.
+
+SsaForm
+-------
+
+The result of the conversion. Besides the blocks, it provides explicit
+def-use chains: the definition of each SSA name (**get_definition**) and
+its uses (**get_uses**).
+
+"""
+import networkx
+
+from collections import OrderedDict
+
+from barf.core.reil import ReilEmptyOperand
+from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+from barf.utils.utils import VariableNamer
+
+class SsaInstruction(object):
+
+    """REIL instruction in SSA form.
+    """
+
+    def __init__(self, instr, uses, defs):
+
+        # Original REIL instruction.
+        self.instr = instr
+
+        # SSA names of the variables the instruction reads (in operand
+        # order.)
+        self.uses = uses
+
+        # SSA names of the variables the instruction writes.
+        self.defs = defs
+
+    def __str__(self):
+        return "%s ; defs: %s, uses: %s" % (self.instr, ", ".join(self.defs), ", ".join(self.uses))
+
+
+class SsaPhi(object):
+
+    """Phi node.
+    """
+
+    def __init__(self, name):
+
+        # Base name of the variable.
+        self.name = name
+
+        # SSA name defined by the phi node.
+        self.defs = []
+
+        # SSA name of the variable that flows from each predecessor
+        # (predecessor address -> SSA name.)
+        self.sources = {}
+
+    @property
+    def uses(self):
+        """Get the SSA names the phi node reads.
+        """
+        return [self.sources[addr] for addr in sorted(self.sources)]
+
+    def __str__(self):
+        sources = ", ".join("0x%08x : %s" % (addr, name) for addr, name in sorted(self.sources.items()))
+
+        return "%s = phi(%s)" % (self.defs[0], sources)
+
+
+class SsaBlock(object):
+
+    """Basic block in SSA form.
+    """
+
+    def __init__(self, address):
+
+        # Start address of the basic block.
+        self.address = address
+
+        # Phi nodes.
+        self.phis = []
+
+        # Instructions (SsaInstruction.)
+        self.instrs = []
+
+    def __str__(self):
+        lines = ["SSA Block @ 0x%08x" % (self.address if self.address else 0)]
+
+        lines += ["    %s" % str(phi) for phi in self.phis]
+        lines += ["    %s" % str(instr) for instr in self.instrs]
+
+        return "\n".join(lines)
+
+
+class SsaForm(object):
+
+    """SSA form of REIL code with def-use chains.
+    """
+
+    def __init__(self, blocks):
+
+        # Blocks, by address (in dominator tree order.)
+        self._blocks = blocks
+
+        # Definition of each SSA name (SsaInstruction or SsaPhi.)
+        self._definitions = {}
+
+        # Uses of each SSA name (list of SsaInstruction or SsaPhi.)
+        self._uses = {}
+
+        for block in blocks.values():
+            for item in block.phis + block.instrs:
+                for name in item.defs:
+                    self._definitions[name] = item
+
+                for name in item.uses:
+                    self._uses.setdefault(name, []).append(item)
+
+    @property
+    def blocks(self):
+        """Get blocks.
+        """
+        return self._blocks.values()
+
+    def get_block(self, address):
+        """Get the block that starts at an address.
+        """
+        return self._blocks.get(address, None)
+
+    def get_definition(self, name):
+        """Get the definition of a SSA name (None for the values on
+        entry.)
+
+        """
+        return self._definitions.get(name, None)
+
+    def get_uses(self, name):
+        """Get the uses of a SSA name.
+        """
+        return self._uses.get(name, [])
+
+    def __str__(self):
+        return "\n".join(str(block) for block in self.blocks)
+
+
+class SsaBuilder(object):
+
+    """SSA form builder.
+    """
+
+    def __init__(self):
+
+        # Maps sub-registers to the registers that contain them, e.i.,
+        # 'al' -> ('eax', mask, shift)
+        self._reg_access_mapper = {}
+
+    def build(self, bb_graph, start_address):
+        """Convert the basic blocks of a graph reachable from a start
+        address to SSA form.
+
+        """
+        bb_by_addr = dict((bb.address, bb) for bb in bb_graph.basic_blocks)
+
+        graph = networkx.DiGraph()
+        graph.add_node(start_address)
+
+        pending = [start_address]
+
+        while pending:
+            addr = pending.pop()
+
+            for succ_addr, _ in bb_by_addr[addr].branches:
+                if succ_addr not in bb_by_addr:
+                    continue
+
+                if succ_addr not in graph:
+                    pending.append(succ_addr)
+
+                graph.add_edge(addr, succ_addr)
+
+        idoms = networkx.immediate_dominators(graph, start_address)
+        frontiers = networkx.dominance_frontiers(graph, start_address)
+
+        children = dict((addr, []) for addr in idoms)
+
+        for addr, idom in idoms.items():
+            if addr != idom:
+                children[idom].append(addr)
+
+        instrs = dict((addr, [instr for dinstr in bb_by_addr[addr].instrs for instr in dinstr.ir_instrs])
+            for addr in idoms)
+
+        phis = self._place_phis(instrs, frontiers)
+
+        return self._rename(start_address, instrs, phis, children, graph)
+
+    def build_sequence(self, instrs):
+        """Convert a sequence of REIL instructions (a single block) to
+        SSA form.
+
+        """
+        return self._rename(None, {None : instrs}, {None : []}, {None : []}, networkx.DiGraph())
+
+    def set_reg_access_mapper(self, reg_access_mapper):
+        """Set register access mapper.
+        """
+        self._reg_access_mapper = reg_access_mapper
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _place_phis(self, instrs, frontiers):
+        """Return the phi nodes of each block. Only variables that are
+        live across blocks get phi nodes (semi-pruned SSA.)
+
+        """
+        globals_ = set()
+        def_blocks = {}
+
+        for addr, block_instrs in instrs.items():
+            killed = set()
+
+            for instr in block_instrs:
+                uses, defs = self._get_variables(instr)
+
+                globals_.update(name for name in uses if name not in killed)
+
+                for name in defs:
+                    killed.add(name)
+                    def_blocks.setdefault(name, set()).add(addr)
+
+        phis = dict((addr, []) for addr in instrs)
+
+        for name in sorted(globals_):
+            placed = set()
+            pending = list(def_blocks.get(name, []))
+
+            while pending:
+                addr = pending.pop()
+
+                for frontier_addr in frontiers[addr]:
+                    if frontier_addr in placed:
+                        continue
+
+                    phis[frontier_addr].append(SsaPhi(name))
+
+                    placed.add(frontier_addr)
+                    pending.append(frontier_addr)
+
+        return phis
+
+    def _rename(self, start_address, instrs, phis, children, graph):
+        """Rename variables walking the dominator tree.
+        """
+        namers = {}
+        stacks = {}
+
+        def get_current(name):
+            if stacks.get(name):
+                return stacks[name][-1]
+
+            return self._get_namer(namers, name).get_init()
+
+        def get_next(name):
+            ssa_name = self._get_namer(namers, name).get_next()
+
+            stacks.setdefault(name, []).append(ssa_name)
+
+            return ssa_name
+
+        blocks = OrderedDict()
+        pushed = {}
+
+        pending = [(start_address, False)]
+
+        while pending:
+            addr, leaving = pending.pop()
+
+            # Restore the names defined in the block.
+            if leaving:
+                for name in pushed.pop(addr):
+                    stacks[name].pop()
+
+                continue
+
+            block = SsaBlock(addr)
+            block.phis = phis[addr]
+
+            pushed[addr] = []
+
+            for phi in block.phis:
+                phi.defs = [get_next(phi.name)]
+
+                pushed[addr].append(phi.name)
+
+            for instr in instrs[addr]:
+                uses, defs = self._get_variables(instr)
+
+                ssa_uses = [get_current(name) for name in uses]
+                ssa_defs = [get_next(name) for name in defs]
+
+                pushed[addr] += defs
+
+                block.instrs.append(SsaInstruction(instr, ssa_uses, ssa_defs))
+
+            if addr in graph:
+                for succ_addr in graph.successors(addr):
+                    for phi in phis[succ_addr]:
+                        phi.sources[addr] = get_current(phi.name)
+
+            blocks[addr] = block
+
+            pending.append((addr, True))
+            pending += [(child, False) for child in sorted(children[addr], reverse=True)]
+
+        return SsaForm(blocks)
+
+    def _get_variables(self, instr):
+        """Return the (base) names of the variables an instruction reads
+        and writes.
+
+        """
+        oprnd1, oprnd2, oprnd3 = instr.operands
+
+        if instr.mnemonic in [ReilMnemonic.STM, ReilMnemonic.JCC]:
+            uses, defs = [oprnd1, oprnd3], []
+        elif instr.mnemonic in [ReilMnemonic.NOP, ReilMnemonic.UNKN, ReilMnemonic.RET]:
+            uses, defs = [], []
+        else:
+            uses, defs = [oprnd1, oprnd2], [oprnd3]
+
+        uses = [oprnd for oprnd in uses if self._is_variable(oprnd)]
+        defs = [oprnd for oprnd in defs if self._is_variable(oprnd)]
+
+        # Writing a sub-register keeps the rest of the register.
+        partial = [oprnd for oprnd in defs if oprnd.name in self._reg_access_mapper]
+
+        use_names = [self._get_base_name(oprnd.name) for oprnd in uses + partial]
+        def_names = [self._get_base_name(oprnd.name) for oprnd in defs]
+
+        return use_names, def_names
+
+    def _is_variable(self, oprnd):
+        return isinstance(oprnd, ReilRegisterOperand) and \
+            not isinstance(oprnd, ReilEmptyOperand)
+
+    def _get_base_name(self, name):
+        if name in self._reg_access_mapper:
+            return self._reg_access_mapper[name][0]
+
+        return name
+
+    def _get_namer(self, namers, name):
+        if name not in namers:
+            namers[name] = VariableNamer(name)
+
+        return namers[name]
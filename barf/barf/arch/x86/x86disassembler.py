@@ -6,9 +6,16 @@ from capstone import *
 
 from barf.arch import ARCH_X86_MODE_32
 from barf.arch import ARCH_X86_MODE_64
+from barf.arch.x86.x86base import X86ImmediateOperand
 from barf.arch.x86.x86parser import X86Parser
 from barf.core.disassembler import Disassembler
 
+# Control transfer instructions. Every mnemonic that starts with one of
+# the branch prefixes is a branch ('jmp' being the only unconditional
+# one.)
+BRANCH_PREFIXES = ("j", "loop")
+RETURN_MNEMONICS = ("ret", "retf", "iret", "iretd", "iretq")
+
 class X86Disassembler(Disassembler):
     """X86 Disassembler.
     """
@@ -47,3 +54,50 @@ class X86Disassembler(Disassembler):
         """Disassemble the data into multiple instructions.
         """
         raise NotImplementedError()
+
+    def is_nop(self, instr):
+        """Return whether an instruction is a no-operation.
+        """
+        return instr.mnemonic == "nop"
+
+    def is_return(self, instr):
+        """Return whether an instruction returns from a function.
+        """
+        return instr.mnemonic in RETURN_MNEMONICS
+
+    def is_call(self, instr):
+        """Return whether an instruction is a call.
+        """
+        return instr.mnemonic == "call"
+
+    def get_call_target(self, instr):
+        """Return the target address of a call instruction (None if it
+        is not a direct call.)
+
+        """
+        if not self.is_call(instr) or not isinstance(instr.operands[0], X86ImmediateOperand):
+            return None
+
+        return instr.operands[0].immediate
+
+    def extract_branches(self, instr):
+        """Return the (taken, not taken, direct) branch addresses of an
+        instruction (None if it does not transfer control.) Unresolved
+        branch addresses are set to None.
+
+        """
+        if not instr.mnemonic.startswith(BRANCH_PREFIXES):
+            return None
+
+        dst = instr.operands[0] if instr.operands else None
+
+        # indirect branches are left unresolved
+        if isinstance(dst, X86ImmediateOperand):
+            branch_addr = dst.immediate
+        else:
+            branch_addr = None
+
+        if instr.mnemonic == "jmp":
+            return None, None, branch_addr
+
+        return branch_addr, instr.address + instr.size, None
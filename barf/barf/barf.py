@@ -10,6 +10,7 @@ import arch
 
 from analysis.basicblock import BasicBlockBuilder
 from analysis.basicblock import BasicBlockGraph
+from analysis.callgraph import CallGraphBuilder
 from analysis.codeanalyzer import CodeAnalyzer
 from analysis.gadget import GadgetClassifier
 from analysis.gadget import GadgetFinder
@@ -21,6 +22,7 @@ from core.bi import BinaryFile
 from core.reil import ReilEmulator
 from core.smt.smtlibv2 import Z3Solver
 from core.smt.smtlibv2 import CVC4Solver
+from core.smt.smtlibv2 import PortfolioSolver
 
 from core.smt.smttranslator import SmtTranslator
 
@@ -36,6 +38,7 @@ verbose = False
 # Choose between SMT Solvers...
 SMT_SOLVER  = "Z3"
 # SMT_SOLVER  = "CVC4"
+# SMT_SOLVER  = "PORTFOLIO"
 
 class BARF(object):
     """Binary Analysis Framework."""
@@ -89,6 +92,8 @@ class BARF(object):
                 self.smt_solver = Z3Solver()
             elif SMT_SOLVER == "CVC4":
                 self.smt_solver = CVC4Solver()
+            elif SMT_SOLVER == "PORTFOLIO":
+                self.smt_solver = PortfolioSolver()
             else:
                 raise Exception("Invalid SMT solver.")
 
@@ -107,8 +112,15 @@ class BARF(object):
         ## basic block
         self.bb_builder = BasicBlockBuilder(self.disassembler, self.text_section, self.ir_translator)
 
+        ## call graph
+        # Functions are translated to REIL on demand (the basic blocks
+        # are sent back from the worker processes untranslated.)
+        bb_builder_lazy = BasicBlockBuilder(self.disassembler, self.text_section, self.ir_translator, lazy=True)
+
+        self.cg_builder = CallGraphBuilder(bb_builder_lazy, self.text_section, self.binary.architecture_mode)
+
         ## code analyzer
-        self.code_analyzer = CodeAnalyzer(self.smt_solver, self.smt_translator)
+        self.code_analyzer = CodeAnalyzer(self.smt_solver, self.smt_translator, slicing=True)
 
         # TODO: This should not be part of the framework, but something that
         # it is build upon.
@@ -201,6 +213,25 @@ class BARF(object):
 
         return bb_graph
 
+    def recover_functions(self, ea_start=None, ea_end=None):
+        """Recover functions (and their CFGs) in parallel.
+
+        :param ea_start: start address
+        :type ea_start: int
+        :param ea_end: end address
+        :type ea_end: int
+
+        :returns: a call graph where each node is a function
+        :rtype: CallGraph
+
+        """
+        start_addr = ea_start if ea_start else self.binary.ea_start
+        end_addr = ea_end if ea_end else self.binary.ea_end
+
+        entry_points = [self.binary.entry_point] if self.binary.entry_point else []
+
+        return self.cg_builder.build(start_addr, end_addr, entry_points, self.binary.symbols)
+
     def recover_bbs(self, ea_start=None, ea_end=None, mode=None):
         """Recover basic blocks.
 
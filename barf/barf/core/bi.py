@@ -4,6 +4,7 @@ Binary Interface Module.
 
 from pefile import PE
 from pybfd.bfd import Bfd
+from pybfd.symbol import SymbolFlags
 
 import barf.arch as arch
 
@@ -29,6 +30,17 @@ class Memory(object):
         if isinstance(key, slice):
             step = 1 if key.step is None else key.step
 
+            if step == 1:
+                # Read contiguous memory in a single call.
+                size = max(key.stop - key.start, 0)
+
+                val = str(self.read_function(key.start, size)) if size > 0 else ""
+
+                if len(val) != size:
+                    raise IndexError("Index out of range : %s" % hex(key.start + len(val)))
+
+                return val
+
             try:
                 # Read memory one byte at a time.
                 for addr in range(key.start, key.stop, step):
@@ -70,6 +82,12 @@ class BinaryFile(object):
         # Architecture mode.
         self._arch_mode = None
 
+        # Entry point address.
+        self._entry_point = None
+
+        # Function symbols (address -> name).
+        self._symbols = {}
+
         # Open file
         if filename:
             self._open(filename)
@@ -100,6 +118,18 @@ class BinaryFile(object):
         """
         return self._arch_mode
 
+    @property
+    def entry_point(self):
+        """Get entry point address.
+        """
+        return self._entry_point
+
+    @property
+    def symbols(self):
+        """Get function symbols (address -> name).
+        """
+        return self._symbols
+
     @property
     def filename(self):
         """Get file name.
@@ -148,6 +178,13 @@ class BinaryFile(object):
             # get arch and arch mode
             self._arch = self._map_architecture(bfd.architecture_name)
             self._arch_mode = self._map_architecture_mode(bfd.arch_size)
+
+            # get entry point and function symbols
+            self._entry_point = bfd.start_address
+
+            for address, symbol in bfd.symbols.items():
+                if SymbolFlags.FUNCTION in symbol.flags:
+                    self._symbols[address] = symbol.name
         except:
             # print "BFD could not open the file."
             pass
@@ -180,6 +217,14 @@ class BinaryFile(object):
                     self._arch_mode = arch.ARCH_X86_MODE_64
                 else:
                     raise Exception("Machine not supported.")
+
+                # get entry point and exported symbols
+                self._entry_point = pe.OPTIONAL_HEADER.ImageBase + pe.OPTIONAL_HEADER.AddressOfEntryPoint
+
+                if hasattr(pe, "DIRECTORY_ENTRY_EXPORT"):
+                    for symbol in pe.DIRECTORY_ENTRY_EXPORT.symbols:
+                        if symbol.name:
+                            self._symbols[pe.OPTIONAL_HEADER.ImageBase + symbol.address] = symbol.name
         except:
             # print "PEFile could not open the file."
             pass
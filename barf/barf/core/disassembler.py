@@ -15,3 +15,33 @@ class Disassembler(object):
         """Disassemble raw bytes into multiple instructions.
         """
         raise NotImplementedError()
+
+    def is_nop(self, instr):
+        """Return whether an instruction is a no-operation.
+        """
+        raise NotImplementedError()
+
+    def is_return(self, instr):
+        """Return whether an instruction returns from a function.
+        """
+        raise NotImplementedError()
+
+    def is_call(self, instr):
+        """Return whether an instruction is a call.
+        """
+        raise NotImplementedError()
+
+    def get_call_target(self, instr):
+        """Return the target address of a call instruction (None if it
+        is not a direct call.)
+
+        """
+        raise NotImplementedError()
+
+    def extract_branches(self, instr):
+        """Return the (taken, not taken, direct) branch addresses of an
+        instruction (None if it does not transfer control.) Unresolved
+        branch addresses are set to None.
+
+        """
+        raise NotImplementedError()
@@ -560,7 +560,7 @@ class DualInstruction(object):
     """
 
 
-    def __init__(self, address, asm_instr, ir_instrs):
+    def __init__(self, address, asm_instr, ir_instrs, translator=None):
 
         # Address of the assembler instruction.
         self._address = address
@@ -573,6 +573,10 @@ class DualInstruction(object):
         # instruction.
         self._ir_instrs = ir_instrs
 
+        # REIL translator. If the translation is not given (ir_instrs
+        # is None), it is done on first access.
+        self._translator = translator
+
     @property
     def address(self):
         """Get instruction address.
@@ -585,10 +589,25 @@ class DualInstruction(object):
         """
         return self._asm_instr
 
+    @property
+    def translator(self):
+        """Get REIL translator (used to translate on first access.)
+        """
+        return self._translator
+
+    @translator.setter
+    def translator(self, value):
+        """Set REIL translator (used to translate on first access.)
+        """
+        self._translator = value
+
     @property
     def ir_instrs(self):
         """Get IR representation of the assembly instruction.
         """
+        if self._ir_instrs is None and self._translator:
+            self._ir_instrs = self._translator.translate(self._asm_instr)
+
         return self._ir_instrs
 
     def __eq__(self, other):
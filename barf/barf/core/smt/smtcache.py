@@ -0,0 +1,155 @@
+"""
+This module implements a cache for SMT queries.
+
+SmtQueryCache
+-------------
+
+Many of the queries sent to the SMT solver are structurally identical:
+the same instruction sequence translated at different addresses, or the
+same constraint template applied to different gadgets. They only differ
+in the names of the variables, which are versioned by **VariableNamer**
+(for example, 'eax_3' instead of 'eax_1'). This class keeps the result
+of each query (sat/unsat and, for satisfiable queries, a model) indexed
+by a hash of its *canonical form*, that is, the formula with all its
+declared symbols alpha-renamed in a deterministic way.
+
+The cache is an in-memory LRU, optionally backed by an on-disk store so
+results can be reused across runs. For example:
+
+    cache = SmtQueryCache("smt-queries.db")
+
+    solver = Z3Solver()
+    solver.set_query_cache(cache)
+
+"""
+import hashlib
+import re
+import shelve
+
+from collections import OrderedDict
+
+# Regular expression that matches a SMTLIB token (symbol, keyword or
+# literal.)
+_token_re = re.compile(r"[^\s()]+")
+
+class SmtQueryCache(object):
+
+    """SMT query result cache.
+    """
+
+    def __init__(self, filename=None, max_size=4096):
+
+        # Maximum number of entries kept in memory.
+        self._max_size = max_size
+
+        # In-memory LRU (canonical hash -> (status, model)).
+        self._entries = OrderedDict()
+
+        # Optional on-disk store.
+        self._store = shelve.open(filename) if filename else None
+
+        # Statistics.
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """Return the (status, model) pair of a query or None if the
+        query is not in the cache.
+
+        """
+        entry = self._entries.pop(key, None)
+
+        if entry is None and self._store is not None:
+            entry = self._store.get(key, None)
+
+        if entry is None:
+            self.misses += 1
+
+            return None
+
+        self._insert(key, entry)
+
+        self.hits += 1
+
+        return entry
+
+    def store(self, key, status, model=None):
+        """Store the result of a query.
+        """
+        entry = (status, model)
+
+        self._entries.pop(key, None)
+
+        self._insert(key, entry)
+
+        if self._store is not None:
+            self._store[key] = entry
+
+    def sync(self):
+        """Write the on-disk store to disk.
+        """
+        if self._store is not None:
+            self._store.sync()
+
+    def close(self):
+        """Close the on-disk store.
+        """
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Auxiliary functions
+    # ======================================================================== #
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+
+def canonicalize(declarations, constraints):
+    """Return the canonical form of a formula.
+
+    Each declared symbol referenced by the constraints is renamed to
+    'vN', where N is its order of first appearance. Constraints are
+    ordered by their *skeleton* (the constraint with every symbol
+    replaced by a placeholder) so the canonical form does not depend
+    on the names (nor the order) of the original assertions.
+
+    Returns a tuple of the form (key, names) where key is the hash of
+    the canonical form and names maps original symbol names to
+    canonical names.
+
+    """
+    def skeleton(text):
+        return _token_re.sub(lambda m: "?" if m.group(0) in declarations else m.group(0), text)
+
+    texts = sorted((str(c) for c in constraints), key=skeleton)
+
+    names = {}
+
+    def rename(match):
+        token = match.group(0)
+
+        if token not in declarations:
+            return token
+
+        if token not in names:
+            names[token] = "v%d" % len(names)
+
+        return names[token]
+
+    asserts = ["(assert %s)" % _token_re.sub(rename, text) for text in texts]
+
+    # Declarations go first, ordered by canonical name.
+    decls = []
+
+    for name, canon in sorted(names.items(), key=lambda item: int(item[1][1:])):
+        decls.append(_token_re.sub(rename, declarations[name].declaration))
+
+    canonical = "\n".join(decls + asserts)
+
+    return hashlib.sha1(canonical).hexdigest(), names
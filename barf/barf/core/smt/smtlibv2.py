@@ -28,6 +28,8 @@
 from subprocess import PIPE, Popen
 import logging
 import copy
+import select
+import time
 import weakref
 from functools import wraps
 
@@ -36,6 +38,9 @@ logger = logging.getLogger("smtlibv2")
 
 import barf
 import os
+import re
+
+from barf.core.smt.smtcache import canonicalize
 
 # logging.basicConfig( filename = barf.__path__[0] + os.sep + "log/smtlibv2.log",
 #     # filename = "system.log",
@@ -547,6 +552,75 @@ class Array(object):
         return rv
 
 #solver
+# Default timeout for check, in seconds.
+SOLVER_TIMEOUT = 120
+
+class SolverResult(object):
+
+    ''' Enumeration of solver results. Values are the answers of a
+        check-sat command (plus TIMEOUT and ERROR), so they compare equal
+        to plain strings. '''
+
+    SAT     = 'sat'
+    UNSAT   = 'unsat'
+    UNKNOWN = 'unknown'
+    TIMEOUT = 'timeout'
+    ERROR   = 'error'
+
+
+class SolverQuery(object):
+    def __init__(self, solver, timeout=None, result=None):
+        ''' A check-sat query running in the background (see check_async).
+            The handle provides the file descriptor the answer is read from,
+            so it can be waited on along with other queries from an event
+            loop (select/poll, or add_reader for asyncio loops).
+            @param solver: the solver running the query
+            @param timeout: timeout in seconds (by default, the solver timeout)
+            @param result: the result of the query, if it is already known '''
+        if timeout is None:
+            timeout = solver._timeout
+        self._solver = solver
+        self._deadline = time.time() + timeout if timeout is not None else None
+        self._result = result
+
+    def fileno(self):
+        return self._solver._proc.stdout.fileno()
+
+    def filenos(self):
+        ''' Return the file descriptors to wait on (see PortfolioQuery.) '''
+        return [self.fileno()] if self._result is None else []
+
+    def done(self):
+        ''' Return True if the query finished (it does not block.) '''
+        if self._result is None:
+            if self._solver._wait(0):
+                self._finish(self._solver._recv_status(None))
+            elif self._deadline is not None and time.time() >= self._deadline:
+                self._solver.restart()
+                self._finish(SolverResult.TIMEOUT)
+        return self._result is not None
+
+    def result(self):
+        ''' Wait for the query to finish and return its result. '''
+        if self._result is None:
+            timeout = None
+            if self._deadline is not None:
+                timeout = max(self._deadline - time.time(), 0)
+            self._finish(self._solver._recv_status(timeout))
+        return self._result
+
+    def cancel(self):
+        ''' Abandon the query (the solver process is restarted.) '''
+        if self._result is None:
+            self._solver.restart()
+            self._finish(SolverResult.UNKNOWN)
+
+    def _finish(self, result):
+        self._result = result
+        if result in (SolverResult.SAT, SolverResult.UNSAT):
+            self._solver._status = result
+
+
 class Z3Solver(object):
     def __init__(self):
         ''' Build a solver intance.
@@ -564,8 +638,15 @@ class Z3Solver(object):
         self._declarations = {} #weakref.WeakValueDictionary()
         self._constraints = set()
         self.input_symbols = list()
-        self._proc = Popen('z3 -T:120 -smt2 -in', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
-        # self._proc = Popen('z3 -t:120 -smt2 -in', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
+
+        # Optional SMT query cache (see smtcache module) and the model
+        # of the last query answered by it.
+        self._query_cache = None
+        self._model = None
+
+        # Default timeout for check, in seconds.
+        self._timeout = SOLVER_TIMEOUT
+        self._proc = Popen(['z3', '-smt2', '-in'], stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
         #self._proc = Popen('stp --SMTLIB2', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
 
         #fix for z3 declaration scopes
@@ -589,7 +670,10 @@ class Z3Solver(object):
         self._constraints = state['constraints']
         self._stack = state['stack']
         self.input_symbols = state['input_symbols']
-        self._proc = Popen('z3 -smt2 -in', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
+        self._query_cache = None
+        self._model = None
+        self._timeout = SOLVER_TIMEOUT
+        self._proc = Popen(['z3', '-smt2', '-in'], stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
         #self._proc = Popen('stp --SMTLIB2', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
 
     def reset(self, full=False):
@@ -607,7 +691,7 @@ class Z3Solver(object):
             self._declarations = {}
             self._constraints = set()
             self.input_symbols = list()
-            self._proc = Popen('z3 -t:120 -smt2 -in', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
+            self._proc = Popen(['z3', '-smt2', '-in'], stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
             #self._proc = Popen('stp --SMTLIB2', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
 
             #fix for z3 declaration scopes
@@ -616,6 +700,34 @@ class Z3Solver(object):
 
         self._send(self)
         self._status = 'unknown'
+        self._model = None
+
+    def restart(self):
+        ''' Restart the solver process (for instance, after it was killed
+            in the middle of a query) and replay the current state into it,
+            including the pushed levels. '''
+        self._proc.kill()
+        self._proc.wait()
+        self._proc = Popen(['z3', '-smt2', '-in'], stdin=PIPE, stdout=PIPE)
+        self._send("(set-option :global-decls false)")
+        self._send("(set-logic QF_AUFBV)")
+        declared = set()
+        asserted = set()
+        levels = [(declarations, constraints) for _, declarations, constraints in self._stack]
+        levels.append((self._declarations, self._constraints))
+        for index, (declarations, constraints) in enumerate(levels):
+            if index > 0:
+                self._send('(push 1)')
+            for name, var in declarations.items():
+                if name not in declared:
+                    self._send(var.declaration)
+                    declared.add(name)
+            for constraint in constraints:
+                if id(constraint) not in asserted:
+                    self._send('(assert %s)'%constraint)
+                    asserted.add(id(constraint))
+        self._status = 'unknown'
+        self._model = None
 
     def __del__(self):
         self._proc.kill()
@@ -634,7 +746,7 @@ class Z3Solver(object):
         logger.debug('>%s',cmd)
         self._proc.stdin.writelines((str(cmd),'\n'))
 
-    def _recv(self):
+    def _recv(self, raise_on_error=True):
         ''' Reads the response from the solver '''
         def readline():
             buf = self._proc.stdout.readline()
@@ -653,7 +765,7 @@ class Z3Solver(object):
             right+=r
         buf = ''.join(bufl).strip()
         logger.debug('<%s', buf)
-        if '(error' in bufl[0]:
+        if '(error' in bufl[0] and raise_on_error:
             print("Error in simplify: %s" % str(buf))
             raise Exception("Error in smtlib <"+str(self)+">")
         return buf
@@ -670,88 +782,111 @@ class Z3Solver(object):
 
     #get-all-values min max minmax
     def getallvalues(self, x, maxcnt = 30):
-        ''' Returns a list with all the possible values for the symbol x'''
+        ''' Returns a list with all the possible values for the symbol x.
+            Values are enumerated with blocking clauses. The blocking
+            clause of the last value, the check and the value request
+            are sent to the solver in a single batch, so each value
+            costs one round-trip.
+            @param x: a symbol or expression
+            @param maxcnt: maximum number of values allowed
+        '''
         assert self.check() == 'sat'
         assert type(x) is BitVec
         result = []
         self.push()
         try:
-            aux = self.mkBitVec(x.size)
+            aux = self.mkBitVec(x.size, 'V_%d'%self._get_sid())
             self.add(aux==x)
-            r = self.check()
-            val = None
-            while r != 'unsat':
-                val = self.getvalue(aux)
-                result.append( val)
-                self.add(x!=val)
-                r = self.check()
+            self._send('(check-sat)')
+            self._send('(get-value (%s))'%aux)
+            while True:
+                r = self._recv()
+                if r != 'sat':
+                    # Drain the get-value response (an error.)
+                    self._recv(raise_on_error=False)
+                    if r != 'unsat':
+                        raise Exception("solver failed %s"%r)
+                    break
+                val = _parse_value(_parse_sexpr(self._recv())[0][1])
+                result.append(val)
                 if len(result) > maxcnt:
                     raise Exception("Max number of different solutions hit")
-        except Exception as e:
-            raise e
+                self._send('(assert %s)'%(aux != val))
+                self._send('(check-sat)')
+                self._send('(get-value (%s))'%aux)
         finally:
             self.pop()
         return result
 
     def max(self, X, M=10000):
-        ''' Iterativelly finds the maximum value for a symbol.
+        ''' Finds the maximum value for a symbol by binary search over
+            its (unsigned) domain. It takes at most X.size + 1 checks.
             @param X: a symbol or expression
             @param M: maximun number of iterations allowed
         '''
         assert self.check() == 'sat'
         assert type(X) is BitVec
         self.push()
-        aux = self.mkBitVec(X.size)
-        self.add(aux==X)
         try:
-            last_value = None
+            aux = self.mkBitVec(X.size, 'V_%d'%self._get_sid())
+            self.add(aux==X)
+            last_value = self.getvalue(aux)
+            upper = (1 << X.size) - 1
             i = 0
-            while True:
-                r = self.check()
-                if r == 'unsat':
-                    if last_value != None:
-                        return last_value
+            while last_value < upper:
+                middle = (last_value + upper + 1) / 2
+                self.push()
+                try:
+                    self.add(UGE(aux, middle))
+                    r = self.check()
+                    if r == 'sat':
+                        last_value = self.getvalue(aux)
+                    elif r == 'unsat':
+                        upper = middle - 1
                     else:
-                        raise Exception("max failed")
-                elif r =='sat':
-                    last_value = self.getvalue(aux)
-                    self.add(UGT(aux,last_value))
-                    i = i + 1
-                else:
-                    raise Exception("solver failed %s"%r)
+                        raise Exception("solver failed %s"%r)
+                finally:
+                    self.pop()
+                i = i + 1
                 if (i > M):
                     raise Exception("Maximum not found, maximum number of iterations was reached")
+            return last_value
         finally:
             self.pop()
 
     def min(self, X, M=10000):
-        ''' Iterativelly finds the minimum value for a symbol.
+        ''' Finds the minimum value for a symbol by binary search over
+            its (unsigned) domain. It takes at most X.size + 1 checks.
             @param X: a symbol or expression
             @param M: maximun number of iterations allowed
         '''
         assert self.check() == 'sat'
         assert type(X) is BitVec
         self.push()
-        aux = self.mkBitVec(X.size)
-        self.add(aux==X)
         try:
-            last_value = None
+            aux = self.mkBitVec(X.size, 'V_%d'%self._get_sid())
+            self.add(aux==X)
+            last_value = self.getvalue(aux)
+            lower = 0
             i = 0
-            while True:
-                r = self.check()
-                if r == 'unsat':
-                    if last_value != None:
-                        return last_value
+            while last_value > lower:
+                middle = (lower + last_value) / 2
+                self.push()
+                try:
+                    self.add(ULE(aux, middle))
+                    r = self.check()
+                    if r == 'sat':
+                        last_value = self.getvalue(aux)
+                    elif r == 'unsat':
+                        lower = middle + 1
                     else:
-                        raise Exception("max failed")
-                elif r =='sat':
-                    last_value = self.getvalue(aux)
-                    self.add(ULT(aux,last_value))
-                    i = i + 1
-                else:
-                    raise Exception("solver failed")
+                        raise Exception("solver failed %s"%r)
+                finally:
+                    self.pop()
+                i = i + 1
                 if (i > M):
-                    raise Exception("Maximum not found, maximum number of iterations was reached")
+                    raise Exception("Minimum not found, maximum number of iterations was reached")
+            return last_value
         finally:
             self.pop()
 
@@ -778,17 +913,120 @@ class Z3Solver(object):
         self._send('(pop 1)')
         self._sid, self._declarations, self._constraints = self._stack.pop()
         self._status = 'unknown'
+        self._model = None
 
     ## UTILS: check-sat get-value simplify
-    def check(self):
-        ''' Check the satisfiability of the current state '''
+    def check(self, timeout=None):
+        ''' Check the satisfiability of the current state.
+            @param timeout: timeout in seconds (by default, the solver timeout)
+            @return: a SolverResult value '''
         if self._status is None:
             self.reset()
         if self._status == 'unknown':
-            self._send('(check-sat)')
-            self._status = self._recv()
+            if self._query_cache is not None:
+                status = self._check_cached(timeout)
+            else:
+                self._send('(check-sat)')
+                status = self._recv_status(timeout)
+            if status in (SolverResult.SAT, SolverResult.UNSAT):
+                self._status = status
+            return status
         return self._status
 
+    def check_async(self, timeout=None):
+        ''' Start checking the satisfiability of the current state without
+            waiting for the answer. The solver must not be used until the
+            query is done.
+            @param timeout: timeout in seconds (by default, the solver timeout)
+            @return: a SolverQuery handle '''
+        if self._status is None:
+            self.reset()
+        if self._status != 'unknown' or self._query_cache is not None:
+            return SolverQuery(self, timeout, self.check(timeout))
+        self._send('(check-sat)')
+        return SolverQuery(self, timeout)
+
+    def set_timeout(self, timeout):
+        ''' Set the default timeout for check.
+            @param timeout: timeout in seconds (None to wait forever) '''
+        self._timeout = timeout
+
+    def _wait(self, timeout):
+        ''' Wait for the solver to answer. Return False if it did not
+            answer within timeout seconds. '''
+        if timeout is None:
+            return True
+        return len(select.select([self._proc.stdout], [], [], max(timeout, 0))[0]) > 0
+
+    def _recv_status(self, timeout=None):
+        ''' Read the answer to a check-sat command. On timeout, the solver
+            process is restarted. '''
+        if timeout is None:
+            timeout = self._timeout
+        if not self._wait(timeout):
+            self.restart()
+            return SolverResult.TIMEOUT
+        status = self._recv(raise_on_error=False)
+        if status not in (SolverResult.SAT, SolverResult.UNSAT, SolverResult.UNKNOWN):
+            logger.error('Unexpected answer to check-sat: %s', status)
+            if not status:
+                # The solver process died.
+                self.restart()
+            return SolverResult.ERROR
+        return status
+
+    def set_query_cache(self, cache):
+        ''' Set a query cache (SmtQueryCache) in front of the solver.
+            @param cache: a SmtQueryCache instance or None to disable it '''
+        self._query_cache = cache
+        self._model = None
+
+    def _check_cached(self, timeout=None):
+        ''' Check the satisfiability of the current state through the
+            query cache. Satisfiable results are stored along with a
+            model of the (bitvector) symbols of the formula. '''
+        key, names = canonicalize(self._declarations, self._constraints)
+        entry = self._query_cache.lookup(key)
+        if entry is not None:
+            status, model = entry
+            if status == 'sat':
+                self._model = dict((name, model[canon]) for name, canon in names.items() if canon in model)
+            return status
+        self._send('(check-sat)')
+        status = self._recv_status(timeout)
+        model = None
+        if status == 'sat':
+            bv_names = [name for name in names if type(self._declarations[name]) is BitVec]
+            values = self._getvalues([self._declarations[name] for name in bv_names])
+            model = dict((names[name], value) for name, value in zip(bv_names, values))
+        if status in ('sat', 'unsat'):
+            self._query_cache.store(key, status, model)
+        return status
+
+    def _getvalues_from_model(self, vals):
+        ''' Return the values of vals in the model of the last query
+            answered by the cache. The solver is asked to evaluate
+            expressions under that same model. '''
+        missing = [val for val in vals if str(val) not in self._model]
+        if missing:
+            self._send('(push 1)')
+            for name, value in self._model.items():
+                self._send('(assert (= %s %s))'%(name, self._declarations[name].cast(value)))
+            self._send('(check-sat)')
+            assert self._recv() == 'sat'
+            values = dict(zip(map(str, missing), self._getvalues(missing)))
+            self._send('(pop 1)')
+        return [self._model[str(val)] if str(val) in self._model else values[str(val)] for val in vals]
+
+    def _getvalues(self, vals):
+        ''' Ask the solver for the values of a list of expressions in a
+            single get-value command. '''
+        if not vals:
+            return []
+        self._send('(get-value (%s))'%' '.join(map(str, vals)))
+        ret = self._recv()
+        return [_parse_value(value) for _, value in _parse_sexpr(ret)]
+
     def getvalue(self, val):
         ''' Ask the solver for one possible assigment for val using currrent set
             of constraints.
@@ -797,6 +1035,8 @@ class Z3Solver(object):
         if isconcrete(val):
             return val
         assert self.check() == 'sat'
+        if self._model is not None:
+            return self._getvalues_from_model([val])[0]
         self._send('(get-value (%s))'%val)
         ret = self._recv()
         assert ret.startswith('((') and ret.endswith('))')
@@ -810,11 +1050,30 @@ class Z3Solver(object):
         val = self._declarations[name]
 
         assert self.check() == 'sat'
+        if self._model is not None:
+            return self._getvalues_from_model([val])[0]
         self._send('(get-value (%s))'%val)
         ret = self._recv()
         assert ret.startswith('((') and ret.endswith('))')
         return int(ret.split(' ')[-1][2:-2],16)
 
+    def getvalues(self, vals):
+        ''' Ask the solver for one possible assigment for each expression
+            in vals using current set of constraints. All the values are
+            retrieved with a single get-value command.
+            The current set of assertions must be sat.
+            @param vals: a list of expressions, symbols or symbol names '''
+        vals = [self._declarations[val] if isinstance(val, str) else val for val in vals]
+        symbolic = [val for val in vals if not isconcrete(val)]
+        if symbolic:
+            assert self.check() == 'sat'
+            if self._model is not None:
+                values = self._getvalues_from_model(symbolic)
+            else:
+                values = self._getvalues(symbolic)
+            values = iter(values)
+        return [val if isconcrete(val) else next(values) for val in vals]
+
     def simplify(self, val):
         ''' Ask the solver to try to simplify the expression val.
             This works only with z3.
@@ -914,6 +1173,7 @@ class Z3Solver(object):
         self._send('(assert %s)'%constraint)
         self._constraints.add(constraint)
         self._status = 'unknown'
+        self._model = None
         #assert self.check() != 'unsat', "Impossible constraint asserted"
 
     @property
@@ -942,7 +1202,15 @@ class CVC4Solver(object):
         self._constraints = set()
         self.input_symbols = list()
 
-        self._proc = Popen('cvc4 --incremental --lang=smt2', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
+        # Optional SMT query cache (see smtcache module) and the model
+        # of the last query answered by it.
+        self._query_cache = None
+        self._model = None
+
+        # Default timeout for check, in seconds.
+        self._timeout = SOLVER_TIMEOUT
+
+        self._proc = Popen(['cvc4', '--incremental', '--lang=smt2'], stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
 
         # self._proc = Popen('z3 -t:120 -smt2 -in', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
         #self._proc = Popen('stp --SMTLIB2', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
@@ -970,16 +1238,19 @@ class CVC4Solver(object):
         self._constraints = state['constraints']
         self._stack = state['stack']
         self.input_symbols = state['input_symbols']
-        #self._proc = Popen('z3 -smt2 -in', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
+        self._query_cache = None
+        self._model = None
+        self._timeout = SOLVER_TIMEOUT
+        #self._proc = Popen(['z3', '-smt2', '-in'], stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
         #self._proc = Popen('stp --SMTLIB2', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
-        self._proc = Popen('cvc4 --incremental --lang=smt2', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
+        self._proc = Popen(['cvc4', '--incremental', '--lang=smt2'], stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
 
     def reset(self, full=False):
         self._proc.kill()
         self._proc.wait()
         self._proc = None
 
-        self._proc = Popen('cvc4 --incremental --lang=smt2', shell=True, stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
+        self._proc = Popen(['cvc4', '--incremental', '--lang=smt2'], stdin=PIPE, stdout=PIPE)        #'stp --SMTLIB2'
         # self._proc = Popen('z3 -t:120 -smt2 -in', shell=True, stdin=PIPE, stdout=PIPE)        # 'stp --SMTLIB2'
         # self._proc = Popen('stp --SMTLIB2', shell=True, stdin=PIPE, stdout=PIPE)              # 'stp --SMTLIB2'
 
@@ -999,6 +1270,34 @@ class CVC4Solver(object):
 
         self._send(self)
         self._status = 'unknown'
+        self._model = None
+
+    def restart(self):
+        ''' Restart the solver process (for instance, after it was killed
+            in the middle of a query) and replay the current state into it,
+            including the pushed levels. '''
+        self._proc.kill()
+        self._proc.wait()
+        self._proc = Popen(['cvc4', '--incremental', '--lang=smt2'], stdin=PIPE, stdout=PIPE)
+        self._send("(set-logic QF_AUFBV)")
+        self._send("(set-option :produce-models true)")
+        declared = set()
+        asserted = set()
+        levels = [(declarations, constraints) for _, declarations, constraints in self._stack]
+        levels.append((self._declarations, self._constraints))
+        for index, (declarations, constraints) in enumerate(levels):
+            if index > 0:
+                self._send('(push 1)')
+            for name, var in declarations.items():
+                if name not in declared:
+                    self._send(var.declaration)
+                    declared.add(name)
+            for constraint in constraints:
+                if id(constraint) not in asserted:
+                    self._send('(assert %s)'%constraint)
+                    asserted.add(id(constraint))
+        self._status = 'unknown'
+        self._model = None
 
     def __del__(self):
         self._proc.kill()
@@ -1017,7 +1316,7 @@ class CVC4Solver(object):
         logger.debug('>%s',cmd)
         self._proc.stdin.writelines((str(cmd),'\n'))
 
-    def _recv(self):
+    def _recv(self, raise_on_error=True):
         ''' Reads the response from the solver '''
         def readline():
             buf = self._proc.stdout.readline()
@@ -1036,7 +1335,7 @@ class CVC4Solver(object):
             right+=r
         buf = ''.join(bufl).strip()
         logger.debug('<%s', buf)
-        if '(error' in bufl[0]:
+        if '(error' in bufl[0] and raise_on_error:
             print("Error in simplify: %s" % str(buf))
             raise Exception("Error in smtlib <"+str(self)+">")
         return buf
@@ -1053,88 +1352,111 @@ class CVC4Solver(object):
 
     #get-all-values min max minmax
     def getallvalues(self, x, maxcnt = 30):
-        ''' Returns a list with all the possible values for the symbol x'''
+        ''' Returns a list with all the possible values for the symbol x.
+            Values are enumerated with blocking clauses. The blocking
+            clause of the last value, the check and the value request
+            are sent to the solver in a single batch, so each value
+            costs one round-trip.
+            @param x: a symbol or expression
+            @param maxcnt: maximum number of values allowed
+        '''
         assert self.check() == 'sat'
         assert type(x) is BitVec
         result = []
         self.push()
         try:
-            aux = self.mkBitVec(x.size)
+            aux = self.mkBitVec(x.size, 'V_%d'%self._get_sid())
             self.add(aux==x)
-            r = self.check()
-            val = None
-            while r != 'unsat':
-                val = self.getvalue(aux)
-                result.append( val)
-                self.add(x!=val)
-                r = self.check()
+            self._send('(check-sat)')
+            self._send('(get-value (%s))'%aux)
+            while True:
+                r = self._recv()
+                if r != 'sat':
+                    # Drain the get-value response (an error.)
+                    self._recv(raise_on_error=False)
+                    if r != 'unsat':
+                        raise Exception("solver failed %s"%r)
+                    break
+                val = _parse_value(_parse_sexpr(self._recv())[0][1])
+                result.append(val)
                 if len(result) > maxcnt:
                     raise Exception("Max number of different solutions hit")
-        except Exception as e:
-            raise e
+                self._send('(assert %s)'%(aux != val))
+                self._send('(check-sat)')
+                self._send('(get-value (%s))'%aux)
         finally:
             self.pop()
         return result
 
     def max(self, X, M=10000):
-        ''' Iterativelly finds the maximum value for a symbol.
+        ''' Finds the maximum value for a symbol by binary search over
+            its (unsigned) domain. It takes at most X.size + 1 checks.
             @param X: a symbol or expression
             @param M: maximun number of iterations allowed
         '''
         assert self.check() == 'sat'
         assert type(X) is BitVec
         self.push()
-        aux = self.mkBitVec(X.size)
-        self.add(aux==X)
         try:
-            last_value = None
+            aux = self.mkBitVec(X.size, 'V_%d'%self._get_sid())
+            self.add(aux==X)
+            last_value = self.getvalue(aux)
+            upper = (1 << X.size) - 1
             i = 0
-            while True:
-                r = self.check()
-                if r == 'unsat':
-                    if last_value != None:
-                        return last_value
+            while last_value < upper:
+                middle = (last_value + upper + 1) / 2
+                self.push()
+                try:
+                    self.add(UGE(aux, middle))
+                    r = self.check()
+                    if r == 'sat':
+                        last_value = self.getvalue(aux)
+                    elif r == 'unsat':
+                        upper = middle - 1
                     else:
-                        raise Exception("max failed")
-                elif r =='sat':
-                    last_value = self.getvalue(aux)
-                    self.add(UGT(aux,last_value))
-                    i = i + 1
-                else:
-                    raise Exception("solver failed %s"%r)
+                        raise Exception("solver failed %s"%r)
+                finally:
+                    self.pop()
+                i = i + 1
                 if (i > M):
                     raise Exception("Maximum not found, maximum number of iterations was reached")
+            return last_value
         finally:
             self.pop()
 
     def min(self, X, M=10000):
-        ''' Iterativelly finds the minimum value for a symbol.
+        ''' Finds the minimum value for a symbol by binary search over
+            its (unsigned) domain. It takes at most X.size + 1 checks.
             @param X: a symbol or expression
             @param M: maximun number of iterations allowed
         '''
         assert self.check() == 'sat'
         assert type(X) is BitVec
         self.push()
-        aux = self.mkBitVec(X.size)
-        self.add(aux==X)
         try:
-            last_value = None
+            aux = self.mkBitVec(X.size, 'V_%d'%self._get_sid())
+            self.add(aux==X)
+            last_value = self.getvalue(aux)
+            lower = 0
             i = 0
-            while True:
-                r = self.check()
-                if r == 'unsat':
-                    if last_value != None:
-                        return last_value
+            while last_value > lower:
+                middle = (lower + last_value) / 2
+                self.push()
+                try:
+                    self.add(ULE(aux, middle))
+                    r = self.check()
+                    if r == 'sat':
+                        last_value = self.getvalue(aux)
+                    elif r == 'unsat':
+                        lower = middle + 1
                     else:
-                        raise Exception("max failed")
-                elif r =='sat':
-                    last_value = self.getvalue(aux)
-                    self.add(ULT(aux,last_value))
-                    i = i + 1
-                else:
-                    raise Exception("solver failed")
+                        raise Exception("solver failed %s"%r)
+                finally:
+                    self.pop()
+                i = i + 1
                 if (i > M):
-                    raise Exception("Maximum not found, maximum number of iterations was reached")
+                    raise Exception("Minimum not found, maximum number of iterations was reached")
+            return last_value
         finally:
             self.pop()
 
@@ -1161,17 +1483,120 @@ class CVC4Solver(object):
         self._send('(pop 1)')
         self._sid, self._declarations, self._constraints = self._stack.pop()
         self._status = 'unknown'
+        self._model = None
 
     ## UTILS: check-sat get-value simplify
-    def check(self):
-        ''' Check the satisfiability of the current state '''
+    def check(self, timeout=None):
+        ''' Check the satisfiability of the current state.
+            @param timeout: timeout in seconds (by default, the solver timeout)
+            @return: a SolverResult value '''
         if self._status is None:
             self.reset()
         if self._status == 'unknown':
-            self._send('(check-sat)')
-            self._status = self._recv()
+            if self._query_cache is not None:
+                status = self._check_cached(timeout)
+            else:
+                self._send('(check-sat)')
+                status = self._recv_status(timeout)
+            if status in (SolverResult.SAT, SolverResult.UNSAT):
+                self._status = status
+            return status
         return self._status
 
+    def check_async(self, timeout=None):
+        ''' Start checking the satisfiability of the current state without
+            waiting for the answer. The solver must not be used until the
+            query is done.
+            @param timeout: timeout in seconds (by default, the solver timeout)
+            @return: a SolverQuery handle '''
+        if self._status is None:
+            self.reset()
+        if self._status != 'unknown' or self._query_cache is not None:
+            return SolverQuery(self, timeout, self.check(timeout))
+        self._send('(check-sat)')
+        return SolverQuery(self, timeout)
+
+    def set_timeout(self, timeout):
+        ''' Set the default timeout for check.
+            @param timeout: timeout in seconds (None to wait forever) '''
+        self._timeout = timeout
+
+    def _wait(self, timeout):
+        ''' Wait for the solver to answer. Return False if it did not
+            answer within timeout seconds. '''
+        if timeout is None:
+            return True
+        return len(select.select([self._proc.stdout], [], [], max(timeout, 0))[0]) > 0
+
+    def _recv_status(self, timeout=None):
+        ''' Read the answer to a check-sat command. On timeout, the solver
+            process is restarted. '''
+        if timeout is None:
+            timeout = self._timeout
+        if not self._wait(timeout):
+            self.restart()
+            return SolverResult.TIMEOUT
+        status = self._recv(raise_on_error=False)
+        if status not in (SolverResult.SAT, SolverResult.UNSAT, SolverResult.UNKNOWN):
+            logger.error('Unexpected answer to check-sat: %s', status)
+            if not status:
+                # The solver process died.
+                self.restart()
+            return SolverResult.ERROR
+        return status
+
+    def set_query_cache(self, cache):
+        ''' Set a query cache (SmtQueryCache) in front of the solver.
+            @param cache: a SmtQueryCache instance or None to disable it '''
+        self._query_cache = cache
+        self._model = None
+
+    def _check_cached(self, timeout=None):
+        ''' Check the satisfiability of the current state through the
+            query cache. Satisfiable results are stored along with a
+            model of the (bitvector) symbols of the formula. '''
+        key, names = canonicalize(self._declarations, self._constraints)
+        entry = self._query_cache.lookup(key)
+        if entry is not None:
+            status, model = entry
+            if status == 'sat':
+                self._model = dict((name, model[canon]) for name, canon in names.items() if canon in model)
+            return status
+        self._send('(check-sat)')
+        status = self._recv_status(timeout)
+        model = None
+        if status == 'sat':
+            bv_names = [name for name in names if type(self._declarations[name]) is BitVec]
+            values = self._getvalues([self._declarations[name] for name in bv_names])
+            model = dict((names[name], value) for name, value in zip(bv_names, values))
+        if status in ('sat', 'unsat'):
+            self._query_cache.store(key, status, model)
+        return status
+
+    def _getvalues_from_model(self, vals):
+        ''' Return the values of vals in the model of the last query
+            answered by the cache. The solver is asked to evaluate
+            expressions under that same model. '''
+        missing = [val for val in vals if str(val) not in self._model]
+        if missing:
+            self._send('(push 1)')
+            for name, value in self._model.items():
+                self._send('(assert (= %s %s))'%(name, self._declarations[name].cast(value)))
+            self._send('(check-sat)')
+            assert self._recv() == 'sat'
+            values = dict(zip(map(str, missing), self._getvalues(missing)))
+            self._send('(pop 1)')
+        return [self._model[str(val)] if str(val) in self._model else values[str(val)] for val in vals]
+
+    def _getvalues(self, vals):
+        ''' Ask the solver for the values of a list of expressions in a
+            single get-value command. '''
+        if not vals:
+            return []
+        self._send('(get-value (%s))'%' '.join(map(str, vals)))
+        ret = self._recv()
+        return [_parse_value(value) for _, value in _parse_sexpr(ret)]
+
     def getvalue(self, val):
         ''' Ask the solver for one possible assigment for val using currrent set
             of constraints.
@@ -1180,6 +1605,8 @@ class CVC4Solver(object):
         if isconcrete(val):
             return val
         assert self.check() == 'sat'
+        if self._model is not None:
+            return self._getvalues_from_model([val])[0]
         self._send('(get-value (%s))'%val)
         ret = self._recv()
         assert ret.startswith('((') and ret.endswith('))')
@@ -1211,6 +1638,8 @@ class CVC4Solver(object):
         val = self._declarations[name]
 
         assert self.check() == 'sat'
+        if self._model is not None:
+            return self._getvalues_from_model([val])[0]
         self._send('(get-value (%s))'%val)
         ret = self._recv()
         assert ret.startswith('((') and ret.endswith('))')
@@ -1227,6 +1656,23 @@ class CVC4Solver(object):
 
         return value
 
+    def getvalues(self, vals):
+        ''' Ask the solver for one possible assigment for each expression
+            in vals using current set of constraints. All the values are
+            retrieved with a single get-value command.
+            The current set of assertions must be sat.
+            @param vals: a list of expressions, symbols or symbol names '''
+        vals = [self._declarations[val] if isinstance(val, str) else val for val in vals]
+        symbolic = [val for val in vals if not isconcrete(val)]
+        if symbolic:
+            assert self.check() == 'sat'
+            if self._model is not None:
+                values = self._getvalues_from_model(symbolic)
+            else:
+                values = self._getvalues(symbolic)
+            values = iter(values)
+        return [val if isconcrete(val) else next(values) for val in vals]
+
     def simplify(self, val):
         ''' Ask the solver to try to simplify the expression val.
             This works only with z3.
@@ -1326,6 +1772,7 @@ class CVC4Solver(object):
         self._send('(assert %s)'%constraint)
         self._constraints.add(constraint)
         self._status = 'unknown'
+        self._model = None
         #assert self.check() != 'unsat', "Impossible constraint asserted"
 
     @property
@@ -1335,10 +1782,323 @@ class CVC4Solver(object):
             constraints.append('(assert %s)'%c)
         return constraints
 
+# -------------------------------------------------------------------------------
+# Number of races a backend has to have run for a query shape before queries
+# of that shape are routed to the usually-faster backend.
+PORTFOLIO_MIN_RACES = 8
+
+# Fraction of the races a backend has to win to get queries routed to it.
+PORTFOLIO_ROUTE_RATIO = 0.75
+
+# Routed queries are raced anyway once every this many queries, so the
+# statistics keep up with changes in the workload.
+PORTFOLIO_RACE_INTERVAL = 16
+
+class PortfolioQuery(object):
+    def __init__(self, portfolio, shape, indexes, timeout=None, fallback=(), result=None):
+        ''' A check-sat query raced by the backends of a portfolio (see
+            PortfolioSolver.check_async). The first definitive answer
+            (sat/unsat) wins and the other backends are cancelled. The
+            handle can be waited on along with other queries from an event
+            loop through the file descriptors of the backends still running
+            (filenos).
+            @param portfolio: the portfolio running the query
+            @param shape: the shape of the query (see PortfolioSolver)
+            @param indexes: the backends to race
+            @param timeout: timeout in seconds (by default, the solvers timeout)
+            @param fallback: the backends to race if none of the first ones
+                   gives a definitive answer
+            @param result: the result of the query, if it is already known '''
+        self._portfolio = portfolio
+        self._shape = shape
+        self._timeout = timeout
+        self._fallback = list(fallback)
+        self._result = result
+
+        # Running backend queries (by backend index), whether they race
+        # (more than one backend) and the last answer received.
+        self._queries = {}
+        self._raced = False
+        self._status = SolverResult.UNKNOWN
+
+        if result is None:
+            self._start(indexes)
+
+    def filenos(self):
+        ''' Return the file descriptors of the backends still running. '''
+        return [query.fileno() for query in self._queries.values()]
+
+    def done(self):
+        ''' Return True if the query finished (it does not block.) '''
+        if self._result is None:
+            self._poll()
+        return self._result is not None
+
+    def result(self):
+        ''' Wait for the query to finish and return its result. '''
+        while not self.done():
+            # Wait for an answer or the first deadline.
+            deadlines = [query._deadline for query in self._queries.values() if query._deadline is not None]
+            wait = max(min(deadlines) - time.time(), 0) if deadlines else None
+            select.select(self.filenos(), [], [], wait)
+        return self._result
+
+    def cancel(self):
+        ''' Abandon the query (the running backends are restarted.) '''
+        if self._result is None:
+            self._stop()
+            self._result = SolverResult.UNKNOWN
+
+    def _start(self, indexes):
+        self._raced = len(indexes) > 1
+        for index in indexes:
+            self._queries[index] = self._portfolio._solvers[index].check_async(self._timeout)
+
+    def _stop(self):
+        for query in self._queries.values():
+            query.cancel()
+        self._queries = {}
+
+    def _poll(self):
+        for index, query in self._queries.items():
+            if not query.done():
+                continue
+            del self._queries[index]
+            self._status = query.result()
+            if self._status in (SolverResult.SAT, SolverResult.UNSAT):
+                self._finish(index)
+                return
+        if not self._queries:
+            if self._fallback:
+                self._start(self._fallback)
+                self._fallback = []
+                self._poll()
+            else:
+                self._finish(None)
+
+    def _finish(self, winner):
+        # Cancel the backends that are still running.
+        self._stop()
+        self._result = self._status
+        self._portfolio._record(self._shape, winner, self._status, self._raced)
+
+
+class PortfolioSolver(object):
+    def __init__(self, solvers=None):
+        ''' Build a portfolio of solvers.
+            Every declaration and assertion is forwarded to all the solvers
+            (backends). On check, the backends race: the first definitive
+            answer (sat/unsat) is returned and the others are cancelled (their
+            processes are killed and restarted with the current state.)
+            Wins are recorded by query shape (whether the formula uses arrays
+            and its size) and, once a backend usually wins for a shape, queries
+            of that shape are routed to it.
+            @param solvers: a list of solvers (by default, Z3 and CVC4) '''
+        if solvers is None:
+            solvers = [Z3Solver(), CVC4Solver()]
+        self._solvers = solvers
+        self._status = 'unknown'
+
+        # Backend that answered the last check (the one that holds the model.)
+        self._winner = 0
+
+        # Query shape tracking: whether arrays are used and the number of
+        # assertions, saved on push.
+        self._arrays = False
+        self._size = 0
+        self._stack = []
+
+        # Win statistics (shape -> wins per backend) and number of queries
+        # by shape.
+        self._wins = {}
+        self._queries = {}
+
+    @property
+    def _declarations(self):
+        return self._solvers[0]._declarations
+
+    @property
+    def win_stats(self):
+        ''' Win statistics, indexed by query shape. '''
+        return dict((shape, list(wins)) for shape, wins in self._wins.items())
+
+    def __str__(self):
+        return str(self._solvers[0])
+
+    def reset(self, full=False):
+        for solver in self._solvers:
+            solver.reset(full)
+        if full:
+            self._arrays = False
+            self._size = 0
+            self._stack = []
+        self._status = 'unknown'
+
+    def set_query_cache(self, cache):
+        for solver in self._solvers:
+            solver.set_query_cache(cache)
+
+    # push pop
+    def push(self):
+        for solver in self._solvers:
+            solver.push()
+        self._stack.append((self._arrays, self._size))
+
+    def pop(self):
+        for solver in self._solvers:
+            solver.pop()
+        self._arrays, self._size = self._stack.pop()
+        self._status = 'unknown'
+
+    ## declarations
+    def mkBitVec(self, size, name='V', is_input=False):
+        return [solver.mkBitVec(size, name, is_input) for solver in self._solvers][0]
+
+    def mkArray(self, size=32, name='A', is_input=False, max_size=100):
+        return [solver.mkArray(size, name, is_input, max_size) for solver in self._solvers][0]
+
+    def mkArrayNew(self, size=32, name='A', is_input=False, max_size=100):
+        return self._solvers[0].mkArrayNew(size, name, is_input, max_size)
+
+    def mkBool(self, name='B', is_input=False):
+        return [solver.mkBool(name, is_input) for solver in self._solvers][0]
+
+    @property
+    def declarations(self):
+        return self._solvers[0].declarations
+
+    #assertions
+    def add(self, constraint):
+        for solver in self._solvers:
+            solver.add(constraint)
+        if not isinstance(constraint, bool):
+            value = str(constraint)
+            self._arrays = self._arrays or 'select' in value or 'store' in value
+            self._size += 1
+        self._status = 'unknown'
+
+    @property
+    def constraints(self):
+        return self._solvers[0].constraints
+
+    ## check-sat
+    def check(self, timeout=None):
+        ''' Check the satisfiability of the current state, racing the
+            backends.
+            @param timeout: timeout in seconds (by default, the solvers timeout)
+            @return: a SolverResult value '''
+        return self.check_async(timeout).result()
+
+    def check_async(self, timeout=None):
+        ''' Start racing the backends on the current state without waiting
+            for the answer. The solver must not be used until the query is
+            done.
+            @param timeout: timeout in seconds (by default, the solvers timeout)
+            @return: a PortfolioQuery handle '''
+        if self._status in (SolverResult.SAT, SolverResult.UNSAT):
+            return PortfolioQuery(self, None, [], timeout, result=self._status)
+        shape = self._get_shape()
+        count = self._queries.get(shape, 0)
+        self._queries[shape] = count + 1
+        indexes = range(len(self._solvers))
+        routed = self._get_route(shape)
+        if routed is not None and count % PORTFOLIO_RACE_INTERVAL != 0:
+            indexes.remove(routed)
+            return PortfolioQuery(self, shape, [routed], timeout, indexes)
+        return PortfolioQuery(self, shape, indexes, timeout)
+
+    def set_timeout(self, timeout):
+        for solver in self._solvers:
+            solver.set_timeout(timeout)
+
+    def _get_shape(self):
+        ''' Return the shape of the current query: whether it uses arrays
+            and its size (as a power of two). '''
+        return ('array' if self._arrays else 'bv', len(bin(self._size)) - 2)
+
+    def _get_route(self, shape):
+        ''' Return the index of the backend queries of a given shape are
+            routed to, or None if they have to be raced. '''
+        wins = self._wins.get(shape, None)
+        if wins is None or sum(wins) < PORTFOLIO_MIN_RACES:
+            return None
+        best = max(range(len(wins)), key=lambda index: wins[index])
+        if wins[best] < PORTFOLIO_ROUTE_RATIO * sum(wins):
+            return None
+        return best
+
+    def _record(self, shape, winner, status, raced):
+        ''' Record the answer of a query: the backend that holds the model
+            and, if the backends raced, the win statistics. '''
+        if winner is not None:
+            self._winner = winner
+            if raced:
+                wins = self._wins.setdefault(shape, [0] * len(self._solvers))
+                wins[winner] += 1
+        if status in (SolverResult.SAT, SolverResult.UNSAT):
+            self._status = status
+
+    ## get-value (answered by the backend that won the last check)
+    def getvalue(self, val):
+        self.check()
+        return self._solvers[self._winner].getvalue(val)
+
+    def getvaluebyname(self, name):
+        self.check()
+        return self._solvers[self._winner].getvaluebyname(name)
+
+    def getvalues(self, vals):
+        self.check()
+        return self._solvers[self._winner].getvalues(vals)
+
+    def getallvalues(self, x, maxcnt=30):
+        self.check()
+        return self._solvers[self._winner].getallvalues(x, maxcnt)
+
+    def max(self, X, M=10000):
+        self.check()
+        return self._solvers[self._winner].max(X, M)
+
+    def min(self, X, M=10000):
+        self.check()
+        return self._solvers[self._winner].min(X, M)
+
+    def minmax(self, x, iters=10000):
+        self.check()
+        return self._solvers[self._winner].minmax(x, iters)
+
+    def simplify(self, val):
+        return self._solvers[0].simplify(val)
+
 #-------------------------------------------------------------------------------
 
 #####################################
 
+def _parse_sexpr(text):
+    ''' Parse a s-expression into nested lists of tokens. '''
+    stack = [[]]
+    for token in re.findall(r'\(|\)|[^\s()]+', text):
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            expr = stack.pop()
+            stack[-1].append(expr)
+        else:
+            stack[-1].append(token)
+    return stack[0][0]
+
+def _parse_value(value):
+    ''' Convert a SMTLIB literal (#x.., #b.., (_ bvN size), true, false)
+        to a python value. '''
+    if isinstance(value, list):
+        assert value[0] == '_' and value[1].startswith('bv')
+        return int(value[1][2:])
+    if value.startswith('#x'):
+        return int(value[2:], 16)
+    if value.startswith('#b'):
+        return int(value[2:], 2)
+    return {'true':True, 'false':False}[value]
+
 def issymbolic(x):
     return isinstance(x, Symbol)
 
@@ -21,9 +21,25 @@ solver:
 (declare-fun t2_0 () (_ BitVec 32))
 (assert (= t2_0 (bvadd t1_0 t2_0)))
 
+Memory is encoded, by default, as an SMT array (MEMORY_MODE_ARRAY). In
+MEMORY_MODE_HYBRID mode, bytes accessed through concrete addresses
+(immediates or registers whose value is known by constant propagation)
+are tracked as plain bitvector expressions, and array theory is used
+only when a symbolic address is accessed or the memory array is
+requested (**get_memory**, **get_memory_init**).
+
+Sequences of instructions can be translated with **translate_sequence**,
+which caches the translation of each sequence (by content) as a template
+relative to the current version of each variable. Translating the same
+sequence again only requires renaming the variables of the template.
+
 """
+import copy
+import re
 import traceback
 
+from collections import OrderedDict
+
 import barf.core.smt.smtlibv2 as smtlibv2
 
 from barf.core.reil.reil import ReilImmediateOperand
@@ -31,6 +47,16 @@ from barf.core.reil.reil import ReilMnemonic
 from barf.core.reil.reil import ReilRegisterOperand
 from barf.utils.utils import VariableNamer
 
+# Memory encoding modes.
+MEMORY_MODE_ARRAY  = 0
+MEMORY_MODE_HYBRID = 1
+
+# Maximum number of instruction sequences translations kept in cache.
+SEQUENCE_CACHE_SIZE = 4096
+
+# Regular expression that matches a SMTLIB token.
+_token_re = re.compile(r"[^\s()]+")
+
 class SmtTranslator(object):
 
     """SMT Translator. This class provides functionalities for REIL to
@@ -92,12 +118,56 @@ class SmtTranslator(object):
         self._arch_regs_size = {}
         self._reg_access_mapper = {}
 
+        # Memory encoding mode.
+        self._memory_mode = MEMORY_MODE_ARRAY
+
+        # Hybrid memory mode state:
+        # * Bytes written through concrete addresses, not yet stored in
+        #   the memory array (address -> byte expression.)
+        self._mem_bytes = {}
+
+        # * Bytes read through concrete addresses before the memory
+        #   array was used (address -> byte variable.) They are linked
+        #   to the array when it is used.
+        self._mem_loads = {}
+
+        # * Whether the memory array is in use.
+        self._mem_used = False
+
+        # * Known values of variables (variable name -> value.)
+        self._const_values = {}
+
+        # Instruction sequences translations cache (sequence -> template.)
+        self._sequence_cache = OrderedDict()
+
+        # Constant folding operations (used in hybrid memory mode.)
+        self._const_folders = {
+            ReilMnemonic.ADD : lambda x, y: x + y,
+            ReilMnemonic.SUB : lambda x, y: x - y,
+            ReilMnemonic.MUL : lambda x, y: x * y,
+            ReilMnemonic.AND : lambda x, y: x & y,
+            ReilMnemonic.OR  : lambda x, y: x | y,
+            ReilMnemonic.XOR : lambda x, y: x ^ y,
+        }
+
     def translate(self, instr):
         """Return the SMT representation of a REIL instruction.
         """
         try:
             translator = self._instr_translators[instr.mnemonic]
 
+            if self._memory_mode == MEMORY_MODE_HYBRID:
+                value = self._fold_constant(instr)
+
+                exprs = translator(*instr.operands)
+
+                if value is not None:
+                    var_name = self._get_var_name(instr.operands[2].name)
+
+                    self._const_values[var_name] = value
+
+                return exprs
+
             return translator(*instr.operands)
         except Exception as reason:
             print "[E] SMT Translator error : '%s' (%s)" % (instr, reason)
@@ -105,6 +175,41 @@ class SmtTranslator(object):
             print traceback.format_exc()
             raise Exception(reason)
 
+    def translate_sequence(self, instrs):
+        """Return the SMT representation of a sequence of REIL
+        instructions, along with the memory accesses it performs as a
+        list of (mnemonic, address) tuples (LDM and STM instructions.)
+
+        """
+        # Concrete memory tracking (hybrid memory mode) depends on the
+        # state of the translator, so sequences are not cached.
+        if self._memory_mode != MEMORY_MODE_ARRAY or \
+            str(self._mem.array) != self._mem.name:
+            return self._translate_sequence(instrs)
+
+        key = tuple((instr.mnemonic, tuple((type(oprnd), str(oprnd), oprnd.size) for oprnd in instr.operands)) for instr in instrs)
+
+        template = self._sequence_cache.pop(key, None)
+
+        if template is None:
+            versions = self._get_versions()
+
+            exprs, accesses = self._translate_sequence(instrs)
+
+            template = self._build_template(versions, exprs, accesses)
+
+            if template is not None:
+                self._sequence_cache[key] = template
+
+                while len(self._sequence_cache) > SEQUENCE_CACHE_SIZE:
+                    self._sequence_cache.popitem(last=False)
+
+            return exprs, accesses
+
+        self._sequence_cache[key] = template
+
+        return self._instantiate_template(template)
+
     def get_init_name(self, name):
         """Get initial name of symbol.
         """
@@ -119,16 +224,93 @@ class SmtTranslator(object):
 
         return self._var_name_mappers[name].get_current()
 
+    def get_init_names(self):
+        """Get initial names of the architecture registers referenced so
+        far (register name -> initial name.)
+
+        """
+        return dict((name, namer.get_init()) for name, namer in self._var_name_mappers.items()
+            if name in self._arch_regs_size)
+
     def get_memory(self):
         """Get SMT memory representation.
+
+        In hybrid memory mode, pending memory constraints are asserted
+        in the SMT solver (see **flush_memory**.)
+
         """
+        for constr in self.flush_memory():
+            self._solver.add(constr)
+
         return self._mem
 
     def get_memory_init(self):
         """Get SMT memory representation.
         """
+        for constr in self.flush_memory():
+            self._solver.add(constr)
+
         return self._mem_init
 
+    def flush_memory(self):
+        """Move memory bytes tracked as bitvectors (hybrid memory mode)
+        to the memory array, and return the constraints that reflect it.
+        From then on, the memory array is in use.
+
+        """
+        if self._memory_mode != MEMORY_MODE_HYBRID:
+            return []
+
+        # Link bytes read before the memory array was used with it (no
+        # store was applied to it so far.)
+        constrs = [self._mem[addr] == var for addr, var in sorted(self._mem_loads.items())]
+
+        if self._mem_bytes:
+            for addr, value in sorted(self._mem_bytes.items()):
+                self._mem[addr] = value
+
+            constrs += [self._new_memory_version()]
+
+        self._mem_loads = {}
+        self._mem_bytes = {}
+        self._mem_used = True
+
+        return constrs
+
+    def set_memory_mode(self, mode):
+        """Set memory encoding mode (MEMORY_MODE_ARRAY or
+        MEMORY_MODE_HYBRID.)
+
+        """
+        self._memory_mode = mode
+
+    def save_state(self):
+        """Return a snapshot of the variables versions and the memory
+        state. It allows to translate different continuations of a
+        sequence of instructions (see **restore_state**.)
+
+        """
+        namers = dict((name, copy.copy(namer)) for name, namer in self._var_name_mappers.items())
+
+        return (namers, copy.copy(self._mem), self._mem_instance,
+            dict(self._mem_bytes), dict(self._mem_loads), self._mem_used,
+            dict(self._const_values))
+
+    def restore_state(self, state):
+        """Restore a snapshot taken with **save_state**.
+        """
+        namers, mem, mem_instance, mem_bytes, mem_loads, mem_used, const_values = state
+
+        self._var_name_mappers = dict((name, copy.copy(namer)) for name, namer in namers.items())
+
+        self._mem = copy.copy(mem)
+        self._mem_instance = mem_instance
+
+        self._mem_bytes = dict(mem_bytes)
+        self._mem_loads = dict(mem_loads)
+        self._mem_used = mem_used
+        self._const_values = dict(const_values)
+
     def reset(self):
         """Reset internal state.
         """
@@ -142,8 +324,151 @@ class SmtTranslator(object):
 
         self._var_name_mappers = {}
 
+        self._mem_bytes = {}
+        self._mem_loads = {}
+        self._mem_used = False
+        self._const_values = {}
+
     # Auxiliary functions
     # ======================================================================== #
+    def _translate_sequence(self, instrs):
+        """Translate a sequence of REIL instructions (see
+        **translate_sequence**.)
+
+        """
+        exprs = []
+        accesses = []
+
+        for instr in instrs:
+            if instr.mnemonic == ReilMnemonic.LDM:
+                accesses.append((instr.mnemonic, self.convert_to_bitvec(instr.operands[0])))
+
+            if instr.mnemonic == ReilMnemonic.STM:
+                accesses.append((instr.mnemonic, self.convert_to_bitvec(instr.operands[2])))
+
+            exprs += self.translate(instr)
+
+        return exprs, accesses
+
+    def _get_versions(self):
+        """Return the current version of each variable (and of the
+        memory, under the name 'MEM'.)
+
+        """
+        versions = {}
+
+        for name, namer in self._var_name_mappers.items():
+            versions[name] = int(namer.get_current().rsplit("_", 1)[1])
+
+        versions["MEM"] = self._mem_instance
+
+        return versions
+
+    def _build_template(self, versions, exprs, accesses):
+        """Build a translation template of a sequence of instructions,
+        given the version of each variable before its translation (see
+        **translate_sequence**.) Return None if the translation can not
+        be expressed as a template.
+
+        """
+        declarations = self._solver._declarations
+
+        # Template symbols, as (base name, version offset, size) tuples
+        # (size is None for memory arrays.)
+        symbols = []
+        indexes = {}
+
+        def templatize(match):
+            name = match.group(0)
+
+            if name not in declarations:
+                return name
+
+            if name not in indexes:
+                base, version = name.rsplit("_", 1)
+
+                if base != "MEM" and base not in self._var_name_mappers:
+                    raise ValueError(name)
+
+                offset = int(version) - versions.get(base, 0)
+                size = None if base == "MEM" else declarations[name].size
+
+                indexes[name] = len(symbols)
+                symbols.append((base, offset, size))
+
+            return "{%d}" % indexes[name]
+
+        try:
+            exprs_tmpl = [_token_re.sub(templatize, str(expr)) for expr in exprs]
+            accesses_tmpl = [(mnemonic, _token_re.sub(templatize, str(addr)), addr.size) for mnemonic, addr in accesses]
+        except ValueError:
+            return None
+
+        # Number of new versions of each variable.
+        deltas = {}
+
+        for base, version in self._get_versions().items():
+            if version != versions.get(base, 0):
+                deltas[base] = version - versions.get(base, 0)
+
+        # The translation declares the previous version of the written
+        # registers, even when it does not reference them (e.g. a flag
+        # written into eflags). Keep them, so instantiations declare the
+        # same variables.
+        for base in deltas:
+            name = "%s_%d" % (base, versions.get(base, 0))
+
+            if base != "MEM" and name in declarations and name not in indexes:
+                indexes[name] = len(symbols)
+                symbols.append((base, 0, declarations[name].size))
+
+        return symbols, exprs_tmpl, accesses_tmpl, deltas
+
+    def _instantiate_template(self, template):
+        """Instantiate a translation template for the current version
+        of each variable, and update them accordingly.
+
+        """
+        symbols, exprs_tmpl, accesses_tmpl, deltas = template
+
+        # Register every variable referenced (not only the written ones)
+        # so they are reported by get_init_names.
+        for base, _, _ in symbols:
+            if base != "MEM":
+                self._register_name(base)
+
+        versions = self._get_versions()
+
+        names = []
+
+        for base, offset, size in symbols:
+            name = "%s_%d" % (base, versions.get(base, 0) + offset)
+
+            if size is None:
+                self._solver.mkArray(self._address_size, name)
+            else:
+                self._solver.mkBitVec(size, name)
+
+            names.append(name)
+
+        exprs = [smtlibv2.Bool(tmpl.format(*names)) for tmpl in exprs_tmpl]
+        accesses = [(mnemonic, smtlibv2.BitVec(size, tmpl.format(*names))) for mnemonic, tmpl, size in accesses_tmpl]
+
+        # Update variables versions.
+        for base, delta in deltas.items():
+            if base == "MEM":
+                self._mem_instance += delta
+                self._mem = self._solver.mkArray(self._address_size, "MEM_" + str(self._mem_instance))
+
+                continue
+
+            self._register_name(base)
+
+            for _ in xrange(delta):
+                self._var_name_mappers[base].get_next()
+
+        return exprs, accesses
+
     def _register_name(self, name):
         """Get register name.
         """
@@ -168,6 +493,86 @@ class SmtTranslator(object):
 
         return var_name
 
+    def _get_const_value(self, operand):
+        """Return the value of an operand, if known, or None.
+        """
+        if isinstance(operand, ReilImmediateOperand):
+            return operand.immediate & ((1 << operand.size) - 1)
+
+        if operand.name in self._reg_access_mapper:
+            return None
+
+        return self._const_values.get(self._get_var_name(operand.name), None)
+
+    def _fold_constant(self, instr):
+        """Return the value an instruction writes to its destination
+        operand, if known, or None.
+
+        """
+        oprnd1, oprnd2, oprnd3 = instr.operands
+
+        if not isinstance(oprnd3, ReilRegisterOperand) or \
+            oprnd3.name in self._reg_access_mapper:
+            return None
+
+        if instr.mnemonic == ReilMnemonic.STR:
+            value = self._get_const_value(oprnd1)
+        elif instr.mnemonic in self._const_folders:
+            value1 = self._get_const_value(oprnd1)
+            value2 = self._get_const_value(oprnd2)
+
+            if value1 is None or value2 is None:
+                return None
+
+            value = self._const_folders[instr.mnemonic](value1, value2)
+        else:
+            return None
+
+        if value is None:
+            return None
+
+        return value & ((1 << oprnd3.size) - 1)
+
+    def _get_concrete_address(self, operand):
+        """Return the address an operand refers to if it is concrete
+        (hybrid memory mode), or None.
+
+        """
+        if self._memory_mode != MEMORY_MODE_HYBRID:
+            return None
+
+        return self._get_const_value(operand)
+
+    def _load_memory_byte(self, address):
+        """Return the byte at a concrete address (hybrid memory mode.)
+        """
+        if address in self._mem_bytes:
+            return self._mem_bytes[address]
+
+        if self._mem_used:
+            return self._mem[address]
+
+        if address not in self._mem_loads:
+            var_name = self._get_var_name("MEMB_%x" % address, fresh=True)
+
+            self._mem_loads[address] = self._solver.mkBitVec(8, var_name)
+
+        return self._mem_loads[address]
+
+    def _new_memory_version(self):
+        """Create a new version of the memory array and return the
+        constraint that relates it to the previous one.
+
+        """
+        self._mem_instance += 1
+
+        mem_old = self._mem
+        mem_new = self._solver.mkArray(self._address_size, "MEM_" + str(self._mem_instance))
+
+        self._mem = mem_new
+
+        return mem_new == mem_old
+
     def _translate_src_oprnd(self, operand):
         """Translate source operand to a SMT expression.
         """
@@ -512,6 +917,8 @@ class SmtTranslator(object):
         assert oprnd1.size == self._address_size
         assert oprnd3.size
 
+        address = self._get_concrete_address(oprnd1)
+
         op1_var = self._translate_src_oprnd(oprnd1)
         op3_var, _ = self._translate_dst_oprnd(oprnd3)
 
@@ -520,6 +927,20 @@ class SmtTranslator(object):
 
         exprs = []
 
+        if address is not None:
+            # Hybrid memory mode: concrete address.
+            for i in reversed(xrange(0, size, 8)):
+                addr = (address + i/8) & ((1 << self._address_size) - 1)
+
+                bytes_exprs_1 = self._load_memory_byte(addr)
+                bytes_exprs_2 = smtlibv2.EXTRACT(op3_var, i, 8)
+
+                exprs += [bytes_exprs_1 == bytes_exprs_2]
+
+            return exprs
+
+        exprs += self.flush_memory()
+
         bytes_exprs = []
         bytes_exprs_2 = []
         for i in reversed(xrange(0, size, 8)):
@@ -536,24 +957,30 @@ class SmtTranslator(object):
         assert oprnd1.size and oprnd3.size
         assert oprnd3.size == self._address_size
 
+        address = self._get_concrete_address(oprnd3)
+
         op1_var = self._translate_src_oprnd(oprnd1)
         op3_var = self._translate_src_oprnd(oprnd3)
 
         where = op3_var
         size = oprnd1.size
 
-        for i in xrange(0, size, 8):
-            self._mem[where + i/8] = smtlibv2.EXTRACT(op1_var, i, 8)
+        if address is not None:
+            # Hybrid memory mode: concrete address.
+            for i in xrange(0, size, 8):
+                addr = (address + i/8) & ((1 << self._address_size) - 1)
 
-        # Memory versioning.
-        self._mem_instance += 1
+                self._mem_bytes[addr] = smtlibv2.EXTRACT(op1_var, i, 8)
 
-        mem_old = self._mem
-        mem_new = self._solver.mkArray(self._address_size, "MEM_" + str(self._mem_instance))
+            return []
 
-        self._mem = mem_new
+        exprs = self.flush_memory()
 
-        return [mem_new == mem_old]
+        for i in xrange(0, size, 8):
+            self._mem[where + i/8] = smtlibv2.EXTRACT(op1_var, i, 8)
+
+        # Memory versioning.
+        return exprs + [self._new_memory_version()]
 
     def _translate_str(self, oprnd1, oprnd2, oprnd3):
         """Return a formula representation of a STR instruction.
@@ -1,10 +1,36 @@
 import unittest
 
+from barf.analysis.basicblock.basicblock import BARF_DISASM_RECURSIVE
 from barf.analysis.basicblock.basicblock import BasicBlock
+from barf.analysis.basicblock.basicblock import BasicBlockBuilder
 from barf.analysis.basicblock.basicblock import BasicBlockGraph
+from barf.analysis.basicblock.basicblock import CompactBasicBlockGraph
+from barf.arch import ARCH_X86_MODE_64
+from barf.arch.x86.x86disassembler import X86Disassembler
 from barf.arch.x86.x86parser import X86Parser
 from barf.arch.x86.x86translator import X86Translator
+from barf.core.bi import Memory
 from barf.core.reil import DualInstruction
+from barf.core.reil import ReilMnemonic
+
+class MemoryMock(Memory):
+
+    def __init__(self, base_address, content):
+        super(MemoryMock, self).__init__(self._read_function, \
+            self._write_function)
+
+        self._base_address = base_address
+        self._content = content
+
+    def _read_function(self, address, size):
+        start = address - self._base_address
+        end = (address + size) - self._base_address
+
+        return self._content[start:end]
+
+    def _write_function(self, address, size):
+        pass
+
 
 class BinDiffTests(unittest.TestCase):
 
@@ -41,6 +67,156 @@ class BinDiffTests(unittest.TestCase):
         # It will not assert true. Read comment on BasicBlock.__eq__
         # self.assertTrue(bb1 != bb2)
 
+    def test_build_lazy(self):
+        start_address, end_address = 0x08048000, 0x08048019
+
+        binary  = "\xb8\x01\x00\x00\x00"          # 0x08048000 : mov    eax,0x1
+        binary += "\x83\xfb\x00"                  # 0x08048005 : cmp    ebx,0x0
+        binary += "\x75\x07"                      # 0x08048008 : jne    8048011
+        binary += "\xe8\x0a\x00\x00\x00"          # 0x0804800a : call   8048019
+        binary += "\xeb\x02"                      # 0x0804800f : jmp    8048013
+        binary += "\x01\xc1"                      # 0x08048011 : add    ecx,eax
+        binary += "\x90"                          # 0x08048013 : nop
+        binary += "\x01\xc8"                      # 0x08048014 : add    eax,ecx
+        binary += "\xff\xe0"                      # 0x08048016 : jmp    eax
+        binary += "\xc3"                          # 0x08048018 : ret
+        binary += "\xc3"                          # 0x08048019 : ret
+
+        memory = MemoryMock(start_address, binary)
+
+        bb_builder = BasicBlockBuilder(X86Disassembler(), memory, X86Translator())
+        bb_builder_lazy = BasicBlockBuilder(X86Disassembler(), memory, X86Translator(), lazy=True)
+
+        bbs = bb_builder.build(start_address, end_address)
+        bbs_lazy = bb_builder_lazy.build(start_address, end_address)
+
+        def get_structure(bbs):
+            return [(bb.address, bb.end_address, sorted(bb.branches)) for bb in bbs]
+
+        self.assertEqual(get_structure(bbs_lazy), get_structure(bbs))
+
+        # The blocks are translated to REIL on demand.
+        dinstr = bbs_lazy[0].instrs[-1]
+
+        self.assertEqual(dinstr._ir_instrs, None)
+        self.assertEqual(dinstr.ir_instrs[-1].mnemonic, ReilMnemonic.JCC)
+
+    def test_add_edge(self):
+        start_address, end_address = 0x08048000, 0x08048011
+
+        binary  = "\xb8\x01\x00\x00\x00"          # 0x08048000 : mov    eax,0x1
+        binary += "\x01\xc1"                      # 0x08048005 : add    ecx,eax
+        binary += "\x83\xf9\x10"                  # 0x08048007 : cmp    ecx,0x10
+        binary += "\x75\xf9"                      # 0x0804800a : jne    8048005
+        binary += "\xff\xe0"                      # 0x0804800c : jmp    eax
+        binary += "\x42"                          # 0x0804800e : inc    edx
+        binary += "\xeb\xf6"                      # 0x0804800f : jmp    8048007
+        binary += "\xc3"                          # 0x08048011 : ret
+
+        memory = MemoryMock(start_address, binary)
+
+        bb_builder = BasicBlockBuilder(X86Disassembler(), memory, X86Translator())
+
+        bbs = bb_builder.build(start_address, end_address, BARF_DISASM_RECURSIVE)
+        bb_graph = BasicBlockGraph(bbs)
+
+        self.assertEqual(sorted(bb.address for bb in bb_graph.basic_blocks),
+            [0x08048000, 0x08048005, 0x0804800c])
+
+        # Resolve 'jmp eax'. The new code jumps into the middle of the
+        # loop, which gets split.
+        bbs_new = bb_graph.add_edge(0x0804800c, 0x0804800e, bb_builder, end_address)
+
+        self.assertEqual(sorted(bb.address for bb in bbs_new), [0x08048007, 0x0804800e])
+
+        self.assertEqual(sorted(bb.address for bb in bb_graph.basic_blocks),
+            [0x08048000, 0x08048005, 0x08048007, 0x0804800c, 0x0804800e])
+
+        self.assertEqual(bb_graph.get_basic_block(0x08048005).end_address, 0x08048006)
+
+        edges = [
+            (0x08048000, 0x08048005),
+            (0x08048005, 0x08048007),
+            (0x08048007, 0x08048005),
+            (0x08048007, 0x0804800c),
+            (0x0804800c, 0x0804800e),
+            (0x0804800e, 0x08048007),
+        ]
+
+        self.assertEqual(sorted(bb_graph._graph.edges()), edges)
+
+        for bb_src_addr, bb_dst_addr in edges:
+            bb_src = bb_graph.get_basic_block(bb_src_addr)
+
+            self.assertTrue(bb_dst_addr in [addr for addr, _ in bb_src.branches])
+
+    def test_compact_graph(self):
+        start_address, end_address = 0x08048000, 0x08048011
+
+        binary  = "\xb8\x01\x00\x00\x00"          # 0x08048000 : mov    eax,0x1
+        binary += "\x01\xc1"                      # 0x08048005 : add    ecx,eax
+        binary += "\x83\xf9\x10"                  # 0x08048007 : cmp    ecx,0x10
+        binary += "\x75\xf9"                      # 0x0804800a : jne    8048005
+        binary += "\x42"                          # 0x0804800c : inc    edx
+        binary += "\x74\x02"                      # 0x0804800d : je     8048011
+        binary += "\xeb\xf4"                      # 0x0804800f : jmp    8048005
+        binary += "\xc3"                          # 0x08048011 : ret
+
+        memory = MemoryMock(start_address, binary)
+
+        bb_builder = BasicBlockBuilder(X86Disassembler(), memory, X86Translator())
+
+        bbs = bb_builder.build(start_address, end_address)
+
+        bb_graph = BasicBlockGraph(bbs)
+        bb_graph_compact = CompactBasicBlockGraph(bbs)
+
+        for bb in bbs:
+            self.assertEqual(bb_graph_compact.get_successors(bb.address), bb_graph.get_successors(bb.address))
+            self.assertEqual(bb_graph_compact.get_predecessors(bb.address), bb_graph.get_predecessors(bb.address))
+
+            index = bb_graph_compact.get_index(bb.address)
+
+            self.assertEqual(bb_graph_compact.basic_blocks[index], bb)
+            self.assertEqual(bb_graph_compact.get_basic_block(bb.address), bb)
+            self.assertEqual(bb_graph_compact.find_basic_block(bb.end_address), bb)
+
+        self.assertEqual(bb_graph_compact.get_basic_block(0x08048001), None)
+        self.assertEqual(bb_graph_compact.find_basic_block(0x08048012), None)
+
+        paths = bb_graph.all_simple_bb_paths(start_address, 0x08048011)
+        paths_compact = bb_graph_compact.all_simple_bb_paths(start_address, 0x08048011)
+
+        self.assertEqual(sorted(map(lambda path : [bb.address for bb in path], paths_compact)),
+            sorted(map(lambda path : [bb.address for bb in path], paths)))
+
+        self.assertEqual(sorted(bb_graph_compact.to_networkx().edges()),
+            sorted(bb_graph.to_networkx().edges()))
+
+    def test_compact_graph_64_bit_addresses(self):
+        # Usual image base of PE64 binaries.
+        start_address, end_address = 0x140001000, 0x140001005
+
+        binary  = "\x48\xff\xc0"                  # 0x140001000 : inc    rax
+        binary += "\x75\xfb"                      # 0x140001003 : jne    140001000
+        binary += "\xc3"                          # 0x140001005 : ret
+
+        memory = MemoryMock(start_address, binary)
+
+        bb_builder = BasicBlockBuilder(X86Disassembler(ARCH_X86_MODE_64), memory,
+            X86Translator(ARCH_X86_MODE_64))
+
+        bbs = bb_builder.build(start_address, end_address)
+
+        bb_graph_compact = CompactBasicBlockGraph(bbs)
+
+        self.assertEqual(bb_graph_compact.get_index(0x140001005), 1)
+        self.assertEqual(bb_graph_compact.find_basic_block(0x140001003).address, 0x140001000)
+        self.assertEqual(sorted(bb_graph_compact.get_successors(0x140001000)),
+            [(0x140001000, 'taken'), (0x140001005, 'not-taken')])
+        self.assertEqual(bb_graph_compact.get_predecessors(0x140001005),
+            [(0x140001000, 'not-taken')])
+
 
 def main():
     unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+
+from barf.analysis.basicblock import BasicBlockBuilder
+from barf.analysis.callgraph import CallGraphBuilder
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86.x86disassembler import X86Disassembler
+from barf.arch.x86.x86translator import X86Translator
+from barf.core.bi import Memory
+
+class MemoryMock(Memory):
+
+    def __init__(self, base_address, content):
+        super(MemoryMock, self).__init__(self._read_function, \
+            self._write_function)
+
+        self._base_address = base_address
+        self._content = content
+
+    def _read_function(self, address, size):
+        start = address - self._base_address
+        end = (address + size) - self._base_address
+
+        return self._content[start:end]
+
+    def _write_function(self, address, size):
+        pass
+
+
+class CallGraphBuilderTests(unittest.TestCase):
+
+    def setUp(self):
+        self._start_address, self._end_address = 0x08048000, 0x08048024
+
+        binary  = "\x55"                          # 0x08048000 : push   ebp
+        binary += "\x89\xe5"                      # 0x08048001 : mov    ebp,esp
+        binary += "\xe8\x08\x00\x00\x00"          # 0x08048003 : call   8048010
+        binary += "\xe8\x13\x00\x00\x00"          # 0x08048008 : call   8048020
+        binary += "\x5d"                          # 0x0804800d : pop    ebp
+        binary += "\xc3"                          # 0x0804800e : ret
+        binary += "\x90"                          # 0x0804800f : nop
+        binary += "\x31\xc0"                      # 0x08048010 : xor    eax,eax
+        binary += "\x85\xdb"                      # 0x08048012 : test   ebx,ebx
+        binary += "\x74\x01"                      # 0x08048014 : je     8048017
+        binary += "\x40"                          # 0x08048016 : inc    eax
+        binary += "\xc3"                          # 0x08048017 : ret
+        binary += "\x90" * 8                      # 0x08048018 : nop
+        binary += "\x55"                          # 0x08048020 : push   ebp
+        binary += "\x89\xe5"                      # 0x08048021 : mov    ebp,esp
+        binary += "\x5d"                          # 0x08048023 : pop    ebp
+        binary += "\xc3"                          # 0x08048024 : ret
+
+        self._memory = MemoryMock(self._start_address, binary)
+
+        self._bb_builder = BasicBlockBuilder(X86Disassembler(), self._memory, X86Translator())
+
+    def test_find_prologues(self):
+        cg_builder = CallGraphBuilder(self._bb_builder, self._memory, ARCH_X86_MODE_32)
+
+        addrs = cg_builder.find_prologues(self._start_address, self._end_address)
+
+        self.assertEqual(addrs, [0x08048000, 0x08048020])
+
+    def test_get_call_target(self):
+        disassembler = self._bb_builder.disassembler
+
+        direct, _ = disassembler.disassemble(self._memory[0x08048003:0x08048008], 0x08048003)
+        indirect, _ = disassembler.disassemble("\xff\xd0", 0x08048000)          # call eax
+        ret, _ = disassembler.disassemble(self._memory[0x0804800e:0x0804800f], 0x0804800e)
+
+        self.assertEqual(disassembler.get_call_target(direct), 0x08048010)
+        self.assertTrue(disassembler.is_call(indirect))
+        self.assertEqual(disassembler.get_call_target(indirect), None)
+        self.assertFalse(disassembler.is_call(ret))
+
+    def test_build(self):
+        symbols = {0x08048000 : "main"}
+
+        for processes in [1, 2]:
+            cg_builder = CallGraphBuilder(self._bb_builder, self._memory,
+                ARCH_X86_MODE_32, processes=processes)
+
+            call_graph = cg_builder.build(self._start_address, self._end_address,
+                symbols=symbols, prologues=False)
+
+            functions = call_graph.functions
+
+            self.assertEqual([f.address for f in functions], [0x08048000, 0x08048010, 0x08048020])
+            self.assertEqual(functions[0].name, "main")
+
+            callees = call_graph.get_callees(0x08048000)
+
+            self.assertEqual([f.address for f in callees], [0x08048010, 0x08048020])
+            self.assertEqual(call_graph.get_callers(0x08048010), [functions[0]])
+
+            self.assertEqual(len(functions[1].bb_graph.basic_blocks), 3)
+
+    def test_build_lazy(self):
+        symbols = {0x08048000 : "main"}
+
+        results = []
+
+        for processes in [1, 2]:
+            translator = X86Translator()
+
+            bb_builder = BasicBlockBuilder(X86Disassembler(), self._memory, translator, lazy=True)
+
+            cg_builder = CallGraphBuilder(bb_builder, self._memory,
+                ARCH_X86_MODE_32, processes=processes)
+
+            call_graph = cg_builder.build(self._start_address, self._end_address,
+                symbols=symbols, prologues=False)
+
+            ir = []
+
+            for function in call_graph.functions:
+                for bb in sorted(function.bb_graph.basic_blocks, key=lambda bb : bb.address):
+                    for dinstr in bb.instrs:
+                        # Instructions are translated by the builder's
+                        # translator, whatever the number of processes.
+                        self.assertTrue(dinstr.translator is translator)
+
+                        ir += [map(str, dinstr.ir_instrs)]
+
+            results += [ir]
+
+        self.assertEqual(results[0], results[1])
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
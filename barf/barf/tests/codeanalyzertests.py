@@ -4,10 +4,12 @@ import networkx
 from barf.analysis.basicblock.basicblock import BasicBlock
 from barf.analysis.basicblock.basicblock import BasicBlockBuilder
 from barf.analysis.basicblock.basicblock import BasicBlockGraph
+from barf.analysis.basicblock.pathenumerator import PathEnumerator
 from barf.analysis.codeanalyzer.codeanalyzer import CodeAnalyzer
 from barf.analysis.codeanalyzer.codeanalyzer import GenericContext
 from barf.analysis.codeanalyzer.codeanalyzer import GenericFlag
 from barf.analysis.codeanalyzer.codeanalyzer import GenericRegister
+from barf.analysis.codeanalyzer.pathchecker import ParallelPathChecker
 from barf.arch import ARCH_X86_MODE_32
 from barf.arch.x86.x86base import X86ArchitectureInformation
 from barf.arch.x86.x86disassembler import X86Disassembler
@@ -144,6 +146,187 @@ class CodeAnalyzerTests(unittest.TestCase):
                 print ":" * 80
                 print ""
 
+    def test_check_constraints_slicing(self):
+        codeAnalyzer = CodeAnalyzer(self._smt_solver, self._smt_translator, slicing=True)
+
+        eax = self._smt_solver.mkBitVec(32, "eax_0")
+        ebx = self._smt_solver.mkBitVec(32, "ebx_0")
+        ecx = self._smt_solver.mkBitVec(32, "ecx_0")
+
+        codeAnalyzer.set_preconditions([eax == ebx + 1, ecx.ult(0x10)])
+
+        # Only the partition of eax and ebx is relevant to the query.
+        self.assertEqual(codeAnalyzer.check_constraints([ebx == 0x41]), 'sat')
+        self.assertEqual(codeAnalyzer.check_constraints([eax == ebx]), 'unsat')
+
+        # An unsatisfiable independent partition makes every query
+        # unsatisfiable.
+        codeAnalyzer.set_precondition(ecx.ugt(0x10))
+
+        self.assertEqual(codeAnalyzer.check_constraints([ebx == 0x41]), 'unsat')
+
+        # Assertions are sent to the solver when needed as a whole.
+        self.assertEqual(codeAnalyzer.check(), 'unsat')
+
+    def test_explore_paths(self):
+        bin_start_address, bin_end_address = 0x08048000, 0x0804800f
+
+        bb_graph = self._build_branch_graph()
+
+        codeAnalyzer = CodeAnalyzer(self._smt_solver, self._smt_translator)
+
+        paths = []
+
+        for bb_path in codeAnalyzer.explore_paths(bb_graph, bin_start_address, bin_end_address):
+            ebx = self._smt_solver.mkBitVec(32, self._smt_translator.get_curr_name("ebx"))
+
+            self.assertEqual(codeAnalyzer.get_expr_value(ebx), 0x2)
+
+            paths.append([bb.address for bb in bb_path])
+
+        # The path that takes the branch is unsatisfiable.
+        self.assertEqual(paths, [[0x08048000, 0x0804800a, 0x0804800f]])
+
+        # The state previous to the exploration is restored.
+        self.assertEqual(self._smt_translator.get_curr_name("eax"), "eax_0")
+        self.assertEqual(codeAnalyzer.check(), 'sat')
+
+    def test_check_path(self):
+        bin_start_address, bin_end_address = 0x08048000, 0x0804800a
+
+        bb_graph = self._build_cmp_graph()
+
+        codeAnalyzer = CodeAnalyzer(self._smt_solver, self._smt_translator)
+
+        paths = list(bb_graph.all_simple_bb_paths(bin_start_address, bin_end_address))
+
+        self.assertEqual(len(paths), 2)
+
+        # Each path is checked twice (the second time, the translation
+        # of its basic blocks is cached.)
+        for bb_path in paths + paths:
+            is_sat, model = codeAnalyzer.check_path(bb_path, bin_start_address)
+
+            self.assertTrue(is_sat)
+
+            self.assertEqual(sorted(model.keys()), ["ebx", "eflags"])
+
+            if len(bb_path) == 2:
+                # jne taken
+                self.assertNotEqual(model["ebx"], 0x1)
+            else:
+                self.assertEqual(model["ebx"], 0x1)
+
+    def test_check_paths_parallel(self):
+        bin_start_address, bin_end_address = 0x08048000, 0x0804800f
+
+        bb_graph = self._build_branch_graph()
+
+        checker = ParallelPathChecker(self._build_analyzer, processes=2)
+
+        paths = bb_graph.all_simple_bb_paths(bin_start_address, bin_end_address)
+
+        results = {}
+
+        for bb_path, is_sat, model in checker.check_paths(bb_graph, paths, bin_start_address):
+            results[tuple(bb.address for bb in bb_path)] = is_sat
+
+            self.assertEqual(model is not None, is_sat)
+
+        self.assertEqual(results, {
+            (0x08048000, 0x0804800a, 0x0804800f) : True,
+            (0x08048000, 0x0804800f) : False,
+        })
+
+        paths = bb_graph.all_simple_bb_paths(bin_start_address, bin_end_address)
+
+        results = list(checker.check_paths(bb_graph, paths, bin_start_address, stop_on_sat=True))
+
+        self.assertTrue(results[-1][1])
+
+    def test_check_paths_parallel_models(self):
+        bin_start_address, bin_end_address = 0x08048000, 0x0804800a
+
+        bb_graph = self._build_cmp_graph()
+
+        paths = list(bb_graph.all_simple_bb_paths(bin_start_address, bin_end_address))
+
+        # A single worker process checks every path (and reuses its
+        # translation cache.)
+        checker = ParallelPathChecker(self._build_analyzer, processes=1)
+
+        results = {}
+
+        for bb_path, is_sat, model in checker.check_paths(bb_graph, paths + paths, bin_start_address):
+            results.setdefault(tuple(bb.address for bb in bb_path), []).append((is_sat, model))
+
+        codeAnalyzer = self._build_analyzer()
+
+        for bb_path in paths:
+            is_sat, model = codeAnalyzer.check_path(bb_path, bin_start_address)
+
+            for is_sat_parallel, model_parallel in results[tuple(bb.address for bb in bb_path)]:
+                self.assertEqual(is_sat_parallel, is_sat)
+                self.assertEqual(sorted(model_parallel.keys()), sorted(model.keys()))
+                self.assertEqual(model_parallel["ebx"] == 0x1, model["ebx"] == 0x1)
+
+    def test_enumerate_paths_pruned(self):
+        bin_start_address, bin_end_address = 0x08048000, 0x0804800f
+
+        bb_graph = self._build_branch_graph()
+
+        code_analyzer = CodeAnalyzer(self._smt_solver, self._smt_translator)
+
+        def prune(path):
+            is_sat, _ = code_analyzer.check_path(path, bin_start_address)
+
+            return not is_sat
+
+        enumerator = PathEnumerator(bb_graph, prune=prune)
+
+        paths = [[bb.address for bb in path] for path in enumerator.enumerate(bin_start_address, bin_end_address)]
+
+        self.assertEqual(paths, [[0x08048000, 0x0804800a, 0x0804800f]])
+
+    def _build_analyzer(self):
+        smt_solver = SmtSolver()
+        smt_translator = SmtTranslator(smt_solver, self._operand_size)
+        smt_translator.set_reg_access_mapper(self._arch_info.register_access_mapper())
+        smt_translator.set_arch_registers_size(self._arch_info.register_size)
+
+        return CodeAnalyzer(smt_solver, smt_translator)
+
+    def _build_cmp_graph(self):
+        bin_start_address, bin_end_address = 0x08048000, 0x0804800a
+
+        binary  = "\x83\xfb\x01"                  # 0x08048000 : cmp    ebx,0x1
+        binary += "\x75\x05"                      # 0x08048003 : jne    804800a
+        binary += "\xb8\x02\x00\x00\x00"          # 0x08048005 : mov    eax,0x2
+        binary += "\xc3"                          # 0x0804800a : ret
+
+        self._memory.set_base_address(bin_start_address)
+        self._memory.set_content(binary)
+
+        bb_list = self._bb_builder.build(bin_start_address, bin_end_address)
+
+        return BasicBlockGraph(bb_list)
+
+    def _build_branch_graph(self):
+        bin_start_address, bin_end_address = 0x08048000, 0x0804800f
+
+        binary  = "\xb8\x01\x00\x00\x00"          # 0x08048000 : mov    eax,0x1
+        binary += "\x83\xf8\x01"                  # 0x08048005 : cmp    eax,0x1
+        binary += "\x75\x05"                      # 0x08048008 : jne    804800f
+        binary += "\xbb\x02\x00\x00\x00"          # 0x0804800a : mov    ebx,0x2
+        binary += "\xc3"                          # 0x0804800f : ret
+
+        self._memory.set_base_address(bin_start_address)
+        self._memory.set_content(binary)
+
+        bb_list = self._bb_builder.build(bin_start_address, bin_end_address)
+
+        return BasicBlockGraph(bb_list)
+
 def main():
     unittest.main()
 
@@ -0,0 +1,90 @@
+import unittest
+
+from barf.analysis.basicblock import BasicBlockBuilder
+from barf.analysis.basicblock import BasicBlockGraph
+from barf.analysis.dataflow import DataflowSolver
+from barf.analysis.dataflow import LiveVariables
+from barf.analysis.dataflow import ReachingDefinitions
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86.x86base import X86ArchitectureInformation
+from barf.arch.x86.x86disassembler import X86Disassembler
+from barf.arch.x86.x86translator import X86Translator
+from barf.core.bi import Memory
+
+class MemoryMock(Memory):
+
+    def __init__(self, base_address, content):
+        super(MemoryMock, self).__init__(self._read_function, \
+            self._write_function)
+
+        self._base_address = base_address
+        self._content = content
+
+    def _read_function(self, address, size):
+        start = address - self._base_address
+        end = (address + size) - self._base_address
+
+        return self._content[start:end]
+
+    def _write_function(self, address, size):
+        pass
+
+
+class DataflowSolverTests(unittest.TestCase):
+
+    def setUp(self):
+        self._arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+        start_address, end_address = 0x08048000, 0x08048011
+
+        binary  = "\xb8\x01\x00\x00\x00"          # 0x08048000 : mov    eax,0x1
+        binary += "\x83\xfb\x00"                  # 0x08048005 : cmp    ebx,0x0
+        binary += "\x75\x05"                      # 0x08048008 : jne    804800f
+        binary += "\xb8\x02\x00\x00\x00"          # 0x0804800a : mov    eax,0x2
+        binary += "\x01\xc1"                      # 0x0804800f : add    ecx,eax
+        binary += "\xc3"                          # 0x08048011 : ret
+
+        memory = MemoryMock(start_address, binary)
+
+        bb_builder = BasicBlockBuilder(X86Disassembler(), memory, X86Translator())
+
+        self._start_address = start_address
+        self._bb_graph = BasicBlockGraph(bb_builder.build(start_address, end_address))
+        self._solver = DataflowSolver(self._bb_graph)
+
+    def test_live_variables(self):
+        liveness = LiveVariables()
+        liveness.set_reg_access_mapper(self._arch_info.register_access_mapper())
+
+        live_in, live_out = self._solver.solve(liveness, self._start_address)
+
+        live = liveness.get_variables(live_in[self._start_address])
+
+        self.assertTrue("ebx" in live)
+        self.assertTrue("ecx" in live)
+        self.assertFalse("eax" in live)
+
+        self.assertTrue("eax" in liveness.get_variables(live_out[self._start_address]))
+        self.assertFalse("eax" in liveness.get_variables(live_in[0x0804800a]))
+
+    def test_reaching_definitions(self):
+        reaching = ReachingDefinitions()
+        reaching.set_reg_access_mapper(self._arch_info.register_access_mapper())
+
+        defs_in, _ = self._solver.solve(reaching, self._start_address)
+
+        # Both definitions of eax reach the merge point.
+        eax_defs = [(addr, instr) for addr, _, instr in reaching.get_definitions(defs_in[0x0804800f])
+            if instr.operands[2].name == "eax"]
+
+        self.assertEqual(sorted(addr for addr, _ in eax_defs), [0x08048000, 0x0804800a])
+
+        self.assertEqual(reaching.get_definitions(defs_in[self._start_address]), [])
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
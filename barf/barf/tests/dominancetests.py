@@ -0,0 +1,116 @@
+import random
+import unittest
+
+import networkx
+
+from barf.analysis.basicblock import BasicBlock
+from barf.analysis.basicblock import BasicBlockGraph
+from barf.analysis.basicblock import CompactBasicBlockGraph
+from barf.arch.x86.x86parser import X86Parser
+from barf.core.reil import DualInstruction
+
+class DominanceTests(unittest.TestCase):
+
+    def setUp(self):
+        self._parser = X86Parser()
+
+    def test_dominators(self):
+        random.seed(0)
+
+        for _ in xrange(20):
+            bbs = self._build_random_bbs(60)
+
+            for bb_graph in [BasicBlockGraph(bbs), CompactBasicBlockGraph(bbs)]:
+                graph = networkx.DiGraph()
+
+                for bb in bbs:
+                    graph.add_node(bb.address)
+
+                    for addr, _ in bb.branches:
+                        graph.add_edge(bb.address, addr)
+
+                idoms = networkx.immediate_dominators(graph, 0)
+
+                self.assertEqual(bb_graph.get_immediate_dominators(0), idoms)
+                self.assertEqual(bb_graph.get_reverse_postorder(0)[0], 0)
+                self.assertEqual(sorted(bb_graph.get_reverse_postorder(0)), sorted(idoms))
+
+                # Post-dominators are the dominators of the reversed
+                # graph (from a virtual exit.)
+                graph = graph.subgraph(idoms).reverse()
+
+                for addr in idoms:
+                    if not bbs[addr].branches:
+                        graph.add_edge(-1, addr)
+
+                ipdoms = networkx.immediate_dominators(graph, -1)
+
+                del ipdoms[-1]
+
+                for addr in ipdoms:
+                    if ipdoms[addr] == -1:
+                        ipdoms[addr] = None
+
+                self.assertEqual(bb_graph.get_immediate_post_dominators(0), ipdoms)
+
+    def test_loops(self):
+        # 0 -> 1 -> 2 -> 3 -> 4
+        #      ^    ^----'    |
+        #      '--------------'
+        branches = {0 : [1], 1 : [2], 2 : [3], 3 : [2, 4], 4 : [1, 5], 5 : []}
+
+        bb_graph = BasicBlockGraph(self._build_bbs(branches))
+
+        loops = bb_graph.get_loops(0)
+
+        self.assertEqual([loop.header for loop in loops], [1, 2])
+
+        outer, inner = loops
+
+        self.assertEqual(outer.body, set([1, 2, 3, 4]))
+        self.assertEqual(outer.latches, [4])
+        self.assertEqual(outer.parent, None)
+        self.assertEqual(outer.children, [inner])
+
+        self.assertEqual(inner.body, set([2, 3]))
+        self.assertEqual(inner.latches, [3])
+        self.assertEqual(inner.parent, outer)
+        self.assertEqual(inner.depth, 2)
+
+        # Results are cached.
+        self.assertTrue(bb_graph.get_loops(0) is loops)
+
+    def _build_bbs(self, branches):
+        bbs = []
+
+        for addr in sorted(branches):
+            bb = BasicBlock()
+            bb.instrs.append(DualInstruction(addr, self._parser.parse("nop", addr, 1), []))
+
+            if len(branches[addr]) == 1:
+                bb.direct_branch = branches[addr][0]
+
+            if len(branches[addr]) == 2:
+                bb.taken_branch, bb.not_taken_branch = branches[addr]
+
+            bbs.append(bb)
+
+        return bbs
+
+    def _build_random_bbs(self, size):
+        branches = {}
+
+        for addr in xrange(size):
+            count = random.choice([0, 1, 1, 2, 2, 2]) if addr > 0 else 2
+
+            branches[addr] = random.sample(range(1, size), count)
+
+        return self._build_bbs(branches)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import networkx
+
+from StringIO import StringIO
+
+from barf.analysis.basicblock import BasicBlockBuilder
+from barf.analysis.basicblock import BasicBlockGraph
+from barf.analysis.basicblock import CompactBasicBlockGraph
+from barf.analysis.basicblock import DotExporter
+from barf.analysis.basicblock import GraphMLExporter
+from barf.analysis.basicblock import JsonLinesExporter
+from barf.analysis.callgraph import CallGraphBuilder
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86.x86disassembler import X86Disassembler
+from barf.arch.x86.x86translator import X86Translator
+from barf.core.bi import Memory
+
+class MemoryMock(Memory):
+
+    def __init__(self, base_address, content):
+        super(MemoryMock, self).__init__(self._read_function, \
+            self._write_function)
+
+        self._base_address = base_address
+        self._content = content
+
+    def _read_function(self, address, size):
+        start = address - self._base_address
+        end = (address + size) - self._base_address
+
+        return self._content[start:end]
+
+    def _write_function(self, address, size):
+        pass
+
+
+class GraphExporterTests(unittest.TestCase):
+
+    def setUp(self):
+        self._start_address, self._end_address = 0x08048000, 0x08048015
+
+        binary  = "\x55"                          # 0x08048000 : push   ebp
+        binary += "\x89\xe5"                      # 0x08048001 : mov    ebp,esp
+        binary += "\xe8\x0b\x00\x00\x00"          # 0x08048003 : call   8048013
+        binary += "\x83\xf8\x00"                  # 0x08048008 : cmp    eax,0x0
+        binary += "\x75\x01"                      # 0x0804800b : jne    804800e
+        binary += "\x40"                          # 0x0804800d : inc    eax
+        binary += "\x5d"                          # 0x0804800e : pop    ebp
+        binary += "\xc3"                          # 0x0804800f : ret
+        binary += "\x90\x90\x90"                  # 0x08048010 : nop
+        binary += "\x31\xc0"                      # 0x08048013 : xor    eax,eax
+        binary += "\xc3"                          # 0x08048015 : ret
+
+        self._memory = MemoryMock(self._start_address, binary)
+
+        self._bb_builder = BasicBlockBuilder(X86Disassembler(), self._memory, X86Translator())
+
+        self._bb_graph = BasicBlockGraph(self._bb_builder.build(self._start_address, self._end_address))
+
+        self._edges = sorted((bb.address, addr, branch_type)
+            for bb in self._bb_graph.basic_blocks for addr, branch_type in bb.branches)
+
+    def test_jsonl(self):
+        out = StringIO()
+
+        JsonLinesExporter(print_ir=True).export(self._bb_graph, out)
+
+        items = [json.loads(line) for line in out.getvalue().splitlines()]
+
+        nodes = [item for item in items if item["type"] == "node"]
+        edges = [item for item in items if item["type"] == "edge"]
+
+        self.assertEqual(sorted(node["address"] for node in nodes),
+            sorted(bb.address for bb in self._bb_graph.basic_blocks))
+
+        self.assertEqual(sorted((edge["src"], edge["dst"], edge["branch_type"]) for edge in edges), self._edges)
+
+        self.assertTrue(all("ir" in instr for node in nodes for instr in node["instrs"]))
+
+    def test_graphml(self):
+        for bb_graph in [self._bb_graph, CompactBasicBlockGraph(self._bb_graph.basic_blocks)]:
+            out = StringIO()
+
+            GraphMLExporter().export(bb_graph, out)
+
+            graph = networkx.read_graphml(StringIO(out.getvalue()), node_type=int)
+
+            self.assertEqual(sorted(graph.nodes()), sorted(bb.address for bb in self._bb_graph.basic_blocks))
+
+            edges = sorted((src, dst, data["branch_type"]) for src, dst, data in graph.edges(data=True))
+
+            self.assertEqual(edges, self._edges)
+
+    def test_dot(self):
+        out = StringIO()
+
+        DotExporter().export(self._bb_graph, out)
+
+        lines = out.getvalue().splitlines()
+
+        self.assertEqual(lines[0], "digraph G {")
+        self.assertEqual(lines[-1], "}")
+        self.assertEqual(len([line for line in lines if " -> " in line]), len(self._edges))
+
+    def test_save(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            # One file per connected component.
+            self._bb_graph.save(os.path.join(directory, "cfg"))
+
+            self.assertEqual(sorted(os.listdir(directory)), ["cfg_000.dot", "cfg_001.dot"])
+
+            # One file per function.
+            cg_builder = CallGraphBuilder(self._bb_builder, self._memory, ARCH_X86_MODE_32, processes=1)
+
+            call_graph = cg_builder.build(self._start_address, self._end_address, [self._start_address])
+
+            JsonLinesExporter().save_functions(call_graph, os.path.join(directory, "function"))
+
+            self.assertTrue(os.path.exists(os.path.join(directory, "function_08048000.jsonl")))
+            self.assertTrue(os.path.exists(os.path.join(directory, "function_08048013.jsonl")))
+        finally:
+            shutil.rmtree(directory)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
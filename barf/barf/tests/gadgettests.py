@@ -8,6 +8,7 @@ from barf.analysis.gadget.gadgetverifier import GadgetVerifier
 from barf.arch import ARCH_X86_MODE_32
 from barf.arch.x86.x86base import X86ArchitectureInformation
 from barf.arch.x86.x86disassembler import X86Disassembler
+from barf.arch.x86.x86translator import FULL_TRANSLATION
 from barf.arch.x86.x86translator import LITE_TRANSLATION
 from barf.arch.x86.x86translator import X86Translator
 from barf.core.reil import ReilEmptyOperand
@@ -17,6 +18,75 @@ from barf.core.reil import ReilRegisterOperand
 from barf.core.smt.smtlibv2 import Z3Solver as SmtSolver
 from barf.core.smt.smttranslator import SmtTranslator
 
+class GadgetFinderTests(unittest.TestCase):
+
+    def setUp(self):
+        self._binary  = "\x89\xd8"                 # 0x00 : (2) mov eax, ebx
+        self._binary += "\x5b"                     # 0x02 : (1) pop ebx
+        self._binary += "\xc3"                     # 0x03 : (1) ret
+        self._binary += "\x01\xd8"                 # 0x04 : (2) add eax, ebx
+        self._binary += "\x58"                     # 0x06 : (1) pop eax
+        self._binary += "\xc3"                     # 0x07 : (1) ret
+        self._binary += "\x90"                     # 0x08 : (1) nop
+        self._binary += "\x31\xc0"                 # 0x09 : (2) xor eax, eax
+        self._binary += "\xff\xe3"                 # 0x0b : (2) jmp ebx
+
+    def test_find_parallel(self):
+        g_finder = GadgetFinder(X86Disassembler(), self._binary, X86Translator(translation_mode=LITE_TRANSLATION))
+
+        g_candidates = g_finder.find(0x00000000, 0x0000000c)
+
+        # chunks split the gadgets at 0x00, 0x04 and 0x09
+        g_candidates_parallel = g_finder.find(0x00000000, 0x0000000c, processes=2, chunksize=3)
+
+        self.assertTrue(len(g_candidates) > 0)
+
+        self.assertEquals([str(g) for g in g_candidates_parallel], [str(g) for g in g_candidates])
+        self.assertEquals([g.address for g in g_candidates_parallel], [g.address for g in g_candidates])
+
+    def test_find_iter(self):
+        g_finder = GadgetFinder(X86Disassembler(), self._binary, X86Translator(translation_mode=LITE_TRANSLATION))
+
+        g_candidates = g_finder.find(0x00000000, 0x0000000c)
+
+        g_candidates_iter = g_finder.find_iter(0x00000000, 0x0000000c)
+
+        self.assertEquals([str(g) for g in g_candidates_iter], [str(g) for g in g_candidates])
+
+        # every suffix of at least two instructions is a gadget
+        self.assertEquals([[dinstr.address for dinstr in g.instrs] for g in g_candidates], [
+            [0x00, 0x02, 0x03],
+            [0x02, 0x03],
+            [0x04, 0x06, 0x07],
+            [0x06, 0x07],
+            [0x08, 0x09, 0x0b],
+            [0x09, 0x0b],
+        ])
+
+    def test_find_iter_suspended(self):
+        ir_trans = X86Translator(translation_mode=FULL_TRANSLATION)
+
+        g_finder = GadgetFinder(X86Disassembler(), self._binary, ir_trans)
+
+        g_candidates = [str(g) for g in g_finder.find(0x00000000, 0x0000000c)]
+        g_candidates_short = [str(g) for g in g_finder.find(0x00000000, 0x0000000c, instrs_depth=1)]
+
+        g_iter = g_finder.find_iter(0x00000000, 0x0000000c)
+        g_iter_short = g_finder.find_iter(0x00000000, 0x0000000c, instrs_depth=1)
+
+        g_found = [str(next(g_iter))]
+
+        # the translator is not held by a suspended search
+        self.assertEquals(ir_trans.translation_mode, FULL_TRANSLATION)
+
+        # searches do not share state
+        g_found_short = [str(g) for g in g_iter_short]
+        g_found += [str(g) for g in g_iter]
+
+        self.assertEquals(g_found, g_candidates)
+        self.assertEquals(g_found_short, g_candidates_short)
+
+
 class GadgetClassifierTests(unittest.TestCase):
 
     def setUp(self):
@@ -1479,6 +1549,18 @@ class GadgetVerifierTests(unittest.TestCase):
             print "-" * 10
 
 
+class GadgetVerifierSlicingTests(GadgetVerifierTests):
+
+    def setUp(self):
+        # Same tests, with constraint slicing enabled in the code
+        # analyzer.
+        super(GadgetVerifierSlicingTests, self).setUp()
+
+        self._code_analyzer = CodeAnalyzer(self._smt_solver, self._smt_translator, slicing=True)
+
+        self._g_verifier = GadgetVerifier(self._code_analyzer, self._arch_info)
+
+
 def main():
     unittest.main()
 
@@ -0,0 +1,101 @@
+import unittest
+
+from barf.analysis.basicblock import BasicBlock
+from barf.analysis.basicblock import BasicBlockGraph
+from barf.analysis.basicblock import PATH_ORDER_DFS
+from barf.analysis.basicblock import PATH_ORDER_RANDOM
+from barf.analysis.basicblock import PATH_ORDER_SHORTEST
+from barf.analysis.basicblock import PathEnumerator
+from barf.arch.x86.x86parser import X86Parser
+from barf.core.reil import DualInstruction
+
+class PathEnumeratorTests(unittest.TestCase):
+
+    def setUp(self):
+        self._parser = X86Parser()
+
+        # 1 -> 2 -> 4 -> 5 -> 7
+        #  '-> 3 -'  '-> 6 -'
+        #      ^---------'
+        branches = {1 : [2, 3], 2 : [4], 3 : [4], 4 : [5, 6], 5 : [7], 6 : [7, 3], 7 : []}
+
+        self._bb_graph = BasicBlockGraph(self._build_bbs(branches))
+
+    def test_simple_paths(self):
+        simple_paths = self._get_addresses(self._bb_graph.all_simple_bb_paths(1, 7))
+
+        for order in [PATH_ORDER_DFS, PATH_ORDER_SHORTEST, PATH_ORDER_RANDOM]:
+            enumerator = PathEnumerator(self._bb_graph, order=order, seed=0)
+
+            paths = self._get_addresses(enumerator.enumerate(1, 7))
+
+            self.assertEqual(sorted(paths), sorted(simple_paths))
+            self.assertTrue(enumerator.exhausted)
+
+            if order == PATH_ORDER_SHORTEST:
+                self.assertEqual(map(len, paths), sorted(map(len, paths)))
+
+    def test_bounds(self):
+        enumerator = PathEnumerator(self._bb_graph, max_paths=2)
+
+        self.assertEqual(self._get_addresses(enumerator.enumerate(1, 7)), [[1, 2, 4, 5, 7], [1, 2, 4, 6, 7]])
+        self.assertFalse(enumerator.exhausted)
+
+        enumerator = PathEnumerator(self._bb_graph, max_length=4)
+
+        self.assertEqual(self._get_addresses(enumerator.enumerate(1, 7)), [])
+        self.assertFalse(enumerator.exhausted)
+
+        # Go around the loop 3 -> 4 -> 6 -> 3 once more.
+        enumerator = PathEnumerator(self._bb_graph, max_loop_iterations=1, order=PATH_ORDER_SHORTEST)
+
+        paths = self._get_addresses(enumerator.enumerate(3, 7))
+
+        self.assertEqual(paths[:2], [[3, 4, 5, 7], [3, 4, 6, 7]])
+        self.assertTrue([3, 4, 6, 3, 4, 6, 7] in paths)
+        self.assertFalse([3, 4, 6, 3, 4, 6, 3, 4, 5, 7] in paths)
+
+    def test_prune(self):
+        prefixes = []
+
+        def prune(path):
+            prefixes.append([bb.address for bb in path])
+
+            return path[-1].address == 2
+
+        enumerator = PathEnumerator(self._bb_graph, prune=prune)
+
+        paths = self._get_addresses(enumerator.enumerate(1, 7))
+
+        self.assertEqual(sorted(paths), [[1, 3, 4, 5, 7], [1, 3, 4, 6, 7]])
+
+        # Pruned prefixes are not expanded.
+        self.assertEqual([prefix for prefix in prefixes if prefix[:2] == [1, 2]], [[1, 2]])
+
+    def _get_addresses(self, paths):
+        return [[bb.address for bb in path] for path in paths]
+
+    def _build_bbs(self, branches):
+        bbs = []
+
+        for addr in sorted(branches):
+            bb = BasicBlock()
+            bb.instrs.append(DualInstruction(addr, self._parser.parse("nop", addr, 1), []))
+
+            if len(branches[addr]) == 1:
+                bb.direct_branch = branches[addr][0]
+
+            if len(branches[addr]) == 2:
+                bb.taken_branch, bb.not_taken_branch = branches[addr]
+
+            bbs.append(bb)
+
+        return bbs
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,15 @@
 #! /bin/bash
 
 python -m unittest -v basicblocktests
+python -m unittest -v callgraphtests
 python -m unittest -v codeanalyzertests
+python -m unittest -v dataflowtests
+python -m unittest -v dominancetests
+python -m unittest -v exportertests
 python -m unittest -v gadgettests
+python -m unittest -v pathenumeratortests
 python -m unittest -v reiltests
+python -m unittest -v slicertests
 python -m unittest -v smttests
+python -m unittest -v ssatests
 python -m unittest -v x86tests
\ No newline at end of file
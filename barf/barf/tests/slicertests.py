@@ -0,0 +1,69 @@
+import unittest
+
+from barf.analysis.slicer import ReilSlicer
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86.x86base import X86ArchitectureInformation
+from barf.arch.x86.x86parser import X86Parser
+from barf.arch.x86.x86translator import X86Translator
+from barf.core.reil import ReilParser
+
+class ReilSlicerTests(unittest.TestCase):
+
+    def setUp(self):
+        self._arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+        self._asm_parser = X86Parser(ARCH_X86_MODE_32)
+        self._translator = X86Translator()
+        self._reil_parser = ReilParser()
+        self._slicer = ReilSlicer()
+        self._slicer.set_reg_access_mapper(self._arch_info.register_access_mapper())
+
+    def test_slice_registers(self):
+        instrs  = ["str [DWORD eax, EMPTY, DWORD t0]"]
+        instrs += ["str [DWORD ebx, EMPTY, DWORD t1]"]
+        instrs += ["add [DWORD t0, DWORD t1, DWORD t2]"]
+        instrs += ["str [DWORD t2, EMPTY, DWORD ecx]"]
+        instrs += ["str [DWORD t1, EMPTY, DWORD eax]"]
+
+        instrs = self._reil_parser.parse(instrs)
+
+        self.assertEqual(self._slicer.slice(instrs, ["eax"]), [instrs[1], instrs[4]])
+        self.assertEqual(self._slicer.slice(instrs, ["ecx"]), instrs[:4])
+        self.assertEqual(self._slicer.slice(instrs, ["edx"]), [])
+
+    def test_slice_memory(self):
+        instrs  = ["stm [DWORD ebx, EMPTY, DWORD esp]"]
+        instrs += ["ldm [DWORD esp, EMPTY, DWORD t0]"]
+        instrs += ["str [DWORD t0, EMPTY, DWORD eax]"]
+        instrs += ["stm [DWORD ecx, EMPTY, DWORD esp]"]
+
+        instrs = self._reil_parser.parse(instrs)
+
+        self.assertEqual(self._slicer.slice(instrs, ["eax"]), instrs[:3])
+        self.assertEqual(self._slicer.slice(instrs, [], memory=True), [instrs[0], instrs[3]])
+
+    def test_slice_partial_registers(self):
+        asm_instrs  = [self._asm_parser.parse("mov eax, ebx")]
+        asm_instrs += [self._asm_parser.parse("mov al, cl")]
+        asm_instrs += [self._asm_parser.parse("mov edx, esi")]
+
+        reil_instrs = []
+
+        for asm_instr in asm_instrs:
+            reil_instrs += self._translator.translate(asm_instr)
+
+        registers = set()
+
+        for instr in self._slicer.slice(reil_instrs, ["eax"]):
+            registers.update(oprnd.name for oprnd in instr.operands if hasattr(oprnd, "name"))
+
+        self.assertTrue("ebx" in registers)
+        self.assertTrue("cl" in registers)
+        self.assertFalse("esi" in registers)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,16 @@
+import logging
+import select
 import unittest
 
 from barf.core.reil import ReilEmulator
 from barf.core.reil import ReilMnemonic
 from barf.core.reil import ReilParser
+from barf.core.smt.smtcache import SmtQueryCache
 from barf.core.smt.smtlibv2 import BitVec
+from barf.core.smt.smtlibv2 import PortfolioSolver
+from barf.core.smt.smtlibv2 import SolverResult
 from barf.core.smt.smtlibv2 import Z3Solver as SmtSolver
+from barf.core.smt.smttranslator import MEMORY_MODE_HYBRID
 from barf.core.smt.smttranslator import SmtTranslator
 from barf.utils.utils import VariableNamer
 
@@ -346,6 +352,367 @@ class SmtTranslatorTests(unittest.TestCase):
         self.assertEqual(is_sat, True)
 
 
+class SmtTranslatorMemoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self._address_size = 32
+        self._parser = ReilParser()
+        self._solver = SmtSolver()
+        self._translator = SmtTranslator(self._solver, self._address_size)
+        self._translator.set_memory_mode(MEMORY_MODE_HYBRID)
+
+    def test_memory_hybrid(self):
+        instrs = self._parser.parse([
+            "str [0x1000, EMPTY, t0]",
+            "add [t0, 0x4, t1]",
+            "stm [eax, EMPTY, t1]",     # concrete address
+            "ldm [t1, EMPTY, ebx]",     # concrete address
+            "stm [edx, EMPTY, esi]",    # symbolic address
+            "ldm [t1, EMPTY, edi]",     # concrete address
+        ])
+
+        for instr in instrs:
+            for oprnd in instr.operands:
+                if str(oprnd) != "EMPTY":
+                    oprnd.size = 32
+
+        exprs = [self._translator.translate(instr) for instr in instrs]
+
+        # No array theory until the symbolic address is accessed.
+        for expr in sum(exprs[:4], []):
+            self.assertTrue("select" not in str(expr) and "store" not in str(expr))
+
+        for expr in sum(exprs, []):
+            self._solver.add(expr)
+
+        eax = self._solver.mkBitVec(32, "eax_0")
+        esi = self._solver.mkBitVec(32, "esi_0")
+        ebx = self._solver.mkBitVec(32, self._translator.get_curr_name("ebx"))
+        edi = self._solver.mkBitVec(32, self._translator.get_curr_name("edi"))
+
+        self._solver.push()
+        self._solver.add(ebx != eax)
+        self.assertEqual(self._solver.check(), 'unsat')
+        self._solver.pop()
+
+        # The symbolic store may overwrite the concrete location.
+        self._solver.push()
+        self._solver.add(edi != eax)
+        self.assertEqual(self._solver.check(), 'sat')
+        self._solver.add(esi == 0x2000)
+        self.assertEqual(self._solver.check(), 'unsat')
+        self._solver.pop()
+
+
+class SmtTranslatorSequenceTests(unittest.TestCase):
+
+    def setUp(self):
+        self._address_size = 32
+        self._parser = ReilParser()
+
+    def _parse(self, asm=None):
+        instrs = self._parser.parse(asm or [
+            "ldm [esp, EMPTY, t0]",
+            "add [esp, 0x4, t1]",
+            "str [t1, EMPTY, esp]",
+            "xor [t0, eax, t2]",
+            "str [t2, EMPTY, eax]",
+            "stm [eax, EMPTY, esp]",
+        ])
+
+        for instr in instrs:
+            for oprnd in instr.operands:
+                if str(oprnd) != "EMPTY":
+                    oprnd.size = 32
+
+        return instrs
+
+    def test_translate_sequence(self):
+        solver = SmtSolver()
+        translator = SmtTranslator(solver, self._address_size)
+
+        solver_ref = SmtSolver()
+        translator_ref = SmtTranslator(solver_ref, self._address_size)
+
+        for i in xrange(3):
+            exprs, accesses = translator.translate_sequence(self._parse())
+
+            exprs_ref = sum([translator_ref.translate(instr) for instr in self._parse()], [])
+
+            self.assertEqual(map(str, exprs), map(str, exprs_ref))
+            self.assertEqual([str(addr) for _, addr in accesses], ["esp_%d" % i, "esp_%d" % (i + 1)])
+
+            for name in ["esp", "eax", "t0", "t1", "t2"]:
+                self.assertEqual(translator.get_curr_name(name), translator_ref.get_curr_name(name))
+
+            self.assertEqual(str(translator.get_memory().array), str(translator_ref.get_memory().array))
+
+        self.assertEqual(len(translator._sequence_cache), 1)
+
+        # Registers that are only read (ebx) are reported after a cached
+        # translation as well.
+        asm = ["add [ebx, 0x4, t1]", "str [t1, EMPTY, eax]"]
+
+        translator.set_arch_registers_size({"eax" : 32, "ebx" : 32, "esp" : 32})
+
+        for i in xrange(2):
+            translator.reset()
+
+            translator.translate_sequence(self._parse(asm))
+
+            self.assertEqual(sorted(translator.get_init_names().keys()), ["eax", "ebx"])
+            self.assertEqual(translator.get_init_names()["ebx"], "ebx_0")
+
+        self.assertEqual(len(translator._sequence_cache), 2)
+
+
+class SmtSolverTests(unittest.TestCase):
+
+    def setUp(self):
+        self._solver = SmtSolver()
+
+    def test_max_min(self):
+        x = self._solver.mkBitVec(32, "x_0")
+
+        self._solver.add(x.uge(0x10))
+        self._solver.add(x.ule(0x1234))
+        self._solver.add((x & 0x3) == 0x1)
+
+        self.assertEqual(self._solver.max(x), 0x1231)
+        self.assertEqual(self._solver.min(x), 0x11)
+        self.assertEqual(self._solver.minmax(x + 1), (0x12, 0x1232))
+
+    def test_getallvalues(self):
+        x = self._solver.mkBitVec(8, "x_0")
+
+        self._solver.add(x.ult(0x20))
+        self._solver.add((x & 0xf) == 0x5)
+
+        self.assertEqual(sorted(self._solver.getallvalues(x)), [0x05, 0x15])
+
+        # The solver state is restored afterwards.
+        self.assertEqual(self._solver.check(), 'sat')
+
+    def test_getvalues(self):
+        x = self._solver.mkBitVec(32, "x_0")
+        y = self._solver.mkBitVec(32, "y_0")
+
+        self._solver.add(x == 0x12345678)
+        self._solver.add(y == x + 1)
+
+        values = self._solver.getvalues([x, "y_0", x ^ y, 0x10])
+
+        self.assertEqual(values, [0x12345678, 0x12345679, 0x1, 0x10])
+
+
+class SolverCheckTests(unittest.TestCase):
+
+    def setUp(self):
+        self._solver = SmtSolver()
+
+    def _add_factoring_constraints(self):
+        x = self._solver.mkBitVec(128, "x_0")
+        y = self._solver.mkBitVec(128, "y_0")
+
+        self._solver.add(x.ugt(1))
+        self._solver.add(y.ugt(1))
+        self._solver.add(x.ult(1 << 64))
+        self._solver.add(y.ult(1 << 64))
+        self._solver.add(x * y == 1152921504606846883 * 1152921504606846819)
+
+        return x, y
+
+    def test_check_timeout(self):
+        x, _ = self._add_factoring_constraints()
+
+        self.assertEqual(self._solver.check(timeout=0.2), SolverResult.TIMEOUT)
+
+        # The solver is still usable after a timeout.
+        self._solver.push()
+        self._solver.add(x == 1)
+
+        self.assertEqual(self._solver.check(), SolverResult.UNSAT)
+
+        self._solver.pop()
+
+    def test_check_async(self):
+        x, _ = self._add_factoring_constraints()
+
+        query = self._solver.check_async(timeout=0.2)
+
+        self.assertEqual(query.result(), SolverResult.TIMEOUT)
+
+        self._solver.add(x == 1)
+
+        query = self._solver.check_async()
+
+        self.assertEqual(query.result(), SolverResult.UNSAT)
+        self.assertTrue(query.done())
+
+
+class PortfolioSolverTests(unittest.TestCase):
+
+    def setUp(self):
+        self._solver = PortfolioSolver([SmtSolver(), SmtSolver()])
+
+    def _add_factoring_constraints(self, solver):
+        x = solver.mkBitVec(128, "x_0")
+        y = solver.mkBitVec(128, "y_0")
+
+        solver.add(x.ugt(1))
+        solver.add(y.ugt(1))
+        solver.add(x.ult(1 << 64))
+        solver.add(y.ult(1 << 64))
+        solver.add(x * y == 1152921504606846883 * 1152921504606846819)
+
+        return x
+
+    def test_check(self):
+        x = self._solver.mkBitVec(32, "x_0")
+        y = self._solver.mkBitVec(32, "y_0")
+
+        self._solver.add(y == x + 1)
+
+        self._solver.push()
+        self._solver.add(x == y)
+
+        self.assertEqual(self._solver.check(), 'unsat')
+
+        self._solver.pop()
+        self._solver.add(x == 0x41)
+
+        self.assertEqual(self._solver.check(), 'sat')
+        self.assertEqual(self._solver.getvalues([x, y]), [0x41, 0x42])
+
+        self.assertEqual(sum(sum(wins) for wins in self._solver.win_stats.values()), 2)
+
+    def test_check_cancel(self):
+        slow, fast = SmtSolver(), SmtSolver()
+
+        solver = PortfolioSolver([slow, fast])
+
+        x = self._add_factoring_constraints(solver)
+
+        # Only the second backend gets the (trivially unsat) hint.
+        fast.add(x == 1)
+
+        errors = []
+
+        handler = logging.Handler(logging.ERROR)
+        handler.emit = errors.append
+
+        logger = logging.getLogger("smtlibv2")
+        logger.addHandler(handler)
+
+        try:
+            self.assertEqual(solver.check(), SolverResult.UNSAT)
+        finally:
+            logger.removeHandler(handler)
+
+        # The losing backend is cancelled without errors and is usable.
+        self.assertEqual(errors, [])
+        self.assertEqual(solver.win_stats.values(), [[0, 1]])
+
+        slow.push()
+        slow.add(x == 2)
+
+        self.assertEqual(slow.check(), SolverResult.UNSAT)
+
+        slow.pop()
+
+    def test_check_async(self):
+        x = self._add_factoring_constraints(self._solver)
+
+        query = self._solver.check_async(timeout=0.2)
+
+        # Wait for the answer as an event loop would.
+        while not query.done():
+            select.select(query.filenos(), [], [], 0.05)
+
+        self.assertEqual(query.result(), SolverResult.TIMEOUT)
+        self.assertEqual(query.filenos(), [])
+
+        self._solver.push()
+        self._solver.add(x == 3)
+
+        query = self._solver.check_async()
+
+        self.assertEqual(query.result(), SolverResult.UNSAT)
+        self.assertEqual(sum(sum(wins) for wins in self._solver.win_stats.values()), 1)
+
+        self._solver.pop()
+
+        # A cancelled query leaves the backends usable.
+        query = self._solver.check_async()
+        query.cancel()
+
+        self.assertEqual(query.result(), SolverResult.UNKNOWN)
+
+        self._solver.add(x == 1)
+
+        self.assertEqual(self._solver.check(), SolverResult.UNSAT)
+
+    def test_restart(self):
+        solver = SmtSolver()
+
+        x = solver.mkBitVec(32, "x_0")
+
+        solver.add(x.ult(0x10))
+        solver.push()
+        solver.add(x == 0x20)
+
+        # The pushed level is replayed into the new process.
+        solver.restart()
+
+        self.assertEqual(solver.check(), 'unsat')
+
+        solver.pop()
+
+        self.assertEqual(solver.check(), 'sat')
+
+
+class SmtQueryCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self._cache = SmtQueryCache()
+
+    def test_alpha_renamed_query(self):
+        results = []
+
+        # Same formula, different variable versions.
+        for name_x, name_y in [("eax_1", "ebx_0"), ("eax_5", "ebx_3")]:
+            solver = SmtSolver()
+            solver.set_query_cache(self._cache)
+
+            x = solver.mkBitVec(32, name_x)
+            y = solver.mkBitVec(32, name_y)
+
+            solver.add(x + y == 10)
+            solver.add(x == 3)
+
+            results += [(solver.check(), solver.getvaluebyname(name_y), solver.getvalue(x + 1))]
+
+        self.assertEqual(results[0], ('sat', 7, 4))
+        self.assertEqual(results[1], ('sat', 7, 4))
+        self.assertEqual(self._cache.misses, 1)
+        self.assertEqual(self._cache.hits, 1)
+
+    def test_unsat_query(self):
+        solver = SmtSolver()
+        solver.set_query_cache(self._cache)
+
+        x = solver.mkBitVec(32, "eax_0")
+
+        solver.add(x == 3)
+
+        solver.push()
+        solver.add(x == 4)
+        self.assertEqual(solver.check(), 'unsat')
+        solver.pop()
+
+        self.assertEqual(solver.check(), 'sat')
+
+
 def main():
     unittest.main()
 
@@ -0,0 +1,101 @@
+import unittest
+
+from barf.analysis.basicblock import BasicBlockBuilder
+from barf.analysis.basicblock import BasicBlockGraph
+from barf.analysis.ssa import SsaBuilder
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86.x86base import X86ArchitectureInformation
+from barf.arch.x86.x86disassembler import X86Disassembler
+from barf.arch.x86.x86parser import X86Parser
+from barf.arch.x86.x86translator import X86Translator
+from barf.core.bi import Memory
+from barf.core.reil import ReilMnemonic
+
+class MemoryMock(Memory):
+
+    def __init__(self, base_address, content):
+        super(MemoryMock, self).__init__(self._read_function, \
+            self._write_function)
+
+        self._base_address = base_address
+        self._content = content
+
+    def _read_function(self, address, size):
+        start = address - self._base_address
+        end = (address + size) - self._base_address
+
+        return self._content[start:end]
+
+    def _write_function(self, address, size):
+        pass
+
+
+class SsaBuilderTests(unittest.TestCase):
+
+    def setUp(self):
+        self._arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+        self._asm_parser = X86Parser(ARCH_X86_MODE_32)
+        self._translator = X86Translator()
+        self._ssa_builder = SsaBuilder()
+        self._ssa_builder.set_reg_access_mapper(self._arch_info.register_access_mapper())
+
+    def test_build_sequence(self):
+        asm_instrs  = [self._asm_parser.parse("mov eax, ebx")]
+        asm_instrs += [self._asm_parser.parse("mov al, cl")]
+
+        reil_instrs = []
+
+        for asm_instr in asm_instrs:
+            reil_instrs += self._translator.translate(asm_instr)
+
+        ssa = self._ssa_builder.build_sequence(reil_instrs)
+
+        # The write to 'al' defines a new version of 'eax' that uses
+        # the previous one.
+        instr = ssa.get_definition("eax_2")
+
+        self.assertTrue("eax_1" in instr.uses)
+        self.assertEqual(ssa.get_uses("eax_1"), [instr])
+        self.assertEqual(ssa.get_definition("ebx_0"), None)
+
+    def test_build(self):
+        start_address, end_address = 0x08048000, 0x08048011
+
+        binary  = "\xb8\x01\x00\x00\x00"          # 0x08048000 : mov    eax,0x1
+        binary += "\x83\xfb\x00"                  # 0x08048005 : cmp    ebx,0x0
+        binary += "\x75\x05"                      # 0x08048008 : jne    804800f
+        binary += "\xb8\x02\x00\x00\x00"          # 0x0804800a : mov    eax,0x2
+        binary += "\x01\xc1"                      # 0x0804800f : add    ecx,eax
+        binary += "\xc3"                          # 0x08048011 : ret
+
+        memory = MemoryMock(start_address, binary)
+
+        bb_builder = BasicBlockBuilder(X86Disassembler(), memory, self._translator)
+
+        bb_graph = BasicBlockGraph(bb_builder.build(start_address, end_address))
+
+        ssa = self._ssa_builder.build(bb_graph, start_address)
+
+        block = ssa.get_block(0x0804800f)
+
+        phis = [phi for phi in block.phis if phi.name == "eax"]
+
+        self.assertEqual(len(phis), 1)
+        self.assertEqual(sorted(phis[0].sources.keys()), [0x08048000, 0x0804800a])
+
+        # Each source of the phi node is defined in its predecessor.
+        for addr, name in phis[0].sources.items():
+            self.assertTrue(ssa.get_definition(name) in ssa.get_block(addr).instrs)
+
+        # The addition uses the value merged by the phi node.
+        add_instrs = [instr for instr in block.instrs if instr.instr.mnemonic == ReilMnemonic.ADD]
+
+        self.assertTrue(phis[0].defs[0] in add_instrs[0].uses)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
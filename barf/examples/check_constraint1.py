@@ -47,7 +47,7 @@ if __name__ == "__main__":
         for reil_instr in reil_instrs:
             print("{0:14}{1}".format("", reil_instr))
 
-            barf.code_analyzer.add_instruction(reil_instr)
+        barf.code_analyzer.add_instructions(reil_instrs)
 
     # Get smt expressions and set pre and post conditions
     print("[+] Adding pre and post conditions to the analyzer...")
@@ -75,10 +75,7 @@ if __name__ == "__main__":
         print("    SAT! :: Possible assigments : ")
 
         # Get concrete value for expressions
-        eax_val = barf.code_analyzer.get_expr_value(eax)
-        a_val = barf.code_analyzer.get_expr_value(a)
-        b_val = barf.code_analyzer.get_expr_value(b)
-        c_val = barf.code_analyzer.get_expr_value(c)
+        eax_val, a_val, b_val, c_val = barf.code_analyzer.get_expr_values([eax, a, b, c])
 
         # Print values
         print("    eax : 0x{0:08x} ({0})".format(eax_val))
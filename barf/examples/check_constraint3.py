@@ -71,13 +71,8 @@ if __name__ == "__main__":
             cookie2 = barf.code_analyzer.get_memory_expr(ebp-0x8, 4)
             cookie3 = barf.code_analyzer.get_memory_expr(ebp-0x4, 4)
 
-            esp_val = barf.code_analyzer.get_expr_value(esp)
-            ebp_val = barf.code_analyzer.get_expr_value(ebp)
-
-            rv_val = barf.code_analyzer.get_expr_value(rv)
-            cookie1_val = barf.code_analyzer.get_expr_value(cookie1)
-            cookie2_val = barf.code_analyzer.get_expr_value(cookie2)
-            cookie3_val = barf.code_analyzer.get_expr_value(cookie3)
+            esp_val, ebp_val, rv_val, cookie1_val, cookie2_val, cookie3_val = \
+                barf.code_analyzer.get_expr_values([esp, ebp, rv, cookie1, cookie2, cookie3])
 
             print("      esp: 0x{0:08x}".format(esp_val))
             print("      ebp: 0x{0:08x}".format(ebp_val))
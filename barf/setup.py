@@ -11,7 +11,6 @@ setup(
         'networkx',
         'pefile',
         'pybfd',
-        'pydot',
         'pygments',
         'pyparsing',
         'sphinx',